@@ -0,0 +1,148 @@
+"""
+Connection Burst Benchmark
+
+A burst of leechers connects to one seeder at the same moment; each opens
+a keep-alive session, switches to binary frames and fetches a few pieces
+with a small pipeline window. Runs the thread-per-connection PeerServer
+and the asyncio AsyncPeerServer on the same file.
+
+Reports wall time for the whole burst, time to first piece per leecher
+(median and p99), failed sessions and the seeder's peak thread count.
+
+Usage:
+    python benchmarks/bench_async_server.py [leechers] [pieces_each] [piece_kb]
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.storage import SingleFileStorage
+from shared.frames import BinaryFrames, CAPABILITY_BINARY, FRAME_HEADER
+from peer_client import PeerServer, AsyncPeerServer, TransferStats
+
+FILE_ID = "burst00000000000"
+WINDOW = 4
+CLIENT_PROCESSES = 4
+
+
+async def _leech(port: int, first: int, pieces: int, num_pieces: int, results: list):
+    """One leecher session: a JSON request, then pipelined binary requests."""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        request = json.dumps({"type": "CHUNK_REQUEST", "file_id": FILE_ID, "chunk_index": first,
+                              "keep_alive": True, "capabilities": [CAPABILITY_BINARY]}).encode()
+        writer.write(len(request).to_bytes(8, "big") + request)
+        header = await reader.readexactly(8)
+        response = json.loads(await reader.readexactly(int.from_bytes(header, "big")))
+        await reader.readexactly(response["chunk_size"])
+        first_piece = time.perf_counter() - start
+        
+        indexes = [(first + i) % num_pieces for i in range(1, pieces)]
+        for i in indexes[:WINDOW]:
+            writer.write(BinaryFrames.request(FILE_ID, i))
+        for n in range(len(indexes)):
+            frame = BinaryFrames.decode(await reader.readexactly(FRAME_HEADER.size))
+            await reader.readexactly(frame["chunk_size"])
+            if n + WINDOW < len(indexes):
+                writer.write(BinaryFrames.request(FILE_ID, indexes[n + WINDOW]))
+        writer.close()
+        results.append(first_piece)
+    except Exception:
+        results.append(None)
+
+
+def _client(port: int, leechers: int, offset: int, pieces: int, num_pieces: int, barrier, queue):
+    """Client process: run its share of the leechers concurrently."""
+    async def main():
+        results = []
+        barrier.wait()
+        await asyncio.gather(*(_leech(port, (offset + i) % num_pieces, pieces, num_pieces, results)
+                               for i in range(leechers)))
+        return results
+    queue.put(asyncio.run(main()))
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(server_class, path: str, size: int, piece_length: int, leechers: int, pieces: int):
+    port = _free_port()
+    server = server_class(port, tempfile.mkdtemp(), TransferStats())
+    storage = SingleFileStorage(path, piece_length, size)
+    server.register_storage(FILE_ID, storage)
+    server.start()
+    time.sleep(0.3)
+    
+    peak_threads = [threading.active_count()]
+    sampling = threading.Event()
+    
+    def sample():
+        while not sampling.is_set():
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+            time.sleep(0.005)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    
+    barrier = multiprocessing.Barrier(CLIENT_PROCESSES + 1)
+    queue = multiprocessing.Queue()
+    share = leechers // CLIENT_PROCESSES
+    processes = [multiprocessing.Process(target=_client, args=(port, share, i * share, pieces,
+                                                                 storage.num_pieces, barrier, queue))
+                 for i in range(CLIENT_PROCESSES)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    results = [r for _ in processes for r in queue.get()]
+    wall = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    sampling.set()
+    sampler.join()
+    server.stop()
+    
+    latencies = sorted(r for r in results if r is not None)
+    failed = len(results) - len(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    served = len(latencies) * pieces * piece_length / (1024 * 1024)
+    print(f"{server_class.__name__:>15}: {wall:6.2f} s   {served / wall:7.1f} MB/s   "
+          f"first piece p50 {p50:7.1f} ms  p99 {p99:7.1f} ms   "
+          f"failed {failed}   peak threads {peak_threads[0]}")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    leechers = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    pieces = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    piece_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    piece_length = piece_kb * 1024
+    size = 256 * piece_length
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        print(f"{leechers} leechers x {pieces} pieces of {piece_kb} KB, window {WINDOW}")
+        run(PeerServer, path, size, piece_length, leechers, pieces)
+        run(AsyncPeerServer, path, size, piece_length, leechers, pieces)
+    finally:
+        os.remove(path)
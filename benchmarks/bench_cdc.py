@@ -0,0 +1,62 @@
+"""
+Content-Defined Chunking Benchmark
+
+Builds manifests for a file and for an edited copy (bytes inserted near
+the start and a range deleted in the middle), with fixed-size and
+content-defined pieces. Reports how many pieces of the new version a
+peer holding the old one already has, and manifest build throughput.
+
+Usage:
+    python benchmarks/bench_cdc.py [size_mb] [piece_kb]
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from shared.manifest import ManifestUtils
+from shared.chunking import CHUNKING_FIXED, CHUNKING_CDC
+
+
+def run(chunking: str, old_path: str, new_path: str, piece_length: int, size: int):
+    start = time.perf_counter()
+    old = ManifestUtils.build_manifest(old_path, piece_length, chunking=chunking)
+    elapsed = time.perf_counter() - start
+    new = ManifestUtils.build_manifest(new_path, piece_length, chunking=chunking)
+    
+    held = set(old["piece_hashes"])
+    reused = {i for i, digest in enumerate(new["piece_hashes"]) if digest in held}
+    offsets = new.get("piece_offsets") or [i * piece_length for i in range(new["num_pieces"])]
+    ends = offsets[1:] + [new["total_size"]]
+    fetched = sum(end - start for i, (start, end) in enumerate(zip(offsets, ends)) if i not in reused)
+    print(f"{chunking:>6}: {len(reused):4d}/{new['num_pieces']} pieces reused   "
+          f"{fetched / (1024 * 1024):6.1f} MB to fetch   "
+          f"manifest built at {size / (1024 * 1024) / elapsed:6.1f} MB/s")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    piece_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    size = size_mb * 1024 * 1024
+    
+    data = os.urandom(size)
+    middle = size // 2
+    edited = data[:4096] + b"new header line\n" + data[4096:middle] + data[middle + 10000:]
+    paths = []
+    for content in (data, edited):
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(content)
+            paths.append(tmp.name)
+    try:
+        print(f"{size_mb} MB, {piece_kb} KB pieces; v2 inserts 16 bytes at 4 KB and deletes 10000 bytes mid-file")
+        for chunking in (CHUNKING_FIXED, CHUNKING_CDC):
+            run(chunking, paths[0], paths[1], piece_kb * 1024, size)
+    finally:
+        for path in paths:
+            os.remove(path)
@@ -0,0 +1,114 @@
+"""
+Piece Compression Benchmark
+
+Downloads a compressible (CSV log lines) and an incompressible (random)
+file from one PeerServer over loopback, with sessions that do and don't
+offer the "zlib" capability. Each compressed run is repeated to show the
+cost once compressed pieces are cached.
+
+Reports loopback throughput, bytes on the wire and the time the wire
+bytes alone would take on a 100 Mbit/s link.
+
+Usage:
+    python benchmarks/bench_compression.py [size_mb] [piece_kb]
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage
+from shared.frames import CAPABILITY_BINARY
+from shared.compression import CAPABILITY_ZLIB
+from peer_client import PeerServer, TransferStats
+
+WINDOW = 8
+LINK_BYTES_PER_SEC = 100 * 1000 * 1000 / 8
+
+
+def csv_corpus(size: int) -> bytes:
+    """Log-style CSV lines."""
+    rng = random.Random(1)
+    lines = []
+    total = 0
+    while total < size:
+        line = (f"2026-10-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+                f"{rng.randint(0, 59):02d},{rng.choice(['GET', 'POST', 'PUT'])},"
+                f"/api/v1/items/{rng.randint(1, 99999)},{rng.randint(200, 504)},{rng.random() * 1000:.3f}\n")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def download(port: int, file_id: str, num_pieces: int, capabilities):
+    """Fetch every piece once; returns (seconds, wire bytes, raw bytes)."""
+    pool = SessionPool(timeout=30.0, window=WINDOW, capabilities=capabilities)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WINDOW) as executor:
+        results = list(executor.map(
+            lambda index: pool.request_piece("127.0.0.1", port, file_id, index),
+            range(num_pieces)))
+    elapsed = time.perf_counter() - start
+    pool.close_all()
+    
+    assert all(data for data, _ in results)
+    wire = sum(response["chunk_size"] for _, response in results)
+    raw = sum(len(data) for data, _ in results)
+    return elapsed, wire, raw
+
+
+def run(label: str, data: bytes, piece_length: int):
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(data)
+        path = tmp.name
+    try:
+        port = _free_port()
+        server = PeerServer(port, tempfile.mkdtemp(), TransferStats())
+        storage = SingleFileStorage(path, piece_length, len(data))
+        file_id = (label * 16)[:16]
+        server.register_storage(file_id, storage)
+        server.start()
+        time.sleep(0.3)
+        
+        runs = (("raw", [CAPABILITY_BINARY]),
+                ("zlib", [CAPABILITY_BINARY, CAPABILITY_ZLIB]),
+                ("zlib cached", [CAPABILITY_BINARY, CAPABILITY_ZLIB]))
+        for name, capabilities in runs:
+            elapsed, wire, raw = download(port, file_id, storage.num_pieces, capabilities)
+            print(f"{label:>7} {name:>11}: {raw / elapsed / (1024 * 1024):7.1f} MB/s loopback   "
+                  f"{wire / (1024 * 1024):6.1f} MB on the wire ({raw / wire:4.2f}x)   "
+                  f"{wire / LINK_BYTES_PER_SEC:5.2f} s at 100 Mbit/s")
+        stats = server.compressor.get_stats()
+        print(f"{'':>7} compressor: {stats['compressed']} pieces compressed, {stats['skipped']} sent raw")
+        server.stop()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    piece_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    size = size_mb * 1024 * 1024
+    
+    print(f"{size_mb} MB in {piece_kb} KB pieces, window {WINDOW}")
+    run("csv", csv_corpus(size), piece_kb * 1024)
+    run("random", os.urandom(size), piece_kb * 1024)
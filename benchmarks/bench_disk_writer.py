@@ -0,0 +1,100 @@
+"""
+Download Disk Writer Benchmark
+
+Feeds received pieces (arriving slightly out of order, as parallel
+downloads do) to a preallocated target file in two ways:
+
+- inline:  the consumer thread calls write_piece for each piece, as
+           _download_file used to
+- writer:  pieces are handed to a DiskWriter
+
+Every write call pays a fixed extra latency standing in for a slow disk.
+Reports elapsed time, write calls and the writer's queue metrics.
+
+Usage:
+    python benchmarks/bench_disk_writer.py [size_mb] [piece_kb] [write_latency_ms]
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from shared.storage import SingleFileStorage
+from shared.diskio import DiskWriter
+
+
+class SlowStorage(SingleFileStorage):
+    """SingleFileStorage with a fixed delay per write call."""
+    
+    def __init__(self, *args, latency: float = 0.0):
+        super().__init__(*args)
+        self.latency = latency
+        self.write_calls = 0
+    
+    def write_piece(self, index, data):
+        self.write_calls += 1
+        time.sleep(self.latency)
+        return super().write_piece(index, data)
+    
+    def write_pieces(self, first_index, pieces):
+        self.write_calls += 1
+        time.sleep(self.latency)
+        return super().write_pieces(first_index, pieces)
+
+
+def arrival_order(num_pieces: int, window: int = 16):
+    """Ascending order with pieces shuffled within a sliding window."""
+    order = []
+    for start in range(0, num_pieces, window):
+        block = list(range(start, min(start + window, num_pieces)))
+        random.shuffle(block)
+        order.extend(block)
+    return order
+
+
+def run(label: str, size: int, piece_length: int, latency: float, payload: bytes):
+    path = tempfile.mktemp()
+    target = SlowStorage(path, piece_length, size, latency=latency)
+    target.preallocate()
+    order = arrival_order(target.num_pieces)
+    
+    start = time.perf_counter()
+    if label == "inline":
+        for index in order:
+            target.write_piece(index, payload[:target.piece_size(index)])
+        metrics = ""
+    else:
+        writer = DiskWriter(target)
+        for index in order:
+            writer.submit(index, payload[:target.piece_size(index)])
+        assert writer.flush() == []
+        writer.close()
+        stats = writer.get_stats()
+        metrics = (f"   avg write {stats['avg_write_ms']:.1f} ms, peak queue {stats['peak_depth']} pieces, "
+                   f"{stats['blocked_submits']} submits blocked")
+    elapsed = time.perf_counter() - start
+    target.close()
+    os.remove(path)
+    
+    print(f"{label:>6}: {size / (1024 * 1024) / elapsed:7.1f} MB/s   "
+          f"{target.write_calls} write calls for {target.num_pieces} pieces{metrics}")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    piece_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+    size = size_mb * 1024 * 1024
+    piece_length = piece_kb * 1024
+    payload = os.urandom(piece_length)
+    
+    print(f"{size_mb} MB in {piece_kb} KB pieces, +{latency_ms:g} ms per write call")
+    for label in ("inline", "writer"):
+        run(label, size, piece_length, latency_ms / 1000, payload)
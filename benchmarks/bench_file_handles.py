@@ -0,0 +1,95 @@
+"""
+Upload File Handle Benchmark
+
+Downloads small pieces from several shared files over loopback with the
+piece cache disabled (every piece goes out via sendfile), once with a
+file handle cache that keeps nothing open (one open/close per piece, the
+old behaviour) and once with the default cache. Reports pieces/s, server
+CPU per piece and open() calls.
+
+Usage:
+    python benchmarks/bench_file_handles.py [files] [size_mb_per_file] [piece_kb]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage, FileHandleCache, MAX_OPEN_FILES
+from shared.cache import PieceCache, ReadAhead
+from peer_client import PeerServer, TransferStats
+
+WINDOW = 8
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(paths, size: int, piece_length: int, max_open: int):
+    port = _free_port()
+    server = PeerServer(port, tempfile.mkdtemp(), TransferStats())
+    server.piece_cache = PieceCache(0)
+    server.read_ahead = ReadAhead(server.piece_cache, 0)
+    server.file_handles = FileHandleCache(max_open)
+    storages = {}
+    for i, path in enumerate(paths):
+        file_id = f"bench{i:011d}"
+        storages[file_id] = SingleFileStorage(path, piece_length, size)
+        server.register_storage(file_id, storages[file_id])
+    server.start()
+    time.sleep(0.3)
+    
+    # Interleave files so every request switches to another file
+    requests = [(file_id, index) for index in range(size // piece_length) for file_id in storages]
+    pool = SessionPool(timeout=30.0, window=WINDOW)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WINDOW) as executor:
+        for data, _ in executor.map(
+                lambda request: pool.request_piece("127.0.0.1", port, *request), requests):
+            assert data
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    pool.close_all()
+    server.stop()
+    
+    stats = server.file_handles.get_stats()
+    label = f"max_open {max_open}"
+    print(f"{label:>12}: {len(requests) / wall:8.0f} pieces/s   "
+          f"{cpu / len(requests) * 1e6:6.1f} us CPU per piece (client + server)   "
+          f"{stats['opens']} opens for {len(requests)} pieces")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    size_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    piece_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    size = size_mb * 1024 * 1024
+    
+    paths = []
+    for _ in range(files):
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(os.urandom(size))
+            paths.append(tmp.name)
+    try:
+        print(f"{files} files x {size_mb} MB in {piece_kb} KB pieces, window {WINDOW}")
+        run(paths, size, piece_kb * 1024, 0)
+        run(paths, size, piece_kb * 1024, MAX_OPEN_FILES)
+    finally:
+        for path in paths:
+            os.remove(path)
@@ -0,0 +1,112 @@
+"""
+Control Header Framing Benchmark
+
+Compares JSON and binary piece-transfer headers:
+
+1. Header round trip over a socketpair (request + response header, no payload)
+2. Loopback download of small pieces through a pipelined session
+
+Usage:
+    python benchmarks/bench_framing.py [iterations] [piece_kb] [size_mb]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.utils import SocketUtils, MessageBuilder
+from shared.frames import BinaryFrames, CAPABILITY_BINARY
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage
+from peer_client import PeerServer, TransferStats
+
+FILE_ID = "bench0000000000c"
+WINDOW = 8
+
+
+def header_round_trips(iterations: int):
+    """Time request/response header exchanges without any piece payload."""
+    a, b = socket.socketpair()
+    
+    def json_round_trip(i):
+        SocketUtils.send_message(a, MessageBuilder.chunk_request_message(FILE_ID, i, keep_alive=True))
+        request = SocketUtils.receive_message(b)
+        SocketUtils.send_message(b, MessageBuilder.chunk_response_message(
+            FILE_ID, request["chunk_index"], 262144, keep_alive=True))
+        SocketUtils.receive_message(a)
+    
+    def binary_round_trip(i):
+        BinaryFrames.send_frame(a, BinaryFrames.request(FILE_ID, i))
+        request = BinaryFrames.receive_frame(b)
+        BinaryFrames.send_frame(b, BinaryFrames.piece_header(FILE_ID, request["chunk_index"], 262144))
+        BinaryFrames.receive_frame(a)
+    
+    for label, round_trip in (("json", json_round_trip), ("binary", binary_round_trip)):
+        cpu_start = time.process_time()
+        for i in range(iterations):
+            round_trip(i)
+        cpu = time.process_time() - cpu_start
+        print(f"{label:>6} headers: {cpu / iterations * 1e6:6.1f} us CPU per piece exchange")
+    a.close()
+    b.close()
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def small_piece_download(piece_length: int, size: int):
+    """Download every piece over loopback with JSON and with binary sessions."""
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        port = _free_port()
+        server = PeerServer(port, tempfile.mkdtemp(), TransferStats())
+        storage = SingleFileStorage(path, piece_length, size)
+        server.register_storage(FILE_ID, storage)
+        server.start()
+        time.sleep(0.3)
+        
+        for label, capabilities in (("json", []), ("binary", [CAPABILITY_BINARY])):
+            pool = SessionPool(timeout=10.0, window=WINDOW, capabilities=capabilities)
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=WINDOW) as executor:
+                results = list(executor.map(
+                    lambda index: pool.request_piece("127.0.0.1", port, FILE_ID, index),
+                    range(storage.num_pieces)
+                ))
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            pool.close_all()
+            
+            assert sum(len(data) for data, _ in results if data) == size
+            print(f"{label:>6} session: {storage.num_pieces / wall:8.0f} pieces/s   "
+                  f"{cpu / storage.num_pieces * 1e6:6.1f} us CPU per piece (client + server)")
+        server.stop()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    piece_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    size_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    
+    header_round_trips(iterations)
+    print(f"{size_mb} MB in {piece_kb} KB pieces, window {WINDOW}")
+    small_piece_download(piece_kb * 1024, size_mb * 1024 * 1024)
@@ -0,0 +1,133 @@
+"""
+Request Pipelining Benchmark
+
+Downloads every piece of a temporary file through a proxy that adds a fixed
+round-trip latency, using one persistent session per run with different
+outstanding-request windows.
+
+Usage:
+    python benchmarks/bench_pipeline.py [size_mb] [rtt_ms] [window ...]
+"""
+
+import os
+import sys
+import time
+import queue
+import socket
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage
+from peer_client import PeerServer, TransferStats
+
+PIECE_LENGTH = 262144
+FILE_ID = "bench0000000000b"
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _delayed_pipe(src: socket.socket, dst: socket.socket, delay: float):
+    """Forward src -> dst, delivering every byte `delay` seconds after it arrived."""
+    backlog = queue.Queue()
+    
+    def reader():
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                data = b''
+            backlog.put((time.perf_counter() + delay, data))
+            if not data:
+                return
+    
+    def writer():
+        while True:
+            due, data = backlog.get()
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                if not data:
+                    dst.shutdown(socket.SHUT_WR)
+                    return
+                dst.sendall(data)
+            except OSError:
+                return
+    
+    threading.Thread(target=reader, daemon=True).start()
+    threading.Thread(target=writer, daemon=True).start()
+
+
+def start_latency_proxy(upstream_port: int, rtt: float) -> int:
+    """Listen on a free port and relay connections upstream with rtt/2 each way."""
+    port = _free_port()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", port))
+    listener.listen(16)
+    
+    def accept_loop():
+        while True:
+            client, _ = listener.accept()
+            upstream = socket.create_connection(("127.0.0.1", upstream_port))
+            _delayed_pipe(client, upstream, rtt / 2)
+            _delayed_pipe(upstream, client, rtt / 2)
+    
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return port
+
+
+def run(port: int, num_pieces: int, size: int, window: int):
+    pool = SessionPool(timeout=30.0, window=window)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=window) as executor:
+        results = list(executor.map(
+            lambda index: pool.request_piece("127.0.0.1", port, FILE_ID, index),
+            range(num_pieces)
+        ))
+    elapsed = time.perf_counter() - start
+    pool.close_all()
+    
+    received = sum(len(data) for data, _ in results if data)
+    assert received == size, f"received {received} of {size} bytes"
+    print(f"window {window:>2}: {elapsed:6.2f} s   {size / elapsed / (1024 * 1024):7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    windows = [int(w) for w in sys.argv[3:]] or [1, 4, 8, 16]
+    size = size_mb * 1024 * 1024
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        server_port = _free_port()
+        server = PeerServer(server_port, tempfile.mkdtemp(), TransferStats())
+        storage = SingleFileStorage(path, PIECE_LENGTH, size)
+        server.register_storage(FILE_ID, storage)
+        server.start()
+        time.sleep(0.3)
+        
+        proxy_port = start_latency_proxy(server_port, rtt_ms / 1000.0)
+        print(f"{size_mb} MB in {storage.num_pieces} pieces, {rtt_ms:.0f} ms RTT")
+        for window in windows:
+            run(proxy_port, storage.num_pieces, size, window)
+        server.stop()
+    finally:
+        os.remove(path)
@@ -0,0 +1,110 @@
+"""
+Seeding Read-Ahead Benchmark
+
+One leecher downloads a file in ascending piece order (as _download_file
+does) from a PeerServer that adds a fixed latency to every piece read,
+whether loaded into memory or streamed with sendfile, standing in for a
+cold disk. Runs with read-ahead off and on and
+reports throughput and how many requests were served from prefetched
+pieces.
+
+Usage:
+    python benchmarks/bench_readahead.py [size_mb] [read_latency_ms] [depth]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage
+from shared.cache import PieceCache, ReadAhead
+from peer_client import PeerServer, TransferStats
+
+PIECE_LENGTH = 262144
+FILE_ID = "bench0000000000e"
+WINDOW = 8
+CACHE_BYTES = 64 * 1024 * 1024
+
+
+class SlowStorage(SingleFileStorage):
+    """SingleFileStorage with a fixed delay per piece read."""
+    
+    def __init__(self, *args, latency: float = 0.0):
+        super().__init__(*args)
+        self.latency = latency
+    
+    def read_piece(self, index: int, handles=None):
+        time.sleep(self.latency)
+        return super().read_piece(index, handles)
+
+
+class SlowPeerServer(PeerServer):
+    """PeerServer whose pieces streamed from disk pay the storage's latency too."""
+    
+    def _send_extents(self, client_socket, extents) -> bool:
+        time.sleep(self.latency)
+        return super()._send_extents(client_socket, extents)
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(path: str, size: int, latency: float, depth: int):
+    port = _free_port()
+    server = SlowPeerServer(port, tempfile.mkdtemp(), TransferStats())
+    server.latency = latency
+    server.piece_cache = PieceCache(CACHE_BYTES)
+    server.read_ahead = ReadAhead(server.piece_cache, depth)
+    storage = SlowStorage(path, PIECE_LENGTH, size, latency=latency)
+    server.register_storage(FILE_ID, storage)
+    server.start()
+    time.sleep(0.3)
+    
+    pool = SessionPool(timeout=30.0, window=WINDOW)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WINDOW) as executor:
+        for data, _ in executor.map(
+                lambda index: pool.request_piece("127.0.0.1", port, FILE_ID, index),
+                range(storage.num_pieces)):
+            assert data
+    wall = time.perf_counter() - start
+    pool.close_all()
+    server.stop()
+    
+    cache = server.piece_cache.get_stats()
+    label = f"read-ahead {depth}" if depth else "no read-ahead"
+    print(f"{label:>14}: {size / (1024 * 1024) / wall:7.1f} MB/s   "
+          f"{cache['prefetch_hits']}/{storage.num_pieces} requests served from prefetched pieces   "
+          f"{cache['coalesced']} waited on an in-flight prefetch")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    depth = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    size = size_mb * 1024 * 1024
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        print(f"{size_mb} MB in {PIECE_LENGTH // 1024} KB pieces, {latency_ms:g} ms per piece read, window {WINDOW}")
+        run(path, size, latency_ms / 1000, 0)
+        run(path, size, latency_ms / 1000, depth)
+    finally:
+        os.remove(path)
@@ -0,0 +1,116 @@
+"""
+Piece Receive Benchmark
+
+Streams pieces from another process over loopback and receives them with:
+
+- concat:  the old 4 KB recv() loop building the piece with data += chunk
+- recv_into: SocketUtils.receive_chunk_data into a fresh bytearray
+- pooled:  SocketUtils.receive_chunk_data into BufferPool buffers
+
+Reports throughput, recv calls per piece and piece-buffer allocations.
+
+Usage:
+    python benchmarks/bench_receive.py [size_mb] [piece_kb]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tracemalloc
+import multiprocessing
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from shared.utils import SocketUtils
+from shared.buffers import BufferPool
+
+LEGACY_BUFFER_SIZE = 4096
+
+
+class CountingSocket:
+    """Socket wrapper counting receive calls."""
+    
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.calls = 0
+    
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+    
+    def recv(self, size):
+        self.calls += 1
+        return self.sock.recv(size)
+    
+    def recv_into(self, view):
+        self.calls += 1
+        return self.sock.recv_into(view)
+
+
+def legacy_receive(sock, size: int) -> bytes:
+    """The receive loop SocketUtils.receive_chunk_data used to run."""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(min(LEGACY_BUFFER_SIZE, size - len(data)))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _send_pieces(port: int, num_pieces: int, piece_length: int):
+    payload = os.urandom(piece_length)
+    sock = socket.create_connection(("127.0.0.1", port))
+    for _ in range(num_pieces):
+        sock.sendall(payload)
+    sock.close()
+
+
+def run(label: str, num_pieces: int, piece_length: int):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    sender = multiprocessing.Process(target=_send_pieces, args=(port, num_pieces, piece_length))
+    sender.start()
+    conn, _ = listener.accept()
+    sock = CountingSocket(conn)
+    pool = BufferPool()
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(num_pieces):
+        if label == "concat":
+            piece = legacy_receive(sock, piece_length)
+        elif label == "recv_into":
+            piece = SocketUtils.receive_chunk_data(sock, piece_length, timeout=10.0)
+        else:
+            piece = SocketUtils.receive_chunk_data(sock, piece_length, timeout=10.0, pool=pool)
+            pool.release(piece)
+        assert piece is not None and len(piece) == piece_length
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    sender.join()
+    conn.close()
+    listener.close()
+    
+    size_mb = num_pieces * piece_length / (1024 * 1024)
+    allocations = pool.get_stats()["allocations"] if label == "pooled" else num_pieces
+    print(f"{label:>9}: {size_mb / elapsed:8.1f} MB/s   {sock.calls / num_pieces:6.1f} recv calls/piece   "
+          f"{allocations:5d} piece buffers allocated   peak {peak / 1024:8.0f} KB traced")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    piece_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    piece_length = piece_kb * 1024
+    num_pieces = size_mb * 1024 // piece_kb
+    
+    print(f"{num_pieces} pieces of {piece_kb} KB")
+    for label in ("concat", "recv_into", "pooled"):
+        run(label, num_pieces, piece_length)
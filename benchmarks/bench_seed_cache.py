@@ -0,0 +1,114 @@
+"""
+Seeding Fan-out Benchmark
+
+Several leecher processes download the same new file from one PeerServer
+at the same time, with the piece cache disabled and enabled. Reports
+throughput, file reads per served MB and cache counters.
+
+File bytes read are taken from rchar in /proc/self/io (Linux), which
+counts read() and sendfile() alike.
+
+Usage:
+    python benchmarks/bench_seed_cache.py [size_mb] [leechers] [cache_mb]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage
+from shared.cache import PieceCache
+from peer_client import PeerServer, TransferStats
+
+PIECE_LENGTH = 262144
+FILE_ID = "bench0000000000d"
+WINDOW = 8
+
+
+def _leech(port: int, num_pieces: int):
+    """Leecher process: fetch every piece in ascending order, like _download_file."""
+    logging.getLogger().setLevel(logging.ERROR)
+    pool = SessionPool(timeout=30.0, window=WINDOW)
+    with ThreadPoolExecutor(max_workers=WINDOW) as executor:
+        for data, _ in executor.map(
+                lambda index: pool.request_piece("127.0.0.1", port, FILE_ID, index),
+                range(num_pieces)):
+            assert data
+    pool.close_all()
+
+
+def _read_bytes() -> int:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(path: str, size: int, leechers: int, cache_bytes: int):
+    port = _free_port()
+    server = PeerServer(port, tempfile.mkdtemp(), TransferStats())
+    server.piece_cache = PieceCache(cache_bytes)
+    storage = SingleFileStorage(path, PIECE_LENGTH, size)
+    server.register_storage(FILE_ID, storage)
+    server.start()
+    time.sleep(0.3)
+    
+    processes = [multiprocessing.Process(target=_leech, args=(port, storage.num_pieces))
+                 for _ in range(leechers)]
+    read_start = _read_bytes()
+    wall_start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    wall = time.perf_counter() - wall_start
+    file_reads = _read_bytes() - read_start
+    server.stop()
+    
+    served_mb = size * leechers / (1024 * 1024)
+    cache = server.piece_cache.get_stats()
+    label = f"cache {cache_bytes // (1024 * 1024)} MB" if cache_bytes else "no cache"
+    print(f"{label:>12}: {served_mb / wall:7.1f} MB/s served   "
+          f"{file_reads / (1024 * 1024) / served_mb:5.2f} MB read per MB served   "
+          f"hits {cache['hits']}  misses {cache['misses']}  coalesced {cache['coalesced']}  "
+          f"disk reads {cache['disk_reads']}")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    leechers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    cache_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    size = size_mb * 1024 * 1024
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        print(f"{leechers} leechers x {size_mb} MB")
+        run(path, size, leechers, 0)
+        run(path, size, leechers, cache_mb * 1024 * 1024)
+    finally:
+        os.remove(path)
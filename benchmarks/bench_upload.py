@@ -0,0 +1,87 @@
+"""
+Upload Path Benchmark
+
+Serves a temporary file from PeerServer and measures upload throughput and
+server CPU time per MB served, with os.sendfile enabled and disabled.
+
+Usage:
+    python benchmarks/bench_upload.py [size_mb] [rounds]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+import multiprocessing
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.utils import SocketUtils, MessageBuilder
+from shared.storage import SingleFileStorage
+from peer_client import PeerServer, TransferStats
+
+PIECE_LENGTH = 262144
+FILE_ID = "bench0000000000a"
+
+
+def _fetch_all(port: int, num_pieces: int, rounds: int):
+    """Client process: request every piece, one connection per piece."""
+    for _ in range(rounds):
+        for index in range(num_pieces):
+            sock = SocketUtils.connect_to_server("127.0.0.1", port)
+            SocketUtils.send_message(sock, MessageBuilder.chunk_request_message(FILE_ID, index))
+            response = SocketUtils.receive_message(sock, timeout=10.0)
+            SocketUtils.receive_chunk_data(sock, response["chunk_size"], timeout=10.0)
+            sock.close()
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(path: str, size: int, rounds: int, use_sendfile: bool):
+    port = _free_port()
+    server = PeerServer(port, tempfile.mkdtemp(), TransferStats())
+    server.use_sendfile = use_sendfile
+    storage = SingleFileStorage(path, PIECE_LENGTH, size)
+    server.register_storage(FILE_ID, storage)
+    server.start()
+    time.sleep(0.3)
+
+    client = multiprocessing.Process(target=_fetch_all, args=(port, storage.num_pieces, rounds))
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    client.start()
+    client.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    server.stop()
+
+    served_mb = size * rounds / (1024 * 1024)
+    label = "sendfile" if use_sendfile else "buffered"
+    print(f"{label:>9}: {served_mb / wall:8.1f} MB/s   {cpu / served_mb * 1000:6.2f} ms CPU per MB served")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    size = size_mb * 1024 * 1024
+
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        run(path, size, rounds, use_sendfile=False)
+        if hasattr(os, "sendfile"):
+            run(path, size, rounds, use_sendfile=True)
+    finally:
+        os.remove(path)
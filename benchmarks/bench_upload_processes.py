@@ -0,0 +1,100 @@
+"""
+Upload Process Scaling Benchmark
+
+Leecher processes download the same file from one seeder running 1, 2,
+4, ... upload processes on one port, using small pieces so the seeder's
+per-request work (framing, cache lookups, copies) is the bottleneck.
+
+Reports seeder throughput per process count and the uploads recorded in
+the parent's TransferStats (forwarded from workers).
+
+Usage:
+    python benchmarks/bench_upload_processes.py [size_mb] [leechers] [max_processes]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+import peer_client
+from shared.session import SessionPool
+from shared.storage import SingleFileStorage
+from peer_client import AsyncPeerServer, TransferStats
+
+PIECE_LENGTH = 16384
+FILE_ID = "procs00000000000"
+WINDOW = 8
+
+
+def _leech(port: int, num_pieces: int):
+    """Leecher process: fetch every piece once."""
+    logging.getLogger().setLevel(logging.ERROR)
+    pool = SessionPool(timeout=60.0, window=WINDOW)
+    with ThreadPoolExecutor(max_workers=WINDOW) as executor:
+        for data, _ in executor.map(
+                lambda index: pool.request_piece("127.0.0.1", port, FILE_ID, index),
+                range(num_pieces)):
+            assert data
+    pool.close_all()
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run(path: str, size: int, leechers: int, processes: int):
+    port = _free_port()
+    stats = TransferStats()
+    server = AsyncPeerServer(port, tempfile.mkdtemp(), stats, processes=processes)
+    storage = SingleFileStorage(path, PIECE_LENGTH, size)
+    server.register_storage(FILE_ID, storage)
+    server.start()
+    time.sleep(1.0 + processes * 0.5)  # Let spawned workers import and bind
+    
+    clients = [multiprocessing.Process(target=_leech, args=(port, storage.num_pieces))
+               for _ in range(leechers)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    wall = time.perf_counter() - start
+    time.sleep(peer_client.STATS_FLUSH_INTERVAL * 2)
+    server.stop()
+    
+    served_mb = size * leechers / (1024 * 1024)
+    print(f"{processes:>2} processes: {served_mb / wall:7.1f} MB/s served   "
+          f"{stats.upload_bytes / (1024 * 1024):7.1f} MB recorded in TransferStats")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    leechers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    max_processes = int(sys.argv[3]) if len(sys.argv) > 3 else max(2, os.cpu_count() or 1)
+    size = size_mb * 1024 * 1024
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(size))
+        path = tmp.name
+    try:
+        print(f"{leechers} leechers x {size_mb} MB, {os.cpu_count()} CPUs")
+        processes = 1
+        while processes <= max_processes:
+            run(path, size, leechers, processes)
+            processes *= 2
+    finally:
+        os.remove(path)
@@ -0,0 +1,132 @@
+"""
+Upload Slot Fairness Benchmark
+
+Several leechers, each on its own loopback address (127.0.0.N), download
+from one seeder for a fixed time. One of them is aggressive: it runs many
+sessions at once, the others run one each. Choked leechers wait before
+asking again, as PeerClient does.
+
+Runs with no slot limit, then with upload slots under each policy, and
+reports each leecher's share of the bytes served plus Jain's fairness
+index over the modest leechers and the aggressive one (1.0 = equal
+shares). Needs Linux, where the whole 127/8 block is local.
+
+Usage:
+    python benchmarks/bench_upload_slots.py [seconds] [leechers] [slots]
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "peer"))
+
+from shared.utils import SocketUtils
+from shared.frames import BinaryFrames, CAPABILITY_BINARY
+from shared.storage import SingleFileStorage
+from shared.choking import UploadScheduler, POLICY_ROUND_ROBIN, POLICY_RECIPROCATION
+from peer_client import AsyncPeerServer, TransferStats
+
+PIECE_LENGTH = 65536
+NUM_PIECES = 256
+FILE_ID = "slots00000000000"
+AGGRESSIVE_SESSIONS = 16
+RECHOKE_INTERVAL = 1.0
+OPTIMISTIC_INTERVAL = 3.0
+CHOKED_WAIT = 0.2
+
+
+def _session(port: int, address: str, deadline: float, received):
+    """One session: request pieces in turn until the deadline, backing off when choked."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((address, 0))
+    sock.connect(("127.0.0.1", port))
+    SocketUtils.send_message(sock, {"type": "CHUNK_REQUEST", "file_id": FILE_ID, "chunk_index": 0,
+                                    "keep_alive": True, "capabilities": [CAPABILITY_BINARY]})
+    response = SocketUtils.receive_message(sock, timeout=10.0)
+    SocketUtils.receive_chunk_data(sock, response["chunk_size"], timeout=10.0)
+    index = 0
+    while time.time() < deadline:
+        index = (index + 1) % NUM_PIECES
+        sock.sendall(BinaryFrames.request(FILE_ID, index))
+        frame = BinaryFrames.receive_frame(sock, timeout=10.0)
+        if frame["status"] == "choked":
+            time.sleep(CHOKED_WAIT)
+            continue
+        SocketUtils.receive_chunk_data(sock, frame["chunk_size"], timeout=10.0)
+        with received.get_lock():
+            received.value += frame["chunk_size"]
+    sock.close()
+
+
+def _leecher(port: int, address: str, sessions: int, deadline: float, received):
+    """Leecher process running its sessions on threads."""
+    threads = [threading.Thread(target=_session, args=(port, address, deadline, received))
+               for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _jain(values) -> float:
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values)) if any(values) else 0.0
+
+
+def run(label: str, path: str, seconds: float, leechers: int, slots: int, policy: str):
+    port = _free_port()
+    server = AsyncPeerServer(port, tempfile.mkdtemp(), TransferStats())
+    server.scheduler = UploadScheduler(slots, policy, rechoke_interval=RECHOKE_INTERVAL,
+                                       optimistic_interval=OPTIMISTIC_INTERVAL)
+    server.register_storage(FILE_ID, SingleFileStorage(path, PIECE_LENGTH, PIECE_LENGTH * NUM_PIECES))
+    server.start()
+    
+    deadline = time.time() + seconds
+    counters = [multiprocessing.Value("q", 0) for _ in range(leechers)]
+    processes = [multiprocessing.Process(target=_leecher, args=(
+                     port, f"127.0.0.{i + 2}", AGGRESSIVE_SESSIONS if i == 0 else 1, deadline, counters[i]))
+                 for i in range(leechers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    server.stop()
+    
+    totals = [counter.value for counter in counters]
+    shares = "  ".join(f"{total * 100 / max(1, sum(totals)):5.1f}%" for total in totals)
+    print(f"{label:>24}: {sum(totals) / seconds / (1024 * 1024):7.1f} MB/s   "
+          f"shares (aggressive first) {shares}   fairness {_jain(totals):.2f}")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    leechers = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    slots = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(os.urandom(PIECE_LENGTH * NUM_PIECES))
+        path = tmp.name
+    try:
+        print(f"{leechers} leechers ({AGGRESSIVE_SESSIONS} sessions for the first), {seconds:.0f} s, "
+              f"rechoke every {RECHOKE_INTERVAL:.0f} s")
+        run("no slot limit", path, seconds, leechers, 0, POLICY_ROUND_ROBIN)
+        run(f"{slots} slots, round robin", path, seconds, leechers, slots, POLICY_ROUND_ROBIN)
+        run(f"{slots} slots, reciprocation", path, seconds, leechers, slots, POLICY_RECIPROCATION)
+    finally:
+        os.remove(path)
@@ -11,23 +11,39 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
 import socket
+import select
 import json
 import os
 import logging
 import sys
-import hashlib
 import uuid
 import time
+import secrets
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Optional, List
-from collections import defaultdict
+from collections import defaultdict, deque
 import pickle
+import queue
+import multiprocessing
 
 # Add shared module to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from shared.utils import SocketUtils, MessageBuilder, FileUtils
-from shared.chunking import FileChunker
+from shared.utils import SocketUtils, MessageBuilder, FileUtils, SEND_BLOCK_SIZE, MAX_MESSAGE_SIZE
+from shared.chunking import FileChunker, CHUNKING_FIXED, CHUNKING_CDC
+from shared.storage import (PieceStorage, SingleFileStorage, MultiFileStorage, ChunkDirectoryStorage,
+                            FileHandleCache, positional_read, MAX_OPEN_FILES)
+from shared.manifest import ManifestUtils, MerkleTree
+from shared.session import SessionPool, SESSION_IDLE_TIMEOUT
+from shared.frames import BinaryFrames, CAPABILITY_BINARY, FRAME_HEADER
+from shared.buffers import BufferPool
+from shared.cache import PieceCache, ReadAhead, READ_AHEAD_PIECES
+from shared.diskio import DiskWriter, DISK_WRITER_THREADS, DISK_QUEUE_BYTES
+from shared.piece_store import PieceStore
+from shared.compression import PieceCompressor, CAPABILITY_ZLIB, COMPRESSION_ZLIB
+from shared.choking import UploadScheduler, POLICY_ROUND_ROBIN
 from peer_identity import PeerIdentity
 from state_manager import StateManager
 
@@ -49,9 +65,28 @@ TRACKER_HOST = '192.168.0.202'#'192.168.10.82'
 TRACKER_PORT = 5000
 PEER_PORT_START = 6000  # Starting port for peer clients
 PEER_PORT_END = 6100    # Ending port range
-CHUNK_SIZE = 262144  # 256 KB
+CHUNK_SIZE = 262144  # 256 KB; default piece size when a sharer doesn't advertise one
 DOWNLOAD_TIMEOUT = 10.0
-MAX_PARALLEL_DOWNLOADS = 5  # Maximum parallel chunk downloads
+MAX_PARALLEL_DOWNLOADS = 5  # Minimum parallel chunk downloads
+PIPELINE_WINDOW = 8  # Outstanding piece requests per peer connection
+MAX_DOWNLOAD_WORKERS = 64  # Cap on parallel chunk downloads across all peers
+USE_MERKLE_FILE_IDS = False  # Derive file IDs from a Merkle root over piece digests
+USE_CONTENT_DEFINED_CHUNKING = False  # Rolling-hash piece boundaries, so new versions of a file reuse unchanged pieces
+USE_MMAP_RECEIVE = False  # Receive pieces straight into a memory-mapped output file (unverified bytes land in the file before their check)
+PIECE_CACHE_BYTES = 64 * 1024 * 1024  # Memory for pieces served more than once, up to 1/8 of it each (0 = always sendfile)
+AUTO_FETCH_UPDATES = False  # Download new versions of seeded files without asking first
+UPDATE_RETRY_INTERVAL = 300  # Seconds before retrying a failed update download
+USE_COMPRESSION = True  # Negotiate zlib-compressed pieces with peers that support it
+COMPRESSED_CACHE_BYTES = 32 * 1024 * 1024  # Memory for compressed forms of served pieces
+USE_ASYNC_SERVER = True  # Serve all upload connections on one asyncio event loop
+LISTEN_BACKLOG = 1024  # Pending connections the upload server's socket accepts
+UPLOAD_READ_WORKERS = 16  # Threads loading pieces for the asyncio upload server
+UPLOAD_PROCESSES = 1  # Processes serving uploads on the peer port (caches are per process)
+STATS_FLUSH_INTERVAL = 0.5  # Seconds between upload stats batches sent by worker processes
+UPLOAD_SLOTS = 0  # Peers uploaded to at once per upload process; others get a "choked" response (0 = no limit)
+UPLOAD_POLICY = POLICY_ROUND_ROBIN  # How upload slots are handed out (or POLICY_RECIPROCATION from shared.choking)
+CHOKED_RETRY_DELAY = 2.0  # Seconds before asking again when every peer with a piece is choking us
+CHOKED_RETRY_LIMIT = 30  # Times to ask again before the piece fails
 
 # Setup logging
 logging.basicConfig(
@@ -61,6 +96,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def estimate_file_size(total_size: Optional[int], num_chunks: int,
+                       piece_length: Optional[int] = None) -> int:
+    """Real file size when known, otherwise an upper bound from the piece count."""
+    if total_size:
+        return total_size
+    return num_chunks * (piece_length or CHUNK_SIZE)
+
+
 def find_available_port(start_port=PEER_PORT_START, end_port=PEER_PORT_END):
     """Find an available port.
     
@@ -101,6 +144,7 @@ class TransferStats:
         self.transfers: Dict[str, Dict] = {}  # peer_id -> transfer info
         self.upload_bytes = 0
         self.download_bytes = 0
+        self.peer_download_bytes = defaultdict(int)  # peer host -> bytes downloaded from it
         self.upload_start_time = time.time()
         self.download_start_time = time.time()
     
@@ -122,6 +166,7 @@ class TransferStats:
         """Record downloaded bytes."""
         with self.lock:
             self.download_bytes += bytes_count
+            self.peer_download_bytes[peer_addr.rsplit(":", 1)[0]] += bytes_count
             key = f"download_{peer_addr}_{file_id}_{chunk_idx}"
             self.transfers[key] = {
                 "type": "download",
@@ -132,6 +177,11 @@ class TransferStats:
                 "time": datetime.now().isoformat()
             }
     
+    def downloaded_from(self, peer_host: str) -> int:
+        """Get total bytes downloaded from a peer's host."""
+        with self.lock:
+            return self.peer_download_bytes.get(peer_host, 0)
+    
     def get_upload_speed(self) -> float:
         """Get current upload speed in KB/s."""
         with self.lock:
@@ -158,27 +208,133 @@ class TransferStats:
 class PeerServer:
     """Server component of peer that serves chunks to other peers."""
     
-    def __init__(self, port: int, chunks_directory: str, stats: TransferStats):
+    def __init__(self, port: int, chunks_directory: str, stats: TransferStats,
+                 processes: int = 1, listen_socket: Optional[socket.socket] = None,
+                 reuse_port: bool = False):
+        """
+        Initialize the server.
+        
+        Args:
+            port: Port to accept piece requests on
+            chunks_directory: Directory of legacy per-chunk files
+            stats: Where uploads are recorded
+            processes: Processes serving the port, this one included
+            listen_socket: Listening socket to accept on instead of binding one
+            reuse_port: Bind with SO_REUSEPORT, so other processes can bind the port too
+        """
         self.port = port
         self.chunks_directory = chunks_directory
+        self.listen_socket = listen_socket
+        self.reuse_port = reuse_port
+        self.workers = None
+        if processes > 1:
+            # With SO_REUSEPORT the kernel spreads connections over one socket per
+            # process; otherwise the workers accept on this process's socket
+            self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+            self.workers = UploadWorkers(self, processes - 1)
         self.server_socket = None
         self.running = False
         self.thread = None
         self.stats = stats
         self.active_connections = defaultdict(int)  # Track active connections per peer
+        self.storages: Dict[str, PieceStorage] = {}  # file_id -> piece storage backend
+        self.merkle_trees: Dict[str, MerkleTree] = {}  # file_id -> tree for piece proofs
+        self.storages_lock = threading.Lock()
+        self.use_sendfile = hasattr(os, "sendfile")  # Zero-copy piece upload
+        self.capabilities = [CAPABILITY_BINARY]  # Session features offered to downloaders
+        if USE_COMPRESSION:
+            self.capabilities.append(CAPABILITY_ZLIB)
+        self.piece_cache = PieceCache(PIECE_CACHE_BYTES)  # Hot pieces shared across leechers
+        self.file_handles = FileHandleCache(MAX_OPEN_FILES)  # Open files reused across requests
+        self.read_ahead = ReadAhead(self.piece_cache, READ_AHEAD_PIECES, handles=self.file_handles)
+        self.piece_store = PieceStore(self.file_handles)  # Every local piece by digest
+        self.compressor = PieceCompressor(COMPRESSED_CACHE_BYTES)  # For sessions that accept zlib
+        self.scheduler = UploadScheduler(UPLOAD_SLOTS, UPLOAD_POLICY,
+                                         downloaded_from=stats.downloaded_from)  # Upload slots
+    
+    def register_storage(self, file_id: str, storage: PieceStorage,
+                         manifest: Optional[Dict] = None):
+        """
+        Serve pieces of file_id from the given storage backend.
+        
+        If the manifest has a Merkle root, its tree is kept so responses can
+        carry per-piece proofs. Its piece digests are added to the piece store.
+        """
+        tree = None
+        if manifest and manifest.get("merkle_root"):
+            tree = MerkleTree(manifest["piece_hashes"])
+        
+        with self.storages_lock:
+            self.storages[file_id] = storage
+            if tree is not None:
+                self.merkle_trees[file_id] = tree
+        self.piece_cache.invalidate_file(file_id)
+        self.compressor.invalidate_file(file_id)
+        self.file_handles.invalidate(storage.location())
+        if manifest and manifest.get("piece_hashes"):
+            duplicates = self.piece_store.add_file(file_id, manifest["piece_hashes"], storage)
+            if duplicates:
+                logger.info(f"{duplicates} pieces of {file_id} are also held by other shared files")
+        if self.workers is not None:
+            self.workers.register_storage(file_id, storage, manifest)
+    
+    def unregister_storage(self, file_id: str):
+        """Stop serving pieces of file_id and close its cached file handles."""
+        with self.storages_lock:
+            storage = self.storages.pop(file_id, None)
+            self.merkle_trees.pop(file_id, None)
+        self.piece_cache.invalidate_file(file_id)
+        self.compressor.invalidate_file(file_id)
+        self.piece_store.remove_file(file_id)
+        if storage is not None:
+            self.file_handles.invalidate(storage.location())
+        # Legacy chunk files are served without a registered storage
+        self.file_handles.invalidate(os.path.join(self.chunks_directory, file_id))
+        if self.workers is not None:
+            self.workers.unregister_storage(file_id)
+    
+    def get_storage(self, file_id: str) -> Optional[PieceStorage]:
+        """Resolve the storage for a file, falling back to the chunk-directory layout."""
+        with self.storages_lock:
+            storage = self.storages.get(file_id)
+        if storage is not None:
+            return storage
+        
+        file_chunk_dir = os.path.join(self.chunks_directory, file_id)
+        if os.path.isdir(file_chunk_dir):
+            return ChunkDirectoryStorage(file_chunk_dir)
+        return None
+    
+    def serves_path(self, path: str) -> bool:
+        """Check whether a registered storage serves pieces from path."""
+        path = os.path.abspath(path)
+        with self.storages_lock:
+            return any(os.path.abspath(storage.location()) == path
+                       for storage in self.storages.values())
     
     def start(self):
         """Start the peer server in a background thread."""
         self.thread = threading.Thread(target=self._run_server, daemon=True)
         self.thread.start()
     
+    def _listen(self) -> socket.socket:
+        """Bind the listening socket (or adopt the given one) and start any worker processes."""
+        sock = self.listen_socket
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('0.0.0.0', self.port))
+            sock.listen(LISTEN_BACKLOG)
+        if self.workers is not None:
+            self.workers.start(None if self.reuse_port else sock)
+        return sock
+    
     def _run_server(self):
         """Run the peer server."""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind(('0.0.0.0', self.port))
-            self.server_socket.listen(5)
+            self.server_socket = self._listen()
             self.running = True
             logger.info(f"Peer server started on port {self.port}")
             
@@ -187,7 +343,7 @@ class PeerServer:
                     client_socket, client_address = self.server_socket.accept()
                     self.active_connections[client_address[0]] += 1
                     handler_thread = threading.Thread(
-                        target=self._handle_chunk_request,
+                        target=self._handle_connection,
                         args=(client_socket, client_address),
                         daemon=True
                     )
@@ -202,49 +358,48 @@ class PeerServer:
             if self.server_socket:
                 self.server_socket.close()
     
-    def _handle_chunk_request(self, client_socket: socket.socket, client_address):
-        """Handle incoming chunk request from another peer."""
+    def _handle_connection(self, client_socket: socket.socket, client_address):
+        """
+        Serve chunk requests on one connection.
+        
+        Requests flagged keep_alive turn the connection into a session that
+        serves further requests until the peer closes it or it sits idle
+        for SESSION_IDLE_TIMEOUT; otherwise it is closed after one piece.
+        If the first request offers the "binary" capability, the rest of the
+        session uses binary frames instead of JSON headers; if it offers
+        "zlib", compressible pieces are sent compressed.
+        """
         peer_ip = client_address[0]
+        binary = False
+        compress = False
+        queued = deque()  # Requests read ahead of serving (so CANCEL can drop them)
         try:
             message = SocketUtils.receive_message(client_socket, timeout=5.0)
-            if not message:
-                return
-            
-            if message.get("type") != "CHUNK_REQUEST":
-                return
-            
-            file_id = message.get("file_id")
-            chunk_index = message.get("chunk_index")
-            
-            # Construct chunk path
-            file_chunk_dir = os.path.join(self.chunks_directory, file_id)
-            chunk_filename = os.path.join(file_chunk_dir, f"chunk_{chunk_index}")
-            
-            if os.path.exists(chunk_filename):
-                with open(chunk_filename, 'rb') as f:
-                    chunk_data = f.read()
-                
-                # Send response header
-                response = MessageBuilder.chunk_response_message(
-                    file_id, chunk_index, len(chunk_data), "success"
-                )
-                if SocketUtils.send_message(client_socket, response):
-                    # Send chunk data
-                    SocketUtils.send_chunk_data(client_socket, chunk_data)
-                    
-                    # Record statistics
-                    self.stats.add_upload(len(chunk_data), peer_ip, file_id, chunk_index)
+            while self.running and message:
+                message_type = message.get("type")
+                if message_type in ("HAVE", "CANCEL"):
+                    # HAVE is informational; a CANCEL seen here came after its piece was sent
+                    logger.debug(f"{message_type} from {peer_ip}: {message.get('file_id')} #{message.get('chunk_index')}")
+                elif message_type != "CHUNK_REQUEST":
+                    return
+                else:
+                    keep_alive = binary or bool(message.get("keep_alive"))
+                    accepted = []
+                    if keep_alive and not binary:
+                        accepted = [c for c in message.get("capabilities", []) if c in self.capabilities]
+                    compress = compress or CAPABILITY_ZLIB in accepted
                     
-                    logger.info(f"Served chunk {chunk_index} of file {file_id} to {peer_ip}")
-            else:
-                response = MessageBuilder.chunk_response_message(
-                    file_id, chunk_index, 0, "not_found"
-                )
-                SocketUtils.send_message(client_socket, response)
-                logger.warning(f"Chunk not found: {chunk_filename}")
+                    if not self._handle_chunk_request(client_socket, client_address, message,
+                                                      keep_alive, binary, accepted, compress):
+                        return
+                    if not keep_alive:
+                        return
+                    binary = binary or CAPABILITY_BINARY in accepted
+                
+                message = self._next_message(client_socket, binary, queued)
         
         except Exception as e:
-            logger.error(f"Error handling chunk request: {e}")
+            logger.error(f"Error handling connection from {peer_ip}: {e}")
         finally:
             try:
                 client_socket.close()
@@ -252,9 +407,203 @@ class PeerServer:
             except:
                 pass
     
+    def _next_message(self, client_socket: socket.socket, binary: bool,
+                      queued: deque) -> Optional[Dict]:
+        """
+        Get the next request of a session, or None when it ends or sits idle.
+        
+        Binary sessions drain frames that have already arrived, up to
+        PIPELINE_WINDOW of them, so a CANCEL can remove its request from the
+        queue before it is served.
+        """
+        while binary and len(queued) < PIPELINE_WINDOW:
+            readable, _, _ = select.select([client_socket], [], [], 0)
+            if not readable:
+                break
+            frame = BinaryFrames.receive_frame(client_socket, timeout=5.0)
+            if frame is None:
+                return None
+            if frame["type"] == "CANCEL":
+                key = (frame["file_id"], frame["chunk_index"])
+                for queued_message in queued:
+                    if queued_message["type"] == "CHUNK_REQUEST" and \
+                            (queued_message["file_id"], queued_message["chunk_index"]) == key:
+                        queued.remove(queued_message)
+                        break
+                continue
+            queued.append(frame)
+        
+        if queued:
+            return queued.popleft()
+        
+        # Wait for the next request without holding a receive timeout
+        readable, _, _ = select.select([client_socket], [], [], SESSION_IDLE_TIMEOUT)
+        if not readable:
+            logger.debug("Closing idle session")
+            return None
+        if binary:
+            return BinaryFrames.receive_frame(client_socket, timeout=5.0)
+        return SocketUtils.receive_message(client_socket, timeout=5.0)
+    
+    def _handle_chunk_request(self, client_socket: socket.socket, client_address,
+                              message: Dict, keep_alive: bool = False,
+                              binary: bool = False, capabilities: List[str] = None,
+                              compress: bool = False) -> bool:
+        """
+        Handle one chunk request from another peer.
+        
+        Args:
+            client_socket: Connection to reply on
+            client_address: Requesting peer's (ip, port)
+            message: CHUNK_REQUEST message (decoded from JSON or a binary frame)
+            keep_alive: Whether the connection stays open afterwards
+            binary: Reply with a binary PIECE frame instead of a JSON header
+            capabilities: Session features accepted (echoed in a JSON reply)
+            compress: The session accepted zlib-compressed pieces
+        
+        Returns:
+            True if the response went out completely (the connection can be reused)
+        """
+        reply = self._prepare_response(client_address, message, keep_alive, binary,
+                                       capabilities, compress)
+        
+        # Send response header
+        if not SocketUtils.send_chunk_data(client_socket, reply["header"]):
+            return False
+        if not reply["found"]:
+            return True
+        
+        # Send chunk data from memory, or stream it from disk to the socket
+        if reply["data"] is not None:
+            if not SocketUtils.send_chunk_data(client_socket, reply["data"]):
+                return False
+        elif not self._send_extents(client_socket, reply["extents"]):
+            return False
+        
+        self._record_upload(client_address, message, reply["size"])
+        return True
+    
+    def _prepare_response(self, client_address, message: Dict, keep_alive: bool = False,
+                          binary: bool = False, capabilities: List[str] = None,
+                          compress: bool = False) -> Dict:
+        """
+        Locate a requested piece, load it if it is served from memory, and encode the response header.
+        
+        Args:
+            client_address: Requesting peer's (ip, port)
+            message: CHUNK_REQUEST message
+            keep_alive: Whether the connection stays open afterwards
+            binary: Encode a binary PIECE frame instead of a JSON header
+            capabilities: Session features accepted (echoed in a JSON reply)
+            compress: The session accepted zlib-compressed pieces
+        
+        Returns:
+            {"header": bytes, "found": bool (False if missing or choked), "size": raw piece size,
+             "data": payload bytes or None, "extents": byte ranges to stream when data is None}
+        """
+        file_id = message.get("file_id")
+        chunk_index = message.get("chunk_index")
+        
+        # Locate the piece in whichever storage backs this file
+        storage = self.get_storage(file_id) if file_id else None
+        extents = storage.piece_extents(chunk_index) if storage else None
+        chunk_size = sum(length for _, _, length in extents) if extents else 0
+        
+        # Peers without an upload slot are told so at once rather than queued
+        if extents is not None and not self.scheduler.admit(client_address[0]):
+            logger.debug(f"Choked request from {client_address[0]}: {file_id} #{chunk_index}")
+            if binary:
+                header = BinaryFrames.piece_header(file_id, chunk_index, 0, "choked")
+            else:
+                header = SocketUtils.encode_message(MessageBuilder.chunk_response_message(
+                    file_id, chunk_index, 0, "choked", keep_alive=keep_alive,
+                    capabilities=capabilities
+                ))
+            return {"header": header, "found": False, "size": 0, "data": None, "extents": None}
+        
+        # Sequential leechers get the next pieces loaded before they ask
+        if extents is not None:
+            self.read_ahead.on_request(client_address, file_id, chunk_index, storage)
+        
+        def read():
+            return storage.read_piece(chunk_index, self.file_handles)
+        
+        # Compressible pieces go out compressed to sessions that accepted it;
+        # compressed forms are cached, so each piece is compressed once
+        compressed = None
+        if compress and extents is not None and self.compressor.can_compress(chunk_size):
+            compressed = self.compressor.get((file_id, chunk_index), lambda: (
+                self.piece_cache.get_or_load((file_id, chunk_index), read)
+                if self.piece_cache.can_cache(chunk_size) else read()
+            ))
+        
+        # Pieces requested again (e.g. by several leechers) are served from
+        # memory, with one shared disk read per piece; first requests and
+        # large pieces stream from disk with sendfile
+        chunk_data = None
+        if compressed is None and extents is not None and self.piece_cache.can_cache(chunk_size) \
+                and self.piece_cache.admit((file_id, chunk_index)):
+            chunk_data = self.piece_cache.get_or_load((file_id, chunk_index), read)
+            if chunk_data is None:
+                extents = None
+        
+        if extents is None:
+            logger.warning(f"Chunk not found: {file_id} #{chunk_index}")
+            if binary:
+                header = BinaryFrames.piece_header(file_id, chunk_index, 0, "not_found")
+            else:
+                header = SocketUtils.encode_message(MessageBuilder.chunk_response_message(
+                    file_id, chunk_index, 0, "not_found", keep_alive=keep_alive,
+                    capabilities=capabilities
+                ))
+            return {"header": header, "found": False, "size": 0, "data": None, "extents": None}
+        
+        proof = None
+        if message.get("proof"):
+            with self.storages_lock:
+                tree = self.merkle_trees.get(file_id)
+            proof = tree.proof(chunk_index) if tree else None
+        
+        payload_size = len(compressed) if compressed is not None else chunk_size
+        raw_size = chunk_size if compressed is not None else None
+        if binary:
+            header = BinaryFrames.piece_header(file_id, chunk_index, payload_size, proof=proof,
+                                               raw_size=raw_size)
+        else:
+            header = SocketUtils.encode_message(MessageBuilder.chunk_response_message(
+                file_id, chunk_index, payload_size, "success", proof=proof,
+                keep_alive=keep_alive, capabilities=capabilities,
+                compression=COMPRESSION_ZLIB if compressed is not None else None, raw_size=raw_size
+            ))
+        return {
+            "header": header,
+            "found": True,
+            "size": chunk_size,
+            "data": compressed if compressed is not None else chunk_data,
+            "extents": extents
+        }
+    
+    def _record_upload(self, client_address, message: Dict, size: int):
+        """Record statistics for a piece sent completely."""
+        self.stats.add_upload(size, client_address[0], message["file_id"], message["chunk_index"])
+        logger.info(f"Served chunk {message['chunk_index']} of file {message['file_id']} to {client_address[0]}")
+    
+    def _send_extents(self, client_socket: socket.socket, extents) -> bool:
+        """Send the byte ranges backing a piece without buffering it in memory."""
+        for path, offset, length in extents:
+            with self.file_handles.open(path) as f:
+                if not SocketUtils.send_file_range(client_socket, f, offset, length,
+                                                   use_sendfile=self.use_sendfile):
+                    return False
+        return True
+    
     def stop(self):
         """Stop the peer server."""
         self.running = False
+        if self.workers is not None:
+            self.workers.stop()
+        self.read_ahead.shutdown()
+        self.file_handles.close_all()
         if self.server_socket:
             try:
                 self.server_socket.close()
@@ -262,6 +611,465 @@ class PeerServer:
                 pass
 
 
+class AsyncPeerServer(PeerServer):
+    """
+    PeerServer that runs every connection on one asyncio event loop.
+    
+    Speaks the same protocol and shares the storage registry, caches and
+    statistics of PeerServer; only connection handling differs. Thousands
+    of idle or pipelined sessions cost a coroutine each rather than a
+    thread. Piece lookups, disk reads and compression run on a small
+    thread pool so a slow disk never stalls the loop, and pieces streamed
+    from disk go out with loop.sendfile.
+    """
+    
+    def __init__(self, port: int, chunks_directory: str, stats: TransferStats,
+                 processes: int = 1, listen_socket: Optional[socket.socket] = None,
+                 reuse_port: bool = False, read_workers: int = UPLOAD_READ_WORKERS):
+        super().__init__(port, chunks_directory, stats, processes, listen_socket, reuse_port)
+        self.read_workers = read_workers
+        self.loop = None
+        self.executor = None
+        self.stopping = None  # asyncio.Event that ends the loop
+        self.ready = threading.Event()  # Set once the server listens (or failed to start)
+    
+    def start(self):
+        """Start the event loop in a background thread and wait until it listens."""
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        self.ready.wait(5.0)
+    
+    def _run_loop(self):
+        """Run the event loop until stop()."""
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            logger.error(f"Peer server error: {e}")
+        finally:
+            self.running = False
+            self.ready.set()
+    
+    async def _serve(self):
+        """Listen and serve connections until stopped."""
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.read_workers, thread_name_prefix="upload-read")
+        server = None
+        try:
+            server = await asyncio.start_server(self._handle_stream, sock=self._listen(),
+                                                 backlog=LISTEN_BACKLOG)
+            self.running = True
+            logger.info(f"Peer server started on port {self.port} (asyncio)")
+            self.ready.set()
+            await self.stopping.wait()
+        finally:
+            if server is not None:
+                server.close()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve chunk requests on one connection.
+        
+        Same session rules as PeerServer._handle_connection. Once a session
+        switches to binary frames, a second task reads frames as they
+        arrive, up to PIPELINE_WINDOW ahead of serving, so a CANCEL can
+        remove its request before it is served.
+        """
+        client_address = writer.get_extra_info("peername")[:2]
+        peer_ip = client_address[0]
+        self.active_connections[peer_ip] += 1
+        binary = False
+        compress = False
+        queued = deque()  # Binary requests read ahead of serving; None marks the end of the session
+        arrived = asyncio.Event()
+        room = asyncio.Event()  # Set when the receiver may queue another frame
+        receiver = None
+        try:
+            message = await self._receive_message(reader, 5.0)
+            while self.running and message:
+                message_type = message.get("type")
+                if message_type in ("HAVE", "CANCEL"):
+                    # HAVE is informational; a CANCEL seen here came after its piece was sent
+                    logger.debug(f"{message_type} from {peer_ip}: {message.get('file_id')} #{message.get('chunk_index')}")
+                elif message_type != "CHUNK_REQUEST":
+                    return
+                else:
+                    keep_alive = binary or bool(message.get("keep_alive"))
+                    accepted = []
+                    if keep_alive and not binary:
+                        accepted = [c for c in message.get("capabilities", []) if c in self.capabilities]
+                    compress = compress or CAPABILITY_ZLIB in accepted
+                    
+                    if not await self._serve_request(writer, client_address, message,
+                                                     keep_alive, binary, accepted, compress):
+                        return
+                    if not keep_alive:
+                        return
+                    if not binary and CAPABILITY_BINARY in accepted:
+                        binary = True
+                        receiver = asyncio.create_task(self._receive_frames(reader, queued, arrived, room))
+                
+                if binary:
+                    while not queued:
+                        arrived.clear()
+                        await arrived.wait()
+                    message = queued.popleft()
+                    room.set()
+                else:
+                    message = await self._receive_message(reader, SESSION_IDLE_TIMEOUT)
+        
+        except asyncio.CancelledError:
+            pass  # Server stopping
+        except Exception as e:
+            logger.error(f"Error handling connection from {peer_ip}: {e}")
+        finally:
+            if receiver is not None:
+                receiver.cancel()
+            writer.close()
+            try:
+                await asyncio.wait_for(writer.wait_closed(), 5.0)
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                writer.transport.abort()  # Peer stopped reading; drop what is still buffered
+            self.active_connections[peer_ip] = max(0, self.active_connections[peer_ip] - 1)
+    
+    async def _receive_frames(self, reader: asyncio.StreamReader, queued: deque,
+                              arrived: asyncio.Event, room: asyncio.Event):
+        """
+        Queue a binary session's frames as they arrive, until it closes or sits idle.
+        
+        Reading stops while PIPELINE_WINDOW requests are queued, so a peer
+        flooding requests is held back by TCP instead of growing the queue.
+        """
+        try:
+            while True:
+                while len(queued) >= PIPELINE_WINDOW:
+                    room.clear()
+                    await room.wait()
+                frame = await self._receive_frame(reader, SESSION_IDLE_TIMEOUT)
+                if frame is None:
+                    break
+                if frame["type"] == "CANCEL":
+                    key = (frame["file_id"], frame["chunk_index"])
+                    for queued_message in queued:
+                        if queued_message is not None and queued_message["type"] == "CHUNK_REQUEST" and \
+                                (queued_message["file_id"], queued_message["chunk_index"]) == key:
+                            queued.remove(queued_message)
+                            break
+                    continue
+                queued.append(frame)
+                arrived.set()
+        finally:
+            queued.append(None)
+            arrived.set()
+    
+    @staticmethod
+    async def _receive_message(reader: asyncio.StreamReader, timeout: float) -> Optional[Dict]:
+        """
+        Read one length-prefixed JSON message.
+        
+        Args:
+            reader: Connection to read from
+            timeout: Seconds to wait for the message to start
+        
+        Returns:
+            Dictionary, or None on close, timeout or invalid data
+        """
+        try:
+            prefix = await asyncio.wait_for(reader.readexactly(8), timeout)
+            msg_length = int.from_bytes(prefix, byteorder='big')
+            if msg_length > MAX_MESSAGE_SIZE:
+                logger.error(f"Message length {msg_length} exceeds {MAX_MESSAGE_SIZE} bytes")
+                return None
+            data = await asyncio.wait_for(reader.readexactly(msg_length), 5.0)
+            return json.loads(data)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                logger.error("Connection closed while receiving message")
+            return None
+        except asyncio.TimeoutError:
+            logger.debug("Closing idle connection")
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logger.error("Invalid JSON received")
+            return None
+    
+    @staticmethod
+    async def _receive_frame(reader: asyncio.StreamReader, timeout: float) -> Optional[Dict]:
+        """
+        Read one binary frame header and its extra data.
+        
+        Args:
+            reader: Connection to read from
+            timeout: Seconds to wait for the frame to start
+        
+        Returns:
+            Message dictionary, or None on close, timeout or an invalid frame
+        """
+        try:
+            header = await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), timeout)
+            extra_len = BinaryFrames.extra_length(header)
+            extra = await asyncio.wait_for(reader.readexactly(extra_len), 5.0) if extra_len else b''
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                logger.error("Connection closed while receiving frame")
+            return None
+        except asyncio.TimeoutError:
+            logger.debug("Closing idle session")
+            return None
+        return BinaryFrames.decode(header, extra)
+    
+    async def _serve_request(self, writer: asyncio.StreamWriter, client_address, message: Dict,
+                             keep_alive: bool, binary: bool, capabilities: List[str],
+                             compress: bool) -> bool:
+        """
+        Handle one chunk request: load it on the read pool, then send it from the loop.
+        
+        The response is always prepared on the pool, even for cached pieces:
+        locating a piece stats files, which a slow disk could stall the loop
+        on. A peer that takes more than SESSION_IDLE_TIMEOUT to read the
+        piece loses the connection.
+        
+        Returns:
+            True if the response went out completely (the connection can be reused)
+        """
+        try:
+            reply = await self.loop.run_in_executor(
+                self.executor, self._prepare_response, client_address, message,
+                keep_alive, binary, capabilities, compress
+            )
+            writer.write(reply["header"])
+            if reply["data"] is not None:
+                writer.write(reply["data"])
+            await asyncio.wait_for(writer.drain(), SESSION_IDLE_TIMEOUT)
+            if not reply["found"]:
+                return True
+            if reply["data"] is None and not await self._send_extents_async(writer, reply["extents"]):
+                return False
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out sending chunk to {client_address[0]}")
+            return False
+        except (ConnectionError, OSError) as e:
+            logger.error(f"Failed to send chunk to {client_address[0]}: {e}")
+            return False
+        
+        self._record_upload(client_address, message, reply["size"])
+        return True
+    
+    async def _send_extents_async(self, writer: asyncio.StreamWriter, extents) -> bool:
+        """Stream the byte ranges backing a piece, with sendfile or reads on the read pool."""
+        for path, offset, length in extents:
+            # Opening a file that isn't cached yet touches the disk: do it on the pool
+            handle = self.file_handles.open(path)
+            f = await self.loop.run_in_executor(self.executor, handle.__enter__)
+            try:
+                sent = 0
+                if self.use_sendfile:
+                    try:
+                        sent = await asyncio.wait_for(
+                            self.loop.sendfile(writer.transport, f, offset, length, fallback=False),
+                            SESSION_IDLE_TIMEOUT
+                        )
+                    except asyncio.SendfileNotAvailableError as e:
+                        logger.debug(f"sendfile unavailable ({e}), using buffered send")
+                
+                # Buffered fallback (also finishes a range sendfile stopped short of)
+                while sent < length:
+                    block = await self.loop.run_in_executor(
+                        self.executor, positional_read, f, min(SEND_BLOCK_SIZE, length - sent), offset + sent
+                    )
+                    if not block:
+                        logger.error("File ended before requested range was sent")
+                        return False
+                    writer.write(block)
+                    await asyncio.wait_for(writer.drain(), SESSION_IDLE_TIMEOUT)
+                    sent += len(block)
+            finally:
+                handle.__exit__(None, None, None)
+        return True
+    
+    def stop(self):
+        """Stop the event loop and the peer server."""
+        if self.loop is not None and self.stopping is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.stopping.set)
+            except RuntimeError:
+                pass  # Loop already closed
+        super().stop()
+
+
+class UploadStatsForwarder:
+    """
+    Stands in for TransferStats in an upload worker process.
+    
+    Uploads are batched and sent to the parent process every
+    STATS_FLUSH_INTERVAL, where they are recorded in its TransferStats.
+    """
+    
+    def __init__(self, uploads):
+        """
+        Initialize the forwarder.
+        
+        Args:
+            uploads: multiprocessing queue read by the parent's UploadWorkers
+        """
+        self.uploads = uploads
+        self.pending = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def add_upload(self, bytes_count: int, peer_id: str, file_id: str, chunk_idx: int):
+        """Queue an upload record for the next batch."""
+        with self.lock:
+            self.pending.append((bytes_count, peer_id, file_id, chunk_idx))
+    
+    def downloaded_from(self, peer_host: str) -> int:
+        """Workers don't download, so reciprocation ranks their peers equally."""
+        return 0
+    
+    def _run(self):
+        """Send batches until stopped."""
+        while not self.stopped.wait(STATS_FLUSH_INTERVAL):
+            self.flush()
+    
+    def flush(self):
+        """Send the records queued so far."""
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if batch:
+            self.uploads.put(batch)
+    
+    def stop(self):
+        """Stop sending and flush what is left."""
+        self.stopped.set()
+        self.flush()
+
+
+class UploadWorkers:
+    """
+    Extra processes serving uploads on a PeerServer's port.
+    
+    Each worker runs its own server of the same class, with its own
+    caches, and serves the connections the kernel hands it. Storage
+    registrations are forwarded to every worker over a command queue,
+    and workers send their uploads back in batches to be recorded in
+    the parent's TransferStats.
+    """
+    
+    def __init__(self, server: PeerServer, count: int):
+        """
+        Initialize the workers (started by start()).
+        
+        Args:
+            server: Parent server whose port, storages and stats are shared
+            count: Number of worker processes
+        """
+        self.server = server
+        self.count = count
+        self.context = multiprocessing.get_context("spawn")  # No forking of a threaded GUI process
+        self.commands = [self.context.Queue() for _ in range(count)]
+        self.uploads = self.context.Queue()
+        self.processes = []
+        self.collector = None
+    
+    def start(self, listen_socket: Optional[socket.socket]):
+        """
+        Start the worker processes.
+        
+        Args:
+            listen_socket: Socket for workers to accept on, or None for each
+                to bind the port itself with SO_REUSEPORT
+        """
+        for commands in self.commands:
+            process = self.context.Process(
+                target=_run_upload_worker,
+                args=(type(self.server), self.server.port, self.server.chunks_directory,
+                      listen_socket, commands, self.uploads),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+        mode = "shared socket" if listen_socket is not None else "SO_REUSEPORT"
+        logger.info(f"Started {self.count} upload worker processes ({mode})")
+    
+    def register_storage(self, file_id: str, storage: PieceStorage,
+                         manifest: Optional[Dict] = None):
+        """Serve a file from every worker (only a Merkle tree's digests are sent along)."""
+        if manifest and manifest.get("merkle_root"):
+            manifest = {"merkle_root": manifest["merkle_root"], "piece_hashes": manifest["piece_hashes"]}
+        else:
+            manifest = None
+        self._send(("register", file_id, storage, manifest))
+    
+    def unregister_storage(self, file_id: str):
+        """Stop serving a file from every worker."""
+        self._send(("unregister", file_id))
+    
+    def _send(self, command: tuple):
+        """Queue a command for every worker."""
+        for commands in self.commands:
+            commands.put(command)
+    
+    def _collect(self):
+        """Record uploads reported by workers in the parent's TransferStats."""
+        while True:
+            batch = self.uploads.get()
+            if batch is None:
+                return
+            for record in batch:
+                self.server.stats.add_upload(*record)
+    
+    def stop(self):
+        """Stop the workers and record their last uploads."""
+        self._send(("stop",))
+        for process in self.processes:
+            process.join(5.0)
+            if process.is_alive():
+                process.terminate()
+        self.uploads.put(None)
+        if self.collector is not None:
+            self.collector.join(5.0)
+        self.processes = []
+
+
+def _run_upload_worker(server_class, port: int, chunks_directory: str,
+                       listen_socket: Optional[socket.socket], commands, uploads):
+    """
+    Entry point of an upload worker process.
+    
+    Serves pieces with its own server until told to stop or the parent
+    process exits.
+    """
+    stats = UploadStatsForwarder(uploads)
+    server = server_class(port, chunks_directory, stats, listen_socket=listen_socket,
+                          reuse_port=listen_socket is None)
+    server.start()
+    parent = multiprocessing.parent_process()
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=1.0)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    break
+                continue
+            if command[0] == "register":
+                server.register_storage(*command[1:])
+            elif command[0] == "unregister":
+                server.unregister_storage(command[1])
+            else:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        stats.stop()
+
+
 class PeerClient:
     """GUI client for P2P file sharing with enhanced statistics."""
     
@@ -312,22 +1120,36 @@ class PeerClient:
         self.shared_directory = self.identity.get_uploads_dir()
         self.downloads_directory = self.identity.get_downloads_dir()
         self.chunks_directory = os.path.join(self.shared_directory, "chunks")
+        self.manifests_directory = os.path.join(self.shared_directory, "manifests")
         
         # Create directories
         os.makedirs(self.chunks_directory, exist_ok=True)
+        os.makedirs(self.manifests_directory, exist_ok=True)
         
         # Statistics
         self.stats = TransferStats()
         
         # Start peer server
-        self.peer_server = PeerServer(self.peer_port, self.chunks_directory, self.stats)
+        server_class = AsyncPeerServer if USE_ASYNC_SERVER else PeerServer
+        self.peer_server = server_class(self.peer_port, self.chunks_directory, self.stats,
+                                        processes=UPLOAD_PROCESSES)
         self.peer_server.start()
         
         # File chunker
         self.chunker = FileChunker(CHUNK_SIZE)
         
+        # Persistent connections to other peers, reused across pieces;
+        # pieces are received into pooled buffers
+        self.buffer_pool = BufferPool()
+        self.session_pool = SessionPool(DOWNLOAD_TIMEOUT, PIPELINE_WINDOW,
+                                        capabilities=list(self.peer_server.capabilities),
+                                        buffer_pool=self.buffer_pool)
+        
         # Active downloads
         self.active_downloads: Dict[str, Dict] = {}
+        self.disk_writers: Dict[str, DiskWriter] = {}  # file_id -> writer for in-progress downloads
+        self.update_downloads: Dict[str, float] = {}  # new file_id -> time its update download started
+        self.update_lock = threading.Lock()
         
         # Progress tracking for UI
         self.current_download_progress = None  # Will hold progress bar reference
@@ -542,8 +1364,12 @@ class PeerClient:
         
         ttk.Button(toolbar, text="Add File", command=self._select_file_to_share, 
                   width=12).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(toolbar, text="Add Folder", command=self._select_folder_to_share,
+                  width=12).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(toolbar, text="Share", command=self._share_file,
                   width=12).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(toolbar, text="Publish Update", command=self._publish_update,
+                  width=14).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(toolbar, text="Remove", command=self._remove_shared_file,
                   width=12).pack(side=tk.LEFT, padx=5, pady=5)
         
@@ -752,6 +1578,30 @@ class PeerClient:
         tk.Label(stats_grid, textvariable=self.total_download_var, background="#f0f0f0",
                 foreground="#0066cc", font=("Segoe UI", 10, "bold")).grid(row=0, column=3, padx=5, pady=8, sticky=tk.W)
         
+        # Upload piece cache
+        ttk.Label(stats_grid, text="Piece cache:", background="#f0f0f0", foreground="#555555").grid(row=0, column=4, padx=10, pady=8, sticky=tk.E)
+        self.cache_stats_var = tk.StringVar(value="-")
+        tk.Label(stats_grid, textvariable=self.cache_stats_var, background="#f0f0f0",
+                foreground="#555555", font=("Segoe UI", 10)).grid(row=0, column=5, padx=5, pady=8, sticky=tk.W)
+        
+        # Download disk writers
+        ttk.Label(stats_grid, text="Disk queue:", background="#f0f0f0", foreground="#555555").grid(row=0, column=6, padx=10, pady=8, sticky=tk.E)
+        self.disk_stats_var = tk.StringVar(value="-")
+        tk.Label(stats_grid, textvariable=self.disk_stats_var, background="#f0f0f0",
+                foreground="#555555", font=("Segoe UI", 10)).grid(row=0, column=7, padx=5, pady=8, sticky=tk.W)
+        
+        # Upload compression
+        ttk.Label(stats_grid, text="Compression:", background="#f0f0f0", foreground="#555555").grid(row=0, column=8, padx=10, pady=8, sticky=tk.E)
+        self.compression_stats_var = tk.StringVar(value="-")
+        tk.Label(stats_grid, textvariable=self.compression_stats_var, background="#f0f0f0",
+                foreground="#555555", font=("Segoe UI", 10)).grid(row=0, column=9, padx=5, pady=8, sticky=tk.W)
+        
+        # Upload slots
+        ttk.Label(stats_grid, text="Upload slots:", background="#f0f0f0", foreground="#555555").grid(row=0, column=10, padx=10, pady=8, sticky=tk.E)
+        self.slot_stats_var = tk.StringVar(value="-")
+        tk.Label(stats_grid, textvariable=self.slot_stats_var, background="#f0f0f0",
+                foreground="#555555", font=("Segoe UI", 10)).grid(row=0, column=11, padx=5, pady=8, sticky=tk.W)
+        
         # Transfer log label
         log_label = tk.Label(container, text="Recent Transfers", bg="#f0f0f0", fg="#333333",
                             font=("Segoe UI", 9, "bold"), anchor=tk.W, height=2)
@@ -834,20 +1684,25 @@ class PeerClient:
             
             # Load shared files (seeding torrents)
             for info_hash, torrent in torrents.items():
-                # Check if chunks still exist
-                file_chunk_dir = os.path.join(self.chunks_directory, info_hash)
-                
                 if torrent['status'] in ['seeding', 'downloading']:
-                    # Only load if chunks exist OR if it's a new download
-                    if os.path.exists(file_chunk_dir) or torrent['status'] == 'downloading':
+                    # Check if the original file or legacy chunks still exist
+                    manifest = ManifestUtils.load_manifest(self.manifests_directory, info_hash)
+                    storage = self._storage_for_torrent(info_hash, torrent, manifest)
+                    
+                    # Only load if data exists OR if it's a new download
+                    if storage is not None or torrent['status'] == 'downloading':
                         self.shared_files[info_hash] = {
                             'filename': torrent['filename'],
                             'chunks': torrent['total_pieces'],
+                            'total_size': torrent.get('total_size'),
+                            'piece_length': torrent.get('piece_length'),
                             'date_shared': torrent.get('added_at', ''),
                             'completed_pieces': len(torrent['completed_pieces'])
                         }
+                        if storage is not None:
+                            self.peer_server.register_storage(info_hash, storage, manifest)
                     else:
-                        logger.warning(f"Chunks missing for {torrent['filename']}, skipping")
+                        logger.warning(f"Data missing for {torrent['filename']}, skipping")
             
             # Load download history from state
             self.download_history = self.state_mgr.state.get('download_history', [])
@@ -856,6 +1711,29 @@ class PeerClient:
         except Exception as e:
             logger.error(f"Failed to load state: {e}")
     
+    def _storage_for_torrent(self, info_hash: str, torrent: Dict,
+                             manifest: Optional[Dict] = None) -> Optional[PieceStorage]:
+        """Build the piece storage for a torrent loaded from state."""
+        save_path = torrent.get('save_path', '')
+        if save_path and os.path.isdir(save_path) and manifest and manifest.get("files") is not None:
+            storage = MultiFileStorage(save_path, manifest["files"], manifest["piece_length"])
+            if storage.is_available():
+                return storage
+            logger.warning(f"Files under {save_path} changed since it was shared")
+            return None
+        if save_path and os.path.isfile(save_path):
+            piece_offsets = manifest.get("piece_offsets") if manifest else None
+            storage = SingleFileStorage(save_path, torrent['piece_length'], torrent['total_size'],
+                                        piece_offsets)
+            if storage.is_available():
+                return storage
+            logger.warning(f"Size of {save_path} changed since it was shared")
+            return None
+        
+        # Fall back to imported data in the legacy chunk-directory layout
+        storage = ChunkDirectoryStorage(os.path.join(self.chunks_directory, info_hash))
+        return storage if storage.is_available() else None
+    
     def _save_state(self):
         """Save current state (just trigger state manager save)."""
         try:
@@ -875,10 +1753,10 @@ class PeerClient:
         
         for file_id, file_info in list(self.shared_files.items()):
             try:
-                # Check if chunks still exist
-                file_chunk_dir = os.path.join(self.chunks_directory, file_id)
-                if not os.path.exists(file_chunk_dir):
-                    self._log(f"⚠️ Chunks missing for {file_info.get('filename', file_id)}")
+                # Check if the file data is still available
+                storage = self.peer_server.get_storage(file_id)
+                if storage is None or not storage.is_available():
+                    self._log(f"⚠️ Data missing for {file_info.get('filename', file_id)}")
                     # Don't delete - just skip re-registration
                     continue
                 
@@ -886,7 +1764,8 @@ class PeerClient:
                 filename = file_info.get("filename", "unknown")
                 num_chunks = file_info.get("chunks", 0)
                 
-                if self._register_file(file_id, filename, num_chunks):
+                if self._register_file(file_id, filename, num_chunks, file_info.get("total_size"),
+                                       file_info.get("piece_length")):
                     self._log(f"✓ Re-registered: {filename} (ID: {file_id[:8]})")
                     # Announce started to tracker
                     self._announce_to_tracker("started", file_id)
@@ -972,8 +1851,9 @@ class PeerClient:
                             peers = file_info.get('peers', [])
                             num_peers = len(peers)
                             
-                            # Calculate size estimate (chunks * CHUNK_SIZE)
-                            size_bytes = num_chunks * CHUNK_SIZE
+                            # Use the advertised size (estimate for older sharers)
+                            size_bytes = estimate_file_size(file_info.get('total_size'), num_chunks,
+                                                            file_info.get('piece_length'))
                             if size_bytes > 1024*1024:
                                 size_str = f"{size_bytes/1024/1024:.1f} MB"
                             else:
@@ -1015,7 +1895,8 @@ class PeerClient:
                         num_peers = len(peers)
                         
                         # Calculate size
-                        size_bytes = num_chunks * CHUNK_SIZE
+                        size_bytes = estimate_file_size(file_info.get('total_size'), num_chunks,
+                                                        file_info.get('piece_length'))
                         if size_bytes > 1024*1024:
                             size_str = f"{size_bytes/1024/1024:.1f} MB"
                         else:
@@ -1212,6 +2093,47 @@ class PeerClient:
                 self.total_upload_var.set(f"{upload_speed:.2f} KB/s")
                 self.total_download_var.set(f"{download_speed:.2f} KB/s")
                 
+                # Upload cache hit rate and fill
+                cache = self.peer_server.piece_cache.get_stats()
+                lookups = cache["hits"] + cache["misses"]
+                hit_rate = f"{cache['hits'] / lookups * 100:.0f}% hits" if lookups else "no requests"
+                if cache["prefetch_hits"]:
+                    hit_rate += f" ({cache['prefetch_hits']} read ahead)"
+                self.cache_stats_var.set(
+                    f"{hit_rate}, {cache['cached_bytes'] / (1024 * 1024):.0f}/"
+                    f"{cache['max_bytes'] / (1024 * 1024):.0f} MB"
+                )
+                
+                # Disk writer queue depth and write latency across active downloads
+                disk = [writer.get_stats() for writer in list(self.disk_writers.values())]
+                writes = sum(d["writes"] for d in disk)
+                if writes:
+                    avg_ms = sum(d["avg_write_ms"] * d["writes"] for d in disk) / writes
+                    self.disk_stats_var.set(
+                        f"{sum(d['queue_depth'] for d in disk)} pieces, {avg_ms:.1f} ms/write"
+                    )
+                else:
+                    self.disk_stats_var.set("-")
+                
+                # Bytes saved by sending compressed pieces
+                compression = self.peer_server.compressor.get_stats()
+                if compression["bytes_out"]:
+                    self.compression_stats_var.set(
+                        f"{compression['bytes_in'] / compression['bytes_out']:.1f}x on "
+                        f"{compression['compressed']} pieces, {compression['skipped']} sent raw"
+                    )
+                else:
+                    self.compression_stats_var.set("-")
+                
+                slots = self.peer_server.scheduler.get_stats()
+                if slots["slots"]:
+                    self.slot_stats_var.set(
+                        f"{slots['unchoked']}/{slots['slots']} in use, {slots['interested']} peers asking, "
+                        f"{slots['choked']} requests choked"
+                    )
+                else:
+                    self.slot_stats_var.set("unlimited")
+                
                 # Update file counts (every second)
                 self.total_shared_var.set(str(len(self.shared_files)))
                 completed_downloads = len([h for h in self.download_history if h.get('status') == 'Completed'])
@@ -1271,7 +2193,8 @@ class PeerClient:
                 
                 # Calculate size
                 num_chunks = file_info.get("chunks", 0)
-                size_bytes = num_chunks * CHUNK_SIZE
+                size_bytes = estimate_file_size(file_info.get("total_size"), num_chunks,
+                                                file_info.get("piece_length"))
                 if size_bytes > 1024*1024:
                     size_str = f"{size_bytes/1024/1024:.1f} MB"
                 else:
@@ -1377,7 +2300,8 @@ class PeerClient:
                 
                 # Calculate size
                 num_chunks = file_info.get("chunks", 0)
-                size_bytes = num_chunks * CHUNK_SIZE
+                size_bytes = estimate_file_size(file_info.get("total_size"), num_chunks,
+                                                file_info.get("piece_length"))
                 if size_bytes > 1024*1024:
                     size_str = f"{size_bytes/1024/1024:.1f} MB"
                 else:
@@ -1431,8 +2355,41 @@ class PeerClient:
             self.share_file_var.set(os.path.basename(filename))
             self._log(f"Selected file: {filename}")
     
-    def _share_file(self):
-        """Share the selected file."""
+    def _select_folder_to_share(self):
+        """Open folder dialog to select a directory to share as one file ID."""
+        directory = filedialog.askdirectory()
+        if directory:
+            self.share_file_path = directory
+            self.share_file_var.set(os.path.basename(os.path.normpath(directory)) + "/")
+            self._log(f"Selected folder: {directory}")
+    
+    def _build_share_manifest(self, path: str, piece_length: int, merkle: bool = False,
+                              chunking: str = CHUNKING_FIXED) -> Optional[Dict]:
+        """
+        Hash a file or directory for sharing.
+        
+        Directories become one multi-file share with fixed pieces spanning
+        file boundaries (merkle and chunking apply to single files only).
+        """
+        if os.path.isdir(path):
+            return ManifestUtils.build_directory_manifest(path, piece_length)
+        return ManifestUtils.build_manifest(path, piece_length, merkle=merkle, chunking=chunking)
+    
+    @staticmethod
+    def _storage_for_manifest(path: str, manifest: Dict) -> PieceStorage:
+        """Build the storage serving a shared file or directory described by its manifest."""
+        if manifest.get("files") is not None:
+            return MultiFileStorage(path, manifest["files"], manifest["piece_length"])
+        return SingleFileStorage(path, manifest["piece_length"], manifest["total_size"],
+                                 manifest.get("piece_offsets"))
+    
+    def _share_file(self, supersedes: Optional[str] = None):
+        """
+        Share the selected file or directory.
+        
+        Args:
+            supersedes: File ID of a shared file this one is a new version of
+        """
         if not hasattr(self, 'share_file_path'):
             messagebox.showerror("Error", "Please select a file first")
             return
@@ -1441,34 +2398,74 @@ class PeerClient:
             try:
                 self._log(f"Starting file sharing process...")
                 
-                # Calculate file ID (hash of file content)
-                file_id = self._calculate_file_id(self.share_file_path)
-                self._log(f"File ID: {file_id}")
-                
-                # Create directory for this file's chunks
-                file_chunk_dir = os.path.join(self.chunks_directory, file_id)
-                os.makedirs(file_chunk_dir, exist_ok=True)
-                
-                # Split file into chunks
-                self._log(f"Splitting file into chunks (size: {CHUNK_SIZE} bytes)...")
-                num_chunks = self.chunker.split_file(self.share_file_path, file_chunk_dir)
-                
-                if num_chunks is None:
-                    self._log("ERROR: Failed to split file")
-                    messagebox.showerror("Error", "Failed to split file")
+                # Pick the piece size from the file size, then hash the file
+                # and its pieces in one streaming read
+                if os.path.isdir(self.share_file_path):
+                    share_size = sum(entry["length"] for entry in ManifestUtils.list_directory(self.share_file_path))
+                else:
+                    share_size = os.path.getsize(self.share_file_path)
+                piece_length = FileUtils.choose_piece_length(share_size)
+                chunking = CHUNKING_CDC if USE_CONTENT_DEFINED_CHUNKING else CHUNKING_FIXED
+                merkle = USE_MERKLE_FILE_IDS
+                if supersedes:
+                    # Cut the new version the same way as the old one so unchanged pieces match
+                    old_manifest = ManifestUtils.load_manifest(self.manifests_directory, supersedes)
+                    if old_manifest is None:
+                        self._log(f"ERROR: No manifest for {supersedes}")
+                        messagebox.showerror("Error", "The file being updated has no local manifest")
+                        return
+                    if not old_manifest.get("update_secret"):
+                        self._log(f"ERROR: {supersedes} was not published from this peer")
+                        messagebox.showerror("Error", "Only files first shared from this peer can be updated")
+                        return
+                    piece_length = old_manifest["piece_length"]
+                    chunking = old_manifest.get("chunking", CHUNKING_FIXED)
+                    merkle = bool(old_manifest.get("merkle_root"))
+                self._log(f"Hashing file (piece size: {piece_length} bytes)...")
+                manifest = self._build_share_manifest(self.share_file_path, piece_length,
+                                                      merkle=merkle, chunking=chunking)
+                if manifest is None:
+                    self._log("ERROR: Failed to read file")
+                    messagebox.showerror("Error", "Failed to read file")
                     return
                 
-                self._log(f"Created {num_chunks} chunks")
+                file_id = manifest["file_id"]
+                file_size = manifest["total_size"]
+                num_chunks = manifest["num_pieces"]
+                self._log(f"File ID: {file_id}")
+                if manifest.get("files") is not None:
+                    self._log(f"Directory share: {len(manifest['files'])} files in one swarm")
+                if supersedes:
+                    if file_id == supersedes:
+                        self._log("ERROR: The selected file is identical to the version it updates")
+                        messagebox.showerror("Error", "The selected file is identical to the version it updates")
+                        return
+                    manifest["supersedes"] = supersedes
+                    self._log(f"Publishing as an update of {supersedes}")
+                # Secret proving we published this file, needed to publish updates of
+                # it; only its hash is sent to the tracker
+                existing = ManifestUtils.load_manifest(self.manifests_directory, file_id)
+                manifest["update_secret"] = (existing or {}).get("update_secret") or secrets.token_hex(32)
+                ManifestUtils.save_manifest(manifest, self.manifests_directory)
+                
+                # Serve pieces directly from the original file (no chunk copies)
+                storage = self._storage_for_manifest(self.share_file_path, manifest)
+                self.peer_server.register_storage(file_id, storage, manifest)
+                
+                self._log(f"Serving {num_chunks} pieces (size: {piece_length} bytes) from original file")
                 
                 # Register with tracker
                 self._log(f"Registering with tracker...")
-                if self._register_file(file_id, os.path.basename(self.share_file_path), num_chunks):
+                if self._register_file(file_id, os.path.basename(self.share_file_path), num_chunks,
+                                       file_size, piece_length):
                     self._log(f"Successfully shared file! File ID: {file_id}")
                     
                     # Record shared file
                     self.shared_files[file_id] = {
                         "filename": os.path.basename(self.share_file_path),
                         "chunks": num_chunks,
+                        "total_size": file_size,
+                        "piece_length": piece_length,
                         "date_shared": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     }
                     
@@ -1476,10 +2473,10 @@ class PeerClient:
                     self.state_mgr.add_torrent(
                         info_hash=file_id,
                         filename=os.path.basename(self.share_file_path),
-                        total_size=os.path.getsize(self.share_file_path),
-                        piece_length=CHUNK_SIZE,
+                        total_size=file_size,
+                        piece_length=piece_length,
                         total_pieces=num_chunks,
-                        save_path=file_chunk_dir,
+                        save_path=self.share_file_path,
                         status="seeding"
                     )
                     
@@ -1497,6 +2494,7 @@ class PeerClient:
                     
                     messagebox.showinfo("Success", f"File shared successfully!\nFile ID: {file_id}")
                 else:
+                    self.peer_server.unregister_storage(file_id)
                     self._log("ERROR: Failed to register with tracker")
                     messagebox.showerror("Error", "Failed to register with tracker")
             
@@ -1507,6 +2505,25 @@ class PeerClient:
         thread = threading.Thread(target=do_share, daemon=True)
         thread.start()
     
+    def _publish_update(self):
+        """Share the selected file as a new version of the selected shared file."""
+        if not hasattr(self, 'share_file_path'):
+            messagebox.showerror("Error", "Please select the new version with Add File first")
+            return
+        selected = self.shared_tree.selection()
+        if not selected:
+            messagebox.showwarning("No Selection", "Please select the shared file this version replaces")
+            return
+        
+        old_id = selected[0]  # The iid is the full file_id
+        old_name = self.shared_files.get(old_id, {}).get("filename", old_id)
+        if not messagebox.askyesno(
+                "Publish Update",
+                f"Publish {os.path.basename(self.share_file_path)} as a new version of {old_name}?\n\n"
+                f"Peers seeding {old_id} will fetch only the changed pieces."):
+            return
+        self._share_file(supersedes=old_id)
+    
     def _remove_shared_file(self):
         """Remove selected shared file."""
         selected = self.shared_tree.selection()
@@ -1527,7 +2544,7 @@ class PeerClient:
             f"Remove '{filename}' from shared files?\n\nThis will:\n" +
             "• Unregister from tracker\n" +
             "• Remove from state\n" +
-            "• Delete chunks from disk\n\n" +
+            "• Delete chunk copies from disk (original file is kept)\n\n" +
             "Continue?",
             icon='warning'
         )
@@ -1562,7 +2579,9 @@ class PeerClient:
                     self.state_mgr.dirty = True
                     self._log(f"Removed from state")
                 
-                # 4. Delete chunks from disk
+                # 4. Stop serving and delete legacy chunks from disk
+                self.peer_server.unregister_storage(file_id)
+                ManifestUtils.delete_manifest(self.manifests_directory, file_id)
                 file_chunk_dir = os.path.join(self.chunks_directory, file_id)
                 if os.path.exists(file_chunk_dir):
                     import shutil
@@ -1628,6 +2647,16 @@ class PeerClient:
         else:
             file_id = input_value
         
+        self._start_download(file_id)
+    
+    def _start_download(self, file_id: str, auto_share: bool = False):
+        """
+        Download a file by ID on a background thread.
+        
+        Args:
+            file_id: File identifier
+            auto_share: Share the file once complete without asking (update downloads)
+        """
         def do_download():
             try:
                 self._log(f"Starting download for file ID: {file_id}")
@@ -1644,9 +2673,19 @@ class PeerClient:
                 filename = file_info.get("filename", "downloaded_file")
                 num_chunks = file_info.get("num_chunks", 0)
                 peers = file_info.get("peers", [])
+                # Use the sharer's piece size; older sharers don't advertise one
+                piece_length = file_info.get("piece_length") or CHUNK_SIZE
+                if not FileUtils.validate_chunk_size(piece_length):
+                    self._log(f"ERROR: Unsupported piece size {piece_length}")
+                    messagebox.showerror("Error", f"Unsupported piece size {piece_length}")
+                    return
+                
+                # Older sharers don't publish total_size: assume full pieces, trim at the end
+                size_known = bool(file_info.get("total_size"))
+                total_size = estimate_file_size(file_info.get("total_size"), num_chunks, piece_length)
                 
                 # Calculate size
-                size_bytes = num_chunks * CHUNK_SIZE
+                size_bytes = total_size
                 if size_bytes > 1024*1024:
                     size_str = f"{size_bytes/1024/1024:.1f} MB"
                 else:
@@ -1659,6 +2698,78 @@ class PeerClient:
                     messagebox.showerror("Error", "No peers have this file")
                     return
                 
+                # Merkle file IDs: verify each piece with a proof against the root
+                merkle_root = file_info.get("merkle_root")
+                if merkle_root and merkle_root[:16] != file_id:
+                    self._log("⚠️ Tracker returned a Merkle root that does not match the file ID")
+                    merkle_root = None
+                
+                # Fetch per-piece digests so every piece can be verified on arrival and
+                # pieces already held locally (e.g. an older version) can be reused;
+                # content-defined pieces also need the manifest's piece offsets to be located,
+                # and directory shares need its file list to rebuild the tree
+                content_defined = file_info.get("chunking") == CHUNKING_CDC
+                directory = bool(file_info.get("num_files"))
+                piece_hashes = None
+                piece_offsets = None
+                files = None
+                if file_info.get("has_manifest"):
+                    manifest = self._query_manifest(file_id)
+                    if manifest and len(manifest.get("piece_hashes", [])) == num_chunks:
+                        piece_hashes = manifest["piece_hashes"]
+                        piece_offsets = manifest.get("piece_offsets")
+                        files = manifest.get("files")
+                        self._log(f"Fetched manifest: {num_chunks} piece digests")
+                if directory:
+                    if not (size_known and files and FileUtils.validate_file_list(files, total_size)):
+                        self._log("ERROR: Directory file list unavailable")
+                        messagebox.showerror("Error", "Directory file list unavailable")
+                        return
+                    self._log(f"Directory share: {len(files)} files")
+                else:
+                    files = None
+                if content_defined:
+                    if not (size_known and piece_offsets and len(piece_offsets) == num_chunks
+                            and FileUtils.validate_piece_offsets(piece_offsets, total_size)):
+                        self._log("ERROR: Content-defined piece layout unavailable")
+                        messagebox.showerror("Error", "Content-defined piece layout unavailable")
+                        return
+                    self._log("Using content-defined piece boundaries")
+                else:
+                    piece_offsets = None
+                if piece_hashes is not None and merkle_root is not None:
+                    # The Merkle root commits to these digests: check them before trusting them
+                    try:
+                        consistent = MerkleTree(piece_hashes).root == merkle_root
+                    except ValueError:
+                        consistent = False
+                    if not consistent:
+                        self._log("⚠️ Manifest digests do not match the Merkle root; ignoring them")
+                        piece_hashes = None
+                if merkle_root is not None:
+                    self._log("Verifying pieces with Merkle proofs")
+                elif piece_hashes is None:
+                    self._log("⚠️ No piece manifest published; pieces cannot be verified")
+                
+                def piece_is_valid(chunk_idx, digest, response):
+                    """Check a received piece's digest against the Merkle root or manifest."""
+                    if merkle_root is not None:
+                        return MerkleTree.verify_proof(
+                            digest, chunk_idx, num_chunks,
+                            response.get("proof") or [], merkle_root
+                        )
+                    if piece_hashes is not None:
+                        return digest == piece_hashes[chunk_idx]
+                    return True
+                
+                def piece_size_ok(chunk_idx, length):
+                    """Check a received piece's length (only piece_length bounds it without a known size)."""
+                    if size_known:
+                        return length == target.piece_size(chunk_idx)
+                    if chunk_idx == num_chunks - 1:
+                        return 0 < length <= piece_length
+                    return length == piece_length
+                
                 # Add to active downloads display
                 self.active_downloads_tree.insert("", 0, iid=file_id, values=(
                     filename,
@@ -1671,39 +2782,139 @@ class PeerClient:
                     "0 KB/s"
                 ), tags=("downloading",))
                 
-                # Download chunks
-                download_dir = os.path.join(self.downloads_directory, file_id)
-                os.makedirs(download_dir, exist_ok=True)
+                # Write pieces straight into a preallocated target file
+                output_file = os.path.join(self.downloads_directory, filename)
+                if self.peer_server.serves_path(output_file) or (files is not None and os.path.exists(output_file)):
+                    # Don't replace a file being seeded (e.g. the version this one updates),
+                    # and don't merge a directory share into an existing directory
+                    root, ext = os.path.splitext(output_file)
+                    output_file = f"{root}.{file_id[:8]}{ext}"
+                if files is not None:
+                    target = MultiFileStorage(output_file + ".part", files, piece_length)
+                else:
+                    target = SingleFileStorage(output_file + ".part", piece_length, total_size, piece_offsets)
+                if not target.preallocate():
+                    self._log("ERROR: Could not create output file")
+                    messagebox.showerror("Error", "Could not create output file")
+                    return
+                final_size = total_size
+                
+                # Optionally (and only with a known size) receive pieces in place through an
+                # mmap of the file; otherwise hand verified pieces to background disk writers
+                in_place = USE_MMAP_RECEIVE and size_known and target.enable_mmap()
+                writer = None
+                if in_place:
+                    self._log("Receiving pieces directly into the mapped output file")
+                else:
+                    writer = DiskWriter(target, DISK_WRITER_THREADS, DISK_QUEUE_BYTES,
+                                        release=self.buffer_pool.release)
+                    self.disk_writers[file_id] = writer
+                
+                def store_piece(chunk_idx, data):
+                    """Write a piece that wasn't received in place (False if cancelled or failed)."""
+                    if writer is not None:
+                        return writer.submit(chunk_idx, data)
+                    written = target.write_piece(chunk_idx, data)
+                    self.buffer_pool.release(data)
+                    return written
                 
                 self._log(f"Downloading {num_chunks} chunks from {len(peers)} peer(s) using parallel download...")
                 downloaded_chunks = 0
+                downloaded_bytes = 0
+                local_pieces = []  # Pieces copied from other local files with the same digest
+                piece_digests = [None] * num_chunks  # Verified digest of every piece, kept for resharing
                 start_time = time.time()
                 
                 # Use thread pool for parallel downloads
                 from concurrent.futures import ThreadPoolExecutor, as_completed
                 
                 def download_chunk_task(chunk_idx):
-                    """Download a single chunk from available peers."""
+                    """
+                    Download a single chunk from available peers.
+                    
+                    Returns (chunk_idx, None, length, peer); length is 0 on
+                    failure. Pieces not received in place are queued on the
+                    disk writer, which blocks here while its queue is full.
+                    While peers answer "choked", asks again every
+                    CHOKED_RETRY_DELAY seconds, up to CHOKED_RETRY_LIMIT
+                    times; a paused download stops asking until resumed.
+                    """
                     # Round-robin or random peer selection for load balancing
                     import random
                     shuffled_peers = random.sample(peers, len(peers))
+                    into = target.piece_buffer(chunk_idx) if in_place else None
+                    # Without a known file size, piece_length bounds the short last piece
+                    max_size = target.piece_size(chunk_idx) if size_known else piece_length
                     
-                    for peer in shuffled_peers:
-                        try:
-                            chunk_data = self._download_chunk(
-                                peer["host"], peer["port"], file_id, chunk_idx
-                            )
-                            if chunk_data:
-                                self._log(f"✓ Chunk {chunk_idx}/{num_chunks-1} from {peer['host']}:{peer['port']}")
-                                return (chunk_idx, chunk_data, peer)
-                        except Exception as e:
-                            logger.debug(f"Peer {peer['host']}:{peer['port']} failed for chunk {chunk_idx}: {e}")
-                            continue
+                    try:
+                        # A piece already held under another file is copied locally
+                        if piece_hashes is not None:
+                            local_data = self.peer_server.piece_store.read(piece_hashes[chunk_idx])
+                            if local_data is not None and (into is None or len(local_data) == len(into)):
+                                if into is not None:
+                                    into[:] = local_data
+                                elif not store_piece(chunk_idx, local_data):
+                                    return (chunk_idx, None, 0, None)
+                                local_pieces.append(chunk_idx)
+                                piece_digests[chunk_idx] = piece_hashes[chunk_idx]
+                                return (chunk_idx, None, len(local_data), None)
+                        
+                        retries = 0
+                        while True:
+                            choked = False
+                            for peer in shuffled_peers:
+                                try:
+                                    chunk_data, response = self._download_chunk(
+                                        peer["host"], peer["port"], file_id, chunk_idx,
+                                        want_proof=merkle_root is not None, into=into,
+                                        max_size=max_size
+                                    )
+                                    if not chunk_data:
+                                        choked = choked or response.get("status") == "choked"
+                                        continue
+                                    if not piece_size_ok(chunk_idx, len(chunk_data)):
+                                        self._log(f"✗ Chunk {chunk_idx} from {peer['host']}:{peer['port']} has the wrong size")
+                                        self.buffer_pool.release(chunk_data)
+                                        continue
+                                    digest = ManifestUtils.piece_digest(chunk_data)
+                                    if not piece_is_valid(chunk_idx, digest, response):
+                                        # Corrupt or truncated: reject and try the next peer
+                                        self._log(f"✗ Chunk {chunk_idx} from {peer['host']}:{peer['port']} failed verification")
+                                        self.buffer_pool.release(chunk_data)
+                                        continue
+                                    piece_digests[chunk_idx] = digest
+                                    self._log(f"✓ Chunk {chunk_idx}/{num_chunks-1} from {peer['host']}:{peer['port']}")
+                                    chunk_len = len(chunk_data)
+                                    if chunk_data is not into and not store_piece(chunk_idx, chunk_data):
+                                        return (chunk_idx, None, 0, None)  # Download cancelled
+                                    return (chunk_idx, None, chunk_len, peer)
+                                except Exception as e:
+                                    logger.debug(f"Peer {peer['host']}:{peer['port']} failed for chunk {chunk_idx}: {e}")
+                                    continue
+                            
+                            # Peers that have the piece but no free upload slot may unchoke us shortly
+                            if not choked or self.download_cancelled.get(file_id, False):
+                                break
+                            if retries >= CHOKED_RETRY_LIMIT:
+                                self._log(f"✗ Chunk {chunk_idx}: peers are still choking us")
+                                break
+                            retries += 1
+                            time.sleep(CHOKED_RETRY_DELAY)
+                            while self.download_paused.get(file_id, False) and \
+                                    not self.download_cancelled.get(file_id, False):
+                                time.sleep(0.5)
+                    finally:
+                        if into is not None:
+                            into.release()
                     
-                    return (chunk_idx, None, None)
+                    return (chunk_idx, None, 0, None)
+                
+                # Enough workers to fill every peer's pipeline window
+                num_workers = max(MAX_PARALLEL_DOWNLOADS, PIPELINE_WINDOW * len(peers))
+                num_workers = min(num_workers, MAX_DOWNLOAD_WORKERS, num_chunks)
                 
                 # Download chunks in parallel with progress tracking
-                with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_DOWNLOADS, num_chunks)) as executor:
+                with ThreadPoolExecutor(max_workers=num_workers) as executor:
                     # Submit all chunk download tasks
                     future_to_chunk = {executor.submit(download_chunk_task, i): i for i in range(num_chunks)}
                     
@@ -1713,71 +2924,88 @@ class PeerClient:
                         if self.download_cancelled.get(file_id, False):
                             self._log(f"Download cancelled by user")
                             executor.shutdown(wait=False, cancel_futures=True)
+                            self.session_pool.cancel_file(file_id)
+                            self._close_disk_writer(file_id)
+                            target.close()
                             return
                         
                         # Check if download is paused
                         while self.download_paused.get(file_id, False):
                             time.sleep(0.5)
                             if self.download_cancelled.get(file_id, False):
+                                self._close_disk_writer(file_id)
+                                target.close()
                                 return
                         
-                        chunk_idx, chunk_data, peer = future.result()
+                        chunk_idx, chunk_data, chunk_len, peer = future.result()
                         
-                        if chunk_data:
-                            if self.chunker.save_chunk(download_dir, chunk_idx, chunk_data):
-                                downloaded_chunks += 1
-                                # Show progress
-                                progress_pct = (downloaded_chunks / num_chunks) * 100
+                        if chunk_len:
+                            if chunk_idx == num_chunks - 1:
+                                final_size = target.piece_offset(chunk_idx) + chunk_len
+                            downloaded_chunks += 1
+                            downloaded_bytes += chunk_len
+                            # Show progress
+                            progress_pct = (downloaded_chunks / num_chunks) * 100
+                            
+                            # Calculate download speed
+                            elapsed = time.time() - start_time
+                            if elapsed > 0:
+                                speed_kbps = (downloaded_bytes / elapsed) / 1024
+                                speed_str = f"{speed_kbps:.2f} KB/s"
                                 
-                                # Calculate download speed
-                                elapsed = time.time() - start_time
-                                if elapsed > 0:
-                                    speed_kbps = (downloaded_chunks * CHUNK_SIZE / elapsed) / 1024
-                                    speed_str = f"{speed_kbps:.2f} KB/s"
-                                    
-                                    # Calculate ETA
-                                    remaining_chunks = num_chunks - downloaded_chunks
-                                    remaining_bytes = remaining_chunks * CHUNK_SIZE
-                                    if speed_kbps > 0:
-                                        eta_seconds = remaining_bytes / (speed_kbps * 1024)
-                                        if eta_seconds < 60:
-                                            eta_str = f"{int(eta_seconds)}s"
-                                        elif eta_seconds < 3600:
-                                            eta_str = f"{int(eta_seconds/60)}m {int(eta_seconds%60)}s"
-                                        else:
-                                            eta_str = f"{int(eta_seconds/3600)}h {int((eta_seconds%3600)/60)}m"
+                                # Calculate ETA
+                                remaining_bytes = max(0, total_size - downloaded_bytes)
+                                if speed_kbps > 0:
+                                    eta_seconds = remaining_bytes / (speed_kbps * 1024)
+                                    if eta_seconds < 60:
+                                        eta_str = f"{int(eta_seconds)}s"
+                                    elif eta_seconds < 3600:
+                                        eta_str = f"{int(eta_seconds/60)}m {int(eta_seconds%60)}s"
                                     else:
-                                        eta_str = "∞"
+                                        eta_str = f"{int(eta_seconds/3600)}h {int((eta_seconds%3600)/60)}m"
                                 else:
-                                    speed_str = "0 KB/s"
                                     eta_str = "∞"
-                                
-                                # Update active downloads tree
-                                try:
-                                    self.active_downloads_tree.item(file_id, values=(
-                                        filename,
-                                        size_str,
-                                        f"{progress_pct:.1f}%",
-                                        "⬇️ Downloading",
-                                        len(peers),
-                                        len(peers),
-                                        speed_str,
-                                        "0 KB/s",
-                                        eta_str
-                                    ))
-                                except:
-                                    pass
-                                
-                                self._log(f"📥 Progress: {downloaded_chunks}/{num_chunks} chunks ({progress_pct:.1f}%)")
                             else:
-                                self._log(f"✗ Failed to save chunk {chunk_idx}")
+                                speed_str = "0 KB/s"
+                                eta_str = "∞"
+                            
+                            # Update active downloads tree
+                            try:
+                                self.active_downloads_tree.item(file_id, values=(
+                                    filename,
+                                    size_str,
+                                    f"{progress_pct:.1f}%",
+                                    "⬇️ Downloading",
+                                    len(peers),
+                                    len(peers),
+                                    speed_str,
+                                    "0 KB/s",
+                                    eta_str
+                                ))
+                            except:
+                                pass
+                            
+                            self._log(f"📥 Progress: {downloaded_chunks}/{num_chunks} chunks ({progress_pct:.1f}%)")
                         else:
                             self._log(f"✗ Could not download chunk {chunk_idx} from any peer")
                 
-                # Merge chunks
+                if local_pieces:
+                    self._log(f"♻️ {len(local_pieces)} pieces copied from files already held locally")
+                
+                # Wait for queued pieces to reach the disk
+                if writer is not None:
+                    failed = writer.flush()
+                    for chunk_idx in failed:
+                        self._log(f"✗ Failed to save chunk {chunk_idx}")
+                    downloaded_chunks -= len(failed)
+                    disk = writer.get_stats()
+                    self._log(f"Disk writes: {disk['pieces_written']} pieces in {disk['writes']} writes, "
+                              f"avg {disk['avg_write_ms']:.1f} ms, peak queue {disk['peak_depth']} pieces")
+                    self._close_disk_writer(file_id)
+                
+                # Finalize: trim if needed and rename into place (no second pass)
                 if downloaded_chunks == num_chunks:
-                    output_file = os.path.join(self.downloads_directory, filename)
-                    self._log(f"Merging {num_chunks} chunks...")
+                    self._log(f"Finalizing {output_file}...")
                     
                     # Update status
                     try:
@@ -1795,19 +3023,19 @@ class PeerClient:
                     except:
                         pass
                     
-                    if self.chunker.merge_chunks(download_dir, output_file, num_chunks):
+                    if target.finalize(output_file, final_size):
                         self._log(f"Download complete! File saved to: {output_file}")
                         
                         # Get file size
                         try:
-                            file_size = os.path.getsize(output_file)
+                            file_size = target.total_size if files is not None else os.path.getsize(output_file)
                             size_str = f"{file_size/1024/1024:.1f} MB" if file_size > 1024*1024 else f"{file_size/1024:.1f} KB"
                         except:
                             size_str = "Unknown"
                         
                         # Calculate average speed
                         elapsed = time.time() - start_time
-                        avg_speed = (downloaded_chunks * CHUNK_SIZE / elapsed) / 1024 if elapsed > 0 else 0
+                        avg_speed = (downloaded_bytes / elapsed) / 1024 if elapsed > 0 else 0
                         
                         # Record in download history
                         self.download_history.append({
@@ -1831,19 +3059,39 @@ class PeerClient:
                         self._filter_download_history()
                         
                         # Ask user if they want to share the downloaded file
-                        share_response = messagebox.askyesno(
+                        share_response = auto_share or messagebox.askyesno(
                             "Share Downloaded File",
                             f"Would you like to share this file?\n\n{filename}\n\nFile ID: {file_id}"
                         )
                         
                         if share_response:
-                            self._auto_share_file(output_file, file_id, num_chunks)
-                            messagebox.showinfo("Success", 
-                                f"File downloaded and shared successfully!\n\n{output_file}\n\nFile ID: {file_id}")
+                            # Reshare from the piece layout and digests verified above
+                            share_manifest = {
+                                "file_id": file_id,
+                                "total_size": final_size,
+                                "piece_length": piece_length,
+                                "num_pieces": num_chunks,
+                                "piece_hashes": piece_digests
+                            }
+                            if merkle_root is not None:
+                                share_manifest["merkle_root"] = merkle_root
+                            if piece_offsets is not None:
+                                share_manifest["chunking"] = CHUNKING_CDC
+                                share_manifest["piece_offsets"] = piece_offsets
+                            if files is not None:
+                                share_manifest["name"] = os.path.basename(os.path.normpath(output_file))
+                                share_manifest["files"] = files
+                            self._auto_share_file(output_file, share_manifest,
+                                                  digests_verified=piece_hashes is not None or merkle_root is not None)
+                            if auto_share:
+                                self._log(f"🔄 Update {file_id} downloaded and shared: {output_file}")
+                            else:
+                                messagebox.showinfo("Success", 
+                                    f"File downloaded and shared successfully!\n\n{output_file}\n\nFile ID: {file_id}")
                         else:
                             messagebox.showinfo("Success", f"File downloaded successfully!\n{output_file}")
                     else:
-                        self._log("ERROR: Failed to merge chunks")
+                        self._log("ERROR: Failed to finalize download")
                         
                         # Update status to error
                         try:
@@ -1879,8 +3127,9 @@ class PeerClient:
                         self.state_mgr.dirty = True
                         self._save_state()
                         self._filter_download_history()
-                        messagebox.showerror("Error", "Failed to merge chunks")
+                        messagebox.showerror("Error", "Failed to finalize download")
                 else:
+                    target.close()
                     self._log(f"ERROR: Downloaded {downloaded_chunks}/{num_chunks} chunks")
                     
                     # Update status to error
@@ -1926,43 +3175,74 @@ class PeerClient:
         thread = threading.Thread(target=do_download, daemon=True)
         thread.start()
     
-    def _calculate_file_id(self, filepath: str) -> str:
-        """Calculate file ID using SHA256 hash of file content."""
-        sha256_hash = hashlib.sha256()
-        with open(filepath, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()[:16]  # First 16 characters
-    
-    def _auto_share_file(self, filepath: str, file_id: str, num_chunks: int):
-        """Automatically share a downloaded file."""
+    def _auto_share_file(self, filepath: str, manifest: Dict, digests_verified: bool = False) -> bool:
+        """
+        Automatically share a downloaded file or directory.
+        
+        If the download checked its pieces against a tracker manifest or a
+        Merkle root, seeding starts from those digests without reading the
+        file again. A Merkle file ID is checked against them here; a
+        content-hash file ID covers the whole content, so it is checked by a
+        background re-hash (a third read of the file, after the download and
+        its piece checks) that stops seeding on a mismatch. Until then the
+        digests are not sent to the tracker. Pieces nothing checked are
+        never served before the file is hashed like a new share.
+        
+        Args:
+            filepath: Downloaded file or directory
+            manifest: Manifest built from the download's piece digests
+            digests_verified: The digests were checked against a tracker
+                manifest or Merkle root during the download
+        
+        Returns:
+            True if the file is now being seeded
+        """
+        file_id = manifest["file_id"]
+        piece_length = manifest["piece_length"]
         try:
             self._log(f"Auto-sharing downloaded file: {os.path.basename(filepath)}")
             
-            # Create directory for this file's chunks
-            file_chunk_dir = os.path.join(self.chunks_directory, file_id)
-            os.makedirs(file_chunk_dir, exist_ok=True)
-            
-            # Split file into chunks
-            self._log(f"Splitting file into chunks (size: {CHUNK_SIZE} bytes)...")
-            result_chunks = self.chunker.split_file(filepath, file_chunk_dir)
-            
-            if result_chunks is None:
-                self._log("ERROR: Failed to split file for sharing")
-                messagebox.showerror("Error", "Failed to split file for sharing")
+            verify_later = False
+            if not digests_verified or None in manifest["piece_hashes"]:
+                # Nothing vouches for the digests (or one wasn't recorded): hash the
+                # file like a new share before serving any of it
+                manifest = self._build_share_manifest(filepath, piece_length,
+                                                      merkle=bool(manifest.get("merkle_root")),
+                                                      chunking=manifest.get("chunking", CHUNKING_FIXED))
+            elif manifest.get("merkle_root"):
+                try:
+                    if MerkleTree(manifest["piece_hashes"]).root != manifest["merkle_root"]:
+                        manifest = None
+                except ValueError:
+                    manifest = None
+            else:
+                verify_later = True
+            if manifest is None or manifest["file_id"] != file_id:
+                self._log("ERROR: Downloaded file does not match its file ID")
+                messagebox.showerror("Error", "Downloaded file does not match its file ID")
                 return False
+            ManifestUtils.save_manifest(manifest, self.manifests_directory)
             
-            self._log(f"Created {result_chunks} chunks for sharing")
+            # Seed straight from the downloaded file (no chunk copies)
+            file_size = manifest["total_size"]
+            result_chunks = manifest["num_pieces"]
+            storage = self._storage_for_manifest(filepath, manifest)
+            self.peer_server.register_storage(file_id, storage, manifest)
+            
+            self._log(f"Serving {result_chunks} pieces from {filepath}")
             
             # Register with tracker
             self._log(f"Registering downloaded file with tracker...")
-            if self._register_file(file_id, os.path.basename(filepath), result_chunks):
+            if self._register_file(file_id, os.path.basename(filepath), result_chunks,
+                                   file_size, piece_length, publish_manifest=not verify_later):
                 self._log(f"Successfully shared downloaded file! File ID: {file_id}")
                 
                 # Record shared file
                 self.shared_files[file_id] = {
                     "filename": os.path.basename(filepath),
                     "chunks": result_chunks,
+                    "total_size": file_size,
+                    "piece_length": piece_length,
                     "date_shared": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     "source": "downloaded",  # Mark as downloaded and reshared
                     "completed_pieces": result_chunks
@@ -1972,10 +3252,10 @@ class PeerClient:
                 self.state_mgr.add_torrent(
                     info_hash=file_id,
                     filename=os.path.basename(filepath),
-                    total_size=os.path.getsize(filepath),
-                    piece_length=CHUNK_SIZE,
+                    total_size=file_size,
+                    piece_length=piece_length,
                     total_pieces=result_chunks,
-                    save_path=file_chunk_dir,
+                    save_path=filepath,
                     status="seeding"
                 )
                 
@@ -1990,8 +3270,12 @@ class PeerClient:
                 self._announce_to_tracker("started", file_id)
                 
                 self._update_shared_files()
+                if verify_later:
+                    threading.Thread(target=self._verify_reshared_file,
+                                     args=(filepath, manifest), daemon=True).start()
                 return True
             else:
+                self.peer_server.unregister_storage(file_id)
                 self._log("ERROR: Failed to register downloaded file with tracker")
                 messagebox.showerror("Error", "Failed to register file with tracker")
                 return False
@@ -2001,8 +3285,51 @@ class PeerClient:
             messagebox.showerror("Error", f"Auto-share failed: {e}")
             return False
     
-    def _register_file(self, file_id: str, filename: str, num_chunks: int) -> bool:
-        """Register file with tracker."""
+    def _verify_reshared_file(self, filepath: str, manifest: Dict):
+        """
+        Re-hash a reshared download and stop seeding it if its file ID doesn't match.
+        
+        Once the file ID checks out, the file is registered again to publish
+        its piece digests.
+        
+        Args:
+            filepath: Shared file or directory
+            manifest: Manifest it is being seeded with
+        """
+        file_id = manifest["file_id"]
+        rebuilt = self._build_share_manifest(filepath, manifest["piece_length"],
+                                             chunking=manifest.get("chunking", CHUNKING_FIXED))
+        if rebuilt is not None and rebuilt["file_id"] == file_id and \
+                rebuilt["piece_hashes"] == manifest["piece_hashes"]:
+            logger.info(f"Verified reshared file {file_id}")
+            self._register_file(file_id, os.path.basename(filepath), manifest["num_pieces"],
+                                manifest["total_size"], manifest["piece_length"])
+            return
+        
+        self._log(f"ERROR: {os.path.basename(filepath)} does not match file ID {file_id}; no longer sharing it")
+        try:
+            self._announce_to_tracker("stopped", file_id)
+            self.peer_server.unregister_storage(file_id)
+            ManifestUtils.delete_manifest(self.manifests_directory, file_id)
+            self.shared_files.pop(file_id, None)
+            if file_id in self.state_mgr.state['torrents']:
+                del self.state_mgr.state['torrents'][file_id]
+                self.state_mgr.dirty = True
+            self._save_state()
+            self._update_shared_files()
+        except Exception as e:
+            self._log(f"ERROR stopping unverified share: {e}")
+    
+    def _register_file(self, file_id: str, filename: str, num_chunks: int,
+                       total_size: Optional[int] = None,
+                       piece_length: Optional[int] = None,
+                       publish_manifest: bool = True) -> bool:
+        """
+        Register file with tracker, publishing its piece manifest if we have one.
+        
+        The tracker keeps the first manifest it is sent for a file ID, so
+        publish_manifest=False holds back digests that are not verified yet.
+        """
         try:
             sock = SocketUtils.connect_to_server(
                 self.tracker_host_var.get(), 
@@ -2011,9 +3338,42 @@ class PeerClient:
             if not sock:
                 return False
             
+            piece_hashes = merkle_root = piece_offsets = files = supersedes = None
+            update_key = update_proof = None
+            manifest = ManifestUtils.load_manifest(self.manifests_directory, file_id)
+            if manifest and manifest.get("num_pieces") == num_chunks:
+                piece_length = manifest["piece_length"]
+                merkle_root = manifest.get("merkle_root")
+                if not publish_manifest:
+                    # Sent once verified; the tracker would keep unverified digests for good
+                    pass
+                elif manifest.get("piece_offsets") is not None:
+                    # Content-defined pieces can't be located without the full layout
+                    piece_hashes = manifest["piece_hashes"]
+                    piece_offsets = manifest["piece_offsets"]
+                elif not merkle_root or manifest.get("supersedes"):
+                    # Merkle downloaders verify against the root; no need to ship every
+                    # digest. Updates ship them so seeders of the old version can find
+                    # reusable pieces
+                    piece_hashes = manifest["piece_hashes"]
+                if publish_manifest:
+                    # Directory shares: downloaders rebuild the tree from this list
+                    files = manifest.get("files")
+                supersedes = manifest.get("supersedes")
+                if manifest.get("update_secret"):
+                    update_key = ManifestUtils.update_key(manifest["update_secret"])
+                if supersedes:
+                    # The tracker only links the update if we hold the old version's secret
+                    old_manifest = ManifestUtils.load_manifest(self.manifests_directory, supersedes)
+                    update_proof = old_manifest.get("update_secret") if old_manifest else None
+            
             message = MessageBuilder.register_message(
                 file_id, filename, num_chunks, self.peer_id, 
-                self.local_ip, self.peer_port
+                self.local_ip, self.peer_port, total_size=total_size,
+                piece_length=piece_length, piece_hashes=piece_hashes,
+                merkle_root=merkle_root, piece_offsets=piece_offsets,
+                supersedes=supersedes, files=files,
+                update_key=update_key, update_proof=update_proof
             )
             
             if SocketUtils.send_message(sock, message):
@@ -2035,6 +3395,9 @@ class PeerClient:
             if not file_info:
                 return {"seeders": 0, "leechers": 0}
             
+            if file_info.get("superseded_by"):
+                self._on_update_available(file_id, file_info["superseded_by"])
+            
             peers = file_info.get("peers", [])
             # In this implementation, we don't track seeder/leecher distinction at tracker level
             # So we'll consider all peers as potential seeders
@@ -2047,6 +3410,46 @@ class PeerClient:
             logger.error(f"Error querying peer counts: {e}")
             return {"seeders": 0, "leechers": 0}
     
+    def _on_update_available(self, old_id: str, new_id: str):
+        """
+        Handle the tracker reporting a newer version of a seeded file.
+        
+        Unless AUTO_FETCH_UPDATES is set, the user is asked first. The new
+        version is then downloaded and shared; pieces whose digests match
+        pieces of the old version (or any other local file) are copied from
+        disk instead of fetched.
+        
+        Args:
+            old_id: File ID being seeded
+            new_id: File ID of the version that supersedes it
+        """
+        if old_id not in self.shared_files or new_id in self.shared_files:
+            return
+        with self.update_lock:
+            if time.time() - self.update_downloads.get(new_id, 0) < UPDATE_RETRY_INTERVAL:
+                return
+            self.update_downloads[new_id] = time.time()
+        
+        filename = self.shared_files[old_id].get("filename", old_id)
+        self._log(f"🔄 New version of {filename} available: {old_id[:8]}... → {new_id[:8]}...")
+        if AUTO_FETCH_UPDATES:
+            self._start_download(new_id, auto_share=True)
+            return
+        
+        def confirm():
+            if messagebox.askyesno(
+                    "Update Available",
+                    f"A new version of {filename} was published.\n\n"
+                    f"Download and share {new_id}?"):
+                self._start_download(new_id, auto_share=True)
+            else:
+                with self.update_lock:
+                    self.update_downloads[new_id] = float("inf")  # Don't ask again this session
+                self._log(f"Skipped update {new_id[:8]}... of {filename}")
+        
+        # Don't hold up the announce or peer-count thread while the dialog is open
+        threading.Thread(target=confirm, daemon=True).start()
+    
     def _update_peer_counts_cache(self):
         """Update peer counts cache for all shared files."""
         for file_id in self.shared_files.keys():
@@ -2077,8 +3480,8 @@ class PeerClient:
             self._log(f"Query error: {e}")
             return None
     
-    def _search_by_filename(self, filename: str) -> Optional[Dict]:
-        """Search for files by filename on tracker."""
+    def _query_manifest(self, file_id: str) -> Optional[Dict]:
+        """Fetch the piece manifest for a file from the tracker."""
         try:
             sock = SocketUtils.connect_to_server(
                 self.tracker_host_var.get(),
@@ -2087,51 +3490,81 @@ class PeerClient:
             if not sock:
                 return None
             
-            message = MessageBuilder.search_by_name_message(filename)
+            message = MessageBuilder.manifest_query_message(file_id)
             
             if SocketUtils.send_message(sock, message):
                 response = SocketUtils.receive_message(sock)
                 sock.close()
-                return response if response else None
+                return response if response and response.get("status") == "success" else None
             
             sock.close()
             return None
         
         except Exception as e:
-            self._log(f"Search error: {e}")
+            self._log(f"Manifest query error: {e}")
             return None
     
-    def _download_chunk(self, host: str, port: int, file_id: str, chunk_index: int) -> Optional[bytes]:
-        """Download a chunk from a peer."""
+    def _search_by_filename(self, filename: str) -> Optional[Dict]:
+        """Search for files by filename on tracker."""
         try:
-            sock = SocketUtils.connect_to_server(host, port, timeout=DOWNLOAD_TIMEOUT)
+            sock = SocketUtils.connect_to_server(
+                self.tracker_host_var.get(),
+                int(self.tracker_port_var.get())
+            )
             if not sock:
                 return None
             
-            message = MessageBuilder.chunk_request_message(file_id, chunk_index)
-            
-            if not SocketUtils.send_message(sock, message):
-                sock.close()
-                return None
+            message = MessageBuilder.search_by_name_message(filename)
             
-            response = SocketUtils.receive_message(sock, timeout=DOWNLOAD_TIMEOUT)
-            if not response or response.get("status") != "success":
+            if SocketUtils.send_message(sock, message):
+                response = SocketUtils.receive_message(sock)
                 sock.close()
-                return None
+                return response if response else None
             
-            chunk_size = response.get("chunk_size", 0)
-            chunk_data = SocketUtils.receive_chunk_data(sock, chunk_size, timeout=DOWNLOAD_TIMEOUT)
             sock.close()
+            return None
+        
+        except Exception as e:
+            self._log(f"Search error: {e}")
+            return None
+    
+    def _download_chunk(self, host: str, port: int, file_id: str, chunk_index: int,
+                        want_proof: bool = False, into: Optional[memoryview] = None,
+                        max_size: Optional[int] = None):
+        """
+        Download a chunk from a peer over a pooled session.
+        
+        If into is given (a view of the piece in a mapped output file), the
+        chunk is received straight into it and into is returned as the data.
+        A chunk announced larger than max_size is refused before anything
+        is allocated for it.
+        
+        Returns:
+            (chunk data or None, CHUNK_RESPONSE header or {}); a piece the
+            peer refused has status "not_found" or "choked"
+        """
+        try:
+            chunk_data, response = self.session_pool.request_piece(
+                host, port, file_id, chunk_index, want_proof, into, max_size
+            )
+            if response.get("status") != "success":
+                return None, response
             
             # Record statistics
             if chunk_data:
                 self.stats.add_download(len(chunk_data), f"{host}:{port}", file_id, chunk_index)
             
-            return chunk_data
+            return chunk_data, response
         
         except Exception as e:
             self._log(f"Chunk download error: {e}")
-            return None
+            return None, {}
+    
+    def _close_disk_writer(self, file_id: str):
+        """Stop a download's disk writer (unwritten pieces are dropped)."""
+        writer = self.disk_writers.pop(file_id, None)
+        if writer is not None:
+            writer.close()
     
     def on_closing(self):
         """Handle window closing."""
@@ -2149,6 +3582,7 @@ class PeerClient:
         # Shutdown state manager cleanly
         self.state_mgr.shutdown()
         
+        self.session_pool.close_all()
         self.peer_server.stop()
         self.root.destroy()
     
@@ -2172,7 +3606,9 @@ class PeerClient:
                     host='127.0.0.1',
                     port=self.peer_port,
                     filename=file_info.get('filename', 'unknown'),
-                    num_chunks=file_info.get('chunks', 0)
+                    num_chunks=file_info.get('chunks', 0),
+                    total_size=file_info.get('total_size'),
+                    piece_length=file_info.get('piece_length')
                 )
             else:
                 message = MessageBuilder.announce_message(
@@ -2187,6 +3623,8 @@ class PeerClient:
             
             if response and response.get("status") == "success":
                 logger.debug(f"Announced {event} for {info_hash[:8]}...")
+                if response.get("superseded_by"):
+                    self._on_update_available(info_hash, response["superseded_by"])
         
         except Exception as e:
             logger.error(f"Announce error: {e}")
@@ -0,0 +1,97 @@
+"""
+Buffer Pool Module
+
+Reusable receive buffers so downloading a piece doesn't allocate (and later
+free) a fresh piece-sized object every time.
+"""
+
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+MIN_BUFFER_SIZE = 65536  # Smallest pooled buffer (64 KB)
+MAX_FREE_BUFFERS = 16    # Free buffers kept per size class
+
+
+class BufferPool:
+    """
+    Pool of preallocated bytearrays in power-of-two size classes.
+    
+    acquire() hands out a memoryview of exactly the requested length over a
+    pooled buffer; release() returns the buffer once the caller is done
+    with every view of it.
+    """
+    
+    def __init__(self, max_free: int = MAX_FREE_BUFFERS):
+        """
+        Initialize the pool.
+        
+        Args:
+            max_free: Free buffers kept per size class; extra ones are dropped
+        """
+        self.max_free = max_free
+        self.free: Dict[int, List[bytearray]] = defaultdict(list)
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+    
+    @staticmethod
+    def _size_class(size: int) -> int:
+        capacity = MIN_BUFFER_SIZE
+        while capacity < size:
+            capacity *= 2
+        return capacity
+    
+    def acquire(self, size: int) -> memoryview:
+        """
+        Get a writable buffer of at least size bytes.
+        
+        Args:
+            size: Bytes needed
+        
+        Returns:
+            memoryview of exactly size bytes
+        """
+        capacity = BufferPool._size_class(size)
+        with self.lock:
+            buffers = self.free[capacity]
+            if buffers:
+                self.reuses += 1
+                buffer = buffers.pop()
+            else:
+                self.allocations += 1
+                buffer = None
+        if buffer is None:
+            buffer = bytearray(capacity)
+        return memoryview(buffer)[:size]
+    
+    def release(self, view):
+        """
+        Return a buffer from acquire() to the pool.
+        
+        The caller must not use the view (or slices of it) afterwards.
+        Objects that didn't come from a pool are ignored.
+        """
+        if not isinstance(view, memoryview) or not isinstance(view.obj, bytearray):
+            return
+        buffer = view.obj
+        capacity = len(buffer)
+        if capacity != BufferPool._size_class(capacity):
+            return
+        
+        with self.lock:
+            buffers = self.free[capacity]
+            if len(buffers) < self.max_free and not any(b is buffer for b in buffers):
+                buffers.append(buffer)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get allocation counters."""
+        with self.lock:
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "free": sum(len(buffers) for buffers in self.free.values())
+            }
@@ -0,0 +1,326 @@
+"""
+Piece Cache Module
+
+In-memory LRU cache of recently served pieces, so a popular file being
+seeded to many peers at once is read from disk once rather than once per
+request.
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from shared.storage import FileHandleCache, PieceStorage, advise_willneed
+
+logger = logging.getLogger(__name__)
+
+# (file_id, piece index)
+PieceKey = Tuple[str, int]
+
+READ_AHEAD_PIECES = 8      # Pieces prefetched ahead of a sequential reader (0 = off)
+SEQUENTIAL_THRESHOLD = 2   # Ascending requests in a row before prefetching starts
+SEQUENTIAL_GAP = 16        # Max forward jump still counted as sequential (pipelined requests)
+MAX_TRACKED_STREAMS = 1024
+MAX_PIECE_FRACTION = 8     # Pieces above max_bytes / this are never cached (sent with sendfile)
+MAX_SEEN_KEYS = 4096       # Pieces remembered as requested once, awaiting a second request
+
+
+class PieceCache:
+    """
+    Byte-budgeted LRU cache of piece data with single-flight loading.
+    
+    Concurrent misses for the same piece share one load: the first caller
+    reads from disk while the others wait for its result. A piece is only
+    worth loading once it has been asked for twice (see admit()); the first
+    request is better sent from disk with sendfile.
+    """
+    
+    def __init__(self, max_bytes: int):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_bytes: Total bytes of piece data kept; 0 disables caching
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.pieces: "OrderedDict[PieceKey, bytes]" = OrderedDict()
+        self.loading: Dict[PieceKey, Dict] = {}  # key -> {"event", "data"} for in-flight loads
+        self.prefetched = set()  # Keys loaded by prefetch() and not requested yet
+        self.seen: "OrderedDict[PieceKey, None]" = OrderedDict()  # Keys missed once
+        self.generations: Dict[str, int] = {}  # file_id -> bumped by invalidate_file
+        self.lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.streamed = 0  # First misses left to sendfile instead of being loaded
+        self.coalesced = 0  # Misses that waited on another caller's load
+        self.disk_reads = 0
+        self.disk_bytes = 0
+        self.evictions = 0
+        self.prefetch_loads = 0
+        self.prefetch_hits = 0
+    
+    def can_cache(self, size: int) -> bool:
+        """Check whether a piece is small enough to cache without crowding out others."""
+        return 0 < size <= self.max_bytes // MAX_PIECE_FRACTION
+    
+    def admit(self, key: PieceKey) -> bool:
+        """
+        Decide whether a request should go through the cache.
+        
+        True if the piece is cached or loading, or was requested once
+        before; otherwise the request is remembered and the caller should
+        send the piece straight from disk.
+        """
+        with self.lock:
+            if key in self.pieces or key in self.loading:
+                return True
+            if key in self.seen:
+                del self.seen[key]
+                return True
+            self.seen[key] = None
+            if len(self.seen) > MAX_SEEN_KEYS:
+                self.seen.popitem(last=False)
+            self.misses += 1
+            self.streamed += 1
+            return False
+    
+    def get(self, key: PieceKey) -> Optional[bytes]:
+        """Get a cached piece (marking it recently used), or None."""
+        with self.lock:
+            data = self.pieces.get(key)
+            if data is not None:
+                self.pieces.move_to_end(key)
+            return data
+    
+    def put(self, key: PieceKey, data: bytes):
+        """Insert a piece, evicting least recently used pieces to stay in budget."""
+        if not self.can_cache(len(data)):
+            return
+        with self.lock:
+            self._insert(key, data)
+    
+    def _insert(self, key: PieceKey, data: bytes):
+        """Insert with the lock held."""
+        old = self.pieces.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old)
+        self.pieces[key] = data
+        self.current_bytes += len(data)
+        while self.current_bytes > self.max_bytes:
+            evicted_key, evicted = self.pieces.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+            self.prefetched.discard(evicted_key)
+    
+    def get_or_load(self, key: PieceKey, loader: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """
+        Get a piece, loading it once on a miss even under concurrent requests.
+        
+        Args:
+            key: (file_id, piece index)
+            loader: Reads the piece from disk; returns bytes or None
+        
+        Returns:
+            Piece data, or None if the load failed
+        """
+        with self.lock:
+            data = self.pieces.get(key)
+            if data is not None:
+                self.pieces.move_to_end(key)
+                self.hits += 1
+                if key in self.prefetched:
+                    self.prefetched.discard(key)
+                    self.prefetch_hits += 1
+                return data
+            
+            self.misses += 1
+            flight = self.loading.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._new_flight(key)
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            flight["event"].wait()
+            return flight["data"]
+        
+        return self._load(key, loader, flight)
+    
+    def prefetch(self, key: PieceKey, loader: Callable[[], Optional[bytes]]):
+        """
+        Load a piece ahead of demand unless it is already cached or loading.
+        
+        Requests arriving while it loads wait for it like any other
+        single-flight load.
+        """
+        with self.lock:
+            if key in self.pieces or key in self.loading:
+                return
+            flight = self._new_flight(key)
+            self.prefetch_loads += 1
+        
+        if self._load(key, loader, flight) is not None:
+            with self.lock:
+                if key in self.pieces:
+                    self.prefetched.add(key)
+    
+    def _new_flight(self, key: PieceKey) -> Dict:
+        """Start tracking an in-flight load (lock held)."""
+        flight = {"event": threading.Event(), "data": None,
+                  "generation": self.generations.get(key[0], 0)}
+        self.loading[key] = flight
+        return flight
+    
+    def _load(self, key: PieceKey, loader: Callable[[], Optional[bytes]], flight: Dict) -> Optional[bytes]:
+        """Run a load as the single-flight leader and publish the result."""
+        data = None
+        try:
+            data = loader()
+        except Exception as e:
+            logger.error(f"Failed to load piece {key}: {e}")
+        finally:
+            with self.lock:
+                if data is not None:
+                    self.disk_reads += 1
+                    self.disk_bytes += len(data)
+                    # A load that started before invalidate_file may hold old data
+                    current = flight["generation"] == self.generations.get(key[0], 0)
+                    if current and self.can_cache(len(data)):
+                        self._insert(key, data)
+                flight["data"] = data
+                if self.loading.get(key) is flight:
+                    del self.loading[key]
+            flight["event"].set()
+        return data
+    
+    def invalidate_file(self, file_id: str):
+        """Drop every cached piece of a file; loads already in flight are not cached."""
+        with self.lock:
+            self.generations[file_id] = self.generations.get(file_id, 0) + 1
+            for key in [key for key in self.pieces if key[0] == file_id]:
+                self.current_bytes -= len(self.pieces.pop(key))
+                self.prefetched.discard(key)
+            # Later requests start a fresh load instead of waiting on a stale one
+            for key in [key for key in self.loading if key[0] == file_id]:
+                del self.loading[key]
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache counters."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "streamed": self.streamed,
+                "coalesced": self.coalesced,
+                "disk_reads": self.disk_reads,
+                "disk_bytes": self.disk_bytes,
+                "evictions": self.evictions,
+                "prefetch_loads": self.prefetch_loads,
+                "prefetch_hits": self.prefetch_hits,
+                "cached_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+class ReadAhead:
+    """
+    Sequential read-ahead for seeding.
+    
+    Tracks the highest piece each (peer connection, file) stream has asked
+    for. Once a stream has made SEQUENTIAL_THRESHOLD ascending requests,
+    the next `depth` pieces are loaded into the PieceCache on background
+    threads, so the following requests are served from memory. Pieces too
+    large for the cache get a posix_fadvise(WILLNEED) hint instead.
+    """
+    
+    def __init__(self, cache: PieceCache, depth: int = READ_AHEAD_PIECES, workers: int = 4,
+                 handles: Optional[FileHandleCache] = None):
+        """
+        Initialize read-ahead.
+        
+        Args:
+            cache: Cache that prefetched pieces are loaded into
+            depth: Pieces to keep loaded ahead of a sequential stream (0 disables)
+            workers: Background reader threads
+            handles: File handle cache shared with the server's readers
+        """
+        self.cache = cache
+        self.depth = depth
+        self.handles = handles
+        self.streams: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self.scheduled = set()  # Keys queued or loading in the background
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="readahead")
+    
+    def on_request(self, stream: Tuple, file_id: str, index: int, storage: PieceStorage):
+        """
+        Record a piece request and prefetch ahead of it if the stream is sequential.
+        
+        Args:
+            stream: Identifies the requester (e.g. its address)
+            file_id: File identifier
+            index: Requested piece index
+            storage: Storage backing the file
+        """
+        if self.depth <= 0:
+            return
+        
+        with self.lock:
+            key = (stream, file_id)
+            state = self.streams.pop(key, None) or {"highest": index, "streak": 0}
+            self.streams[key] = state
+            if len(self.streams) > MAX_TRACKED_STREAMS:
+                self.streams.popitem(last=False)
+            
+            jump = index - state["highest"]
+            if 0 < jump <= SEQUENTIAL_GAP:
+                state["streak"] += 1
+                state["highest"] = index
+            elif jump < -SEQUENTIAL_GAP or jump > SEQUENTIAL_GAP:
+                # Random access: start over from here
+                state["streak"] = 0
+                state["highest"] = index
+            if state["streak"] < SEQUENTIAL_THRESHOLD:
+                return
+            
+            targets = []
+            for ahead in range(state["highest"] + 1, state["highest"] + 1 + self.depth):
+                piece_key = (file_id, ahead)
+                if piece_key not in self.scheduled:
+                    self.scheduled.add(piece_key)
+                    targets.append(ahead)
+        
+        for ahead in targets:
+            try:
+                self.executor.submit(self._prefetch, file_id, ahead, storage)
+            except RuntimeError:
+                # Shut down
+                with self.lock:
+                    self.scheduled.discard((file_id, ahead))
+    
+    def _prefetch(self, file_id: str, index: int, storage: PieceStorage):
+        """Load one piece into the cache (or hint the OS for uncacheable pieces)."""
+        try:
+            extents = storage.piece_extents(index)
+            if extents is None:
+                return
+            size = sum(length for _, _, length in extents)
+            if self.cache.can_cache(size):
+                self.cache.prefetch((file_id, index), lambda: storage.read_piece(index, self.handles))
+            else:
+                for path, offset, length in extents:
+                    advise_willneed(path, offset, length)
+        except Exception as e:
+            logger.debug(f"Read-ahead of {file_id} #{index} failed: {e}")
+        finally:
+            with self.lock:
+                self.scheduled.discard((file_id, index))
+    
+    def shutdown(self):
+        """Stop background readers (queued prefetches are dropped)."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
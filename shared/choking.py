@@ -0,0 +1,156 @@
+"""
+Upload Slot Scheduler Module
+
+Limits how many peers a seeder uploads to at once. Peers holding one of
+the upload slots are "unchoked" and served; requests from the others get
+a "choked" response straight away, so they can ask another peer instead
+of waiting in a queue.
+
+Every RECHOKE_INTERVAL the unchoked set is chosen again from the peers
+that have been asking, by policy:
+    round_robin    peers that have waited longest since their last turn
+    reciprocation  peers we downloaded the most from in the last interval
+One slot is kept for an optimistic unchoke: a random waiting peer,
+rotated every OPTIMISTIC_UNCHOKE_INTERVAL, so new peers get a chance to
+start trading.
+"""
+
+import time
+import random
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+POLICY_ROUND_ROBIN = "round_robin"
+POLICY_RECIPROCATION = "reciprocation"
+
+RECHOKE_INTERVAL = 10.0             # Seconds between choices of the unchoked set
+OPTIMISTIC_UNCHOKE_INTERVAL = 30.0  # Seconds between optimistic unchoke rotations
+
+
+class UploadScheduler:
+    """
+    Upload slot admission with periodic rechoking.
+    
+    Peers are identified by IP address. A request from a choked peer is
+    admitted at once if a slot is free; otherwise it waits for a rechoke.
+    Peers that stop asking for a whole interval lose their slot.
+    """
+    
+    def __init__(self, slots: int, policy: str = POLICY_ROUND_ROBIN,
+                 downloaded_from: Optional[Callable[[str], int]] = None,
+                 rechoke_interval: float = RECHOKE_INTERVAL,
+                 optimistic_interval: float = OPTIMISTIC_UNCHOKE_INTERVAL):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            slots: Peers uploaded to at once; 0 disables the limit
+            policy: POLICY_ROUND_ROBIN or POLICY_RECIPROCATION
+            downloaded_from: Returns total bytes downloaded from a peer IP
+                (used by reciprocation; without it peers tie and rotate)
+            rechoke_interval: Seconds between rechokes
+            optimistic_interval: Seconds between optimistic unchoke rotations
+        """
+        if policy not in (POLICY_ROUND_ROBIN, POLICY_RECIPROCATION):
+            raise ValueError(f"Unknown upload policy {policy!r}")
+        self.slots = slots
+        self.policy = policy
+        self.downloaded_from = downloaded_from
+        self.rechoke_interval = rechoke_interval
+        self.optimistic_interval = optimistic_interval
+        self.lock = threading.Lock()
+        
+        self.unchoked = set()
+        self.optimistic: Optional[str] = None
+        self.last_request: Dict[str, float] = {}   # peer -> time of its latest request
+        self.last_unchoked: Dict[str, float] = {}  # peer -> time it last got a slot
+        self.download_marks: Dict[str, int] = {}   # peer -> downloaded_from() at the last rechoke
+        self.next_rechoke = 0.0
+        self.next_optimistic = 0.0
+        
+        self.admitted = 0
+        self.choked = 0
+        self.rechokes = 0
+    
+    def admit(self, peer: str) -> bool:
+        """
+        Decide whether to serve a request from a peer.
+        
+        Args:
+            peer: Requesting peer's IP address
+        
+        Returns:
+            True to serve it, False to answer "choked"
+        """
+        if self.slots <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.last_request[peer] = now
+            if now >= self.next_rechoke:
+                self._rechoke(now)
+            if peer in self.unchoked or len(self.unchoked) < self.slots:
+                if peer not in self.unchoked:
+                    self.unchoked.add(peer)
+                    self.last_unchoked[peer] = now
+                self.admitted += 1
+                return True
+            self.choked += 1
+            return False
+    
+    def _rechoke(self, now: float):
+        """Choose the unchoked set from the peers that are still asking (lock held)."""
+        self.rechokes += 1
+        self.next_rechoke = now + self.rechoke_interval
+        
+        # Peers that went quiet for a whole interval are forgotten
+        for peer in [p for p, t in self.last_request.items() if now - t > self.rechoke_interval]:
+            del self.last_request[peer]
+            self.last_unchoked.pop(peer, None)
+            self.download_marks.pop(peer, None)
+        candidates = list(self.last_request)
+        for peer in self.unchoked & self.last_request.keys():
+            self.last_unchoked[peer] = now  # Had a turn up to now
+        
+        # Regular slots go to the best candidates by policy; with more than
+        # one slot, the last is kept for an optimistic unchoke
+        regular_slots = self.slots - 1 if self.slots > 1 else self.slots
+        waited = lambda p: self.last_unchoked.get(p, 0.0)  # Longest wait (or never unchoked) first
+        if self.policy == POLICY_RECIPROCATION and self.downloaded_from is not None:
+            rates = {}
+            for peer in candidates:
+                total = self.downloaded_from(peer)
+                rates[peer] = total - self.download_marks.get(peer, total)
+                self.download_marks[peer] = total
+            candidates.sort(key=lambda p: (-rates[p], waited(p)))
+        else:
+            candidates.sort(key=waited)
+        regular = candidates[:regular_slots]
+        
+        # The optimistic slot rotates to a random waiting peer
+        waiting = candidates[regular_slots:] if self.slots > 1 else []
+        if self.optimistic not in waiting or now >= self.next_optimistic:
+            self.optimistic = random.choice(waiting) if waiting else None
+            self.next_optimistic = now + self.optimistic_interval
+        
+        unchoked = set(regular)
+        if self.optimistic is not None:
+            unchoked.add(self.optimistic)
+        if unchoked != self.unchoked:
+            logger.debug(f"Rechoke: unchoked {sorted(unchoked)} (optimistic {self.optimistic})")
+        self.unchoked = unchoked
+    
+    def get_stats(self) -> Dict:
+        """Get slot usage and counters."""
+        with self.lock:
+            return {
+                "slots": self.slots,
+                "unchoked": len(self.unchoked),
+                "interested": len(self.last_request),
+                "admitted": self.admitted,
+                "choked": self.choked,
+                "rechokes": self.rechokes
+            }
@@ -1,15 +1,28 @@
 """
 File Chunking and Merging Module
 
-Provides functionality to split files into fixed-size chunks and merge them back together.
+Provides functionality to split files into fixed-size chunks and merge them back together,
+and content-defined chunking (GearChunker) for files published in several versions.
 """
 
 import os
+import hashlib
 import logging
-from typing import Optional, List
+from typing import Iterator, Optional, List
 
 logger = logging.getLogger(__name__)
 
+CHUNKING_FIXED = "fixed"  # Piece N starts at N * piece_length
+CHUNKING_CDC = "cdc"      # Piece boundaries chosen by a rolling hash (GearChunker)
+
+CDC_READ_SIZE = 4194304   # 4 MB reads while scanning for boundaries
+CDC_MAX_SIZE = 16777216   # Hard cap on a content-defined piece (matches MAX_CHUNK_SIZE)
+
+# Gear table: 256 fixed pseudo-random 64-bit values. Every peer must use the
+# same table, so it is derived from SHA-256 rather than a random generator.
+_GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big') for i in range(256)]
+_MASK64 = (1 << 64) - 1
+
 
 class FileChunker:
     """Handles file splitting and chunk management."""
@@ -224,6 +237,88 @@ class FileChunker:
             return None
 
 
+class GearChunker:
+    """
+    Content-defined chunking with a Gear rolling hash (FastCDC style).
+    
+    A boundary is placed after the first byte, at least min_size into the
+    piece, where the rolling hash falls below a threshold; pieces are cut
+    at max_size if none is found. The hash only depends on the last 64
+    bytes, so inserting or deleting data moves the boundaries around the
+    edit while the pieces after it keep their boundaries and digests.
+    """
+    
+    def __init__(self, avg_size: int):
+        """
+        Initialize the chunker.
+        
+        Args:
+            avg_size: Target average piece size in bytes; pieces are between
+                avg_size / 4 and 4 * avg_size (capped at CDC_MAX_SIZE)
+        """
+        if avg_size < 256:
+            raise ValueError("Average chunk size must be at least 256 bytes")
+        self.avg_size = avg_size
+        self.min_size = avg_size // 4
+        self.max_size = min(avg_size * 4, CDC_MAX_SIZE)
+        # Expected distance to a boundary past min_size is avg_size - min_size
+        self.threshold = (1 << 64) // (avg_size - self.min_size)
+    
+    def cut_point(self, data) -> int:
+        """
+        Find the length of the next piece at the start of data.
+        
+        Args:
+            data: Bytes from the start of the piece (at least max_size bytes
+                unless the file ends sooner)
+        
+        Returns:
+            Piece length
+        """
+        end = min(len(data), self.max_size)
+        if end <= self.min_size:
+            return end
+        
+        gear = _GEAR
+        mask = _MASK64
+        threshold = self.threshold
+        h = 0
+        i = self.min_size
+        for byte in data[self.min_size:end]:
+            h = ((h << 1) + gear[byte]) & mask
+            i += 1
+            if h < threshold:
+                return i
+        return end
+    
+    def chunks(self, f, read_size: int = CDC_READ_SIZE) -> Iterator[bytes]:
+        """
+        Split an open binary file into content-defined pieces.
+        
+        Args:
+            f: File object opened for reading
+            read_size: Bytes read at a time
+        
+        Yields:
+            Piece data, in file order
+        """
+        buffer = bytearray()
+        eof = False
+        while True:
+            while not eof and len(buffer) < self.max_size:
+                block = f.read(read_size)
+                if not block:
+                    eof = True
+                else:
+                    buffer += block
+            if not buffer:
+                return
+            
+            cut = self.cut_point(buffer)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     
@@ -0,0 +1,155 @@
+"""
+Piece Compression Module
+
+Optional zlib compression of pieces on the wire. Sessions negotiate it with
+the "zlib" capability; a seeder then sends a piece compressed only when that
+saves at least MIN_COMPRESSION_SAVINGS of its size, and keeps compressed
+pieces in a cache of their own so popular pieces are compressed once.
+"""
+
+import zlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from shared.cache import PieceCache, PieceKey
+from shared.utils import MAX_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+CAPABILITY_ZLIB = "zlib"
+COMPRESSION_ZLIB = "zlib"  # "compression" value of a compressed CHUNK_RESPONSE
+
+COMPRESSION_LEVEL = 1          # Fastest zlib level; most of the ratio at ~4x the speed of level 6
+MIN_COMPRESSION_SAVINGS = 0.1  # Send compressed only if it is at least 10% smaller
+PROBE_SIZE = 16384             # Leading bytes compressed first to skip incompressible pieces cheaply
+MAX_INCOMPRESSIBLE_KEYS = 65536
+
+
+class PieceCompressor:
+    """
+    Compresses pieces for sessions that accepted the "zlib" capability.
+    
+    Compressed pieces are cached by (file_id, index) with the same
+    single-flight loading as the raw piece cache. Pieces that don't
+    compress well enough are remembered, so they are sent raw without
+    being compressed again.
+    """
+    
+    def __init__(self, max_bytes: int, level: int = COMPRESSION_LEVEL,
+                 min_savings: float = MIN_COMPRESSION_SAVINGS):
+        """
+        Initialize the compressor.
+        
+        Args:
+            max_bytes: Memory for compressed pieces
+            level: zlib compression level
+            min_savings: Fraction of a piece compression must save to be used
+        """
+        self.cache = PieceCache(max_bytes)
+        self.level = level
+        self.min_savings = min_savings
+        self.incompressible: "OrderedDict[PieceKey, None]" = OrderedDict()
+        self.lock = threading.Lock()
+        
+        self.compressed = 0  # Pieces compressed and kept
+        self.skipped = 0     # Pieces found not worth compressing
+        self.bytes_in = 0    # Raw bytes of compressed pieces
+        self.bytes_out = 0   # Their compressed size
+    
+    def can_compress(self, size: int) -> bool:
+        """Check whether a piece of this size is small enough to compress in memory."""
+        return self.cache.can_cache(size)
+    
+    def get(self, key: PieceKey, loader: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """
+        Get the compressed form of a piece.
+        
+        Args:
+            key: (file_id, piece index)
+            loader: Returns the raw piece bytes, or None
+        
+        Returns:
+            Compressed bytes, or None if the piece should be sent raw
+        """
+        with self.lock:
+            if key in self.incompressible:
+                self.incompressible.move_to_end(key)
+                return None
+        return self.cache.get_or_load(key, lambda: self._compress(key, loader))
+    
+    def _compress(self, key: PieceKey, loader: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """Compress a piece, or remember that it isn't worth it."""
+        data = loader()
+        if data is None:
+            return None
+        
+        # Data that doesn't shrink in its first block rarely does further on
+        keep = 1 - self.min_savings
+        compressed = None
+        if len(data) <= PROBE_SIZE * 2 or \
+                len(zlib.compress(memoryview(data)[:PROBE_SIZE], self.level)) <= PROBE_SIZE * keep:
+            compressed = zlib.compress(data, self.level)
+        
+        with self.lock:
+            if compressed is None or len(compressed) > len(data) * keep:
+                self.skipped += 1
+                self.incompressible[key] = None
+                if len(self.incompressible) > MAX_INCOMPRESSIBLE_KEYS:
+                    self.incompressible.popitem(last=False)
+                return None
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+        return compressed
+    
+    def invalidate_file(self, file_id: str):
+        """Forget every compressed piece of a file."""
+        self.cache.invalidate_file(file_id)
+        with self.lock:
+            for key in [key for key in self.incompressible if key[0] == file_id]:
+                del self.incompressible[key]
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get compression counters."""
+        cache = self.cache.get_stats()
+        with self.lock:
+            return {
+                "compressed": self.compressed,
+                "skipped": self.skipped,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "hits": cache["hits"],
+                "cached_bytes": cache["cached_bytes"]
+            }
+
+
+def decompress_piece(data, raw_size: int) -> Optional[bytes]:
+    """
+    Decompress a received piece.
+    
+    Output is capped at raw_size, so a corrupt or hostile payload can't
+    expand beyond it. raw_size comes from the sender: callers must check it
+    against the piece size they expect before calling.
+    
+    Args:
+        data: Compressed payload
+        raw_size: Size the piece had before compression (at most MAX_CHUNK_SIZE)
+    
+    Returns:
+        The raw piece, or None if the payload is invalid
+    """
+    if not 0 < raw_size <= MAX_CHUNK_SIZE:
+        logger.error(f"Compressed piece size {raw_size} out of range")
+        return None
+    try:
+        decompressor = zlib.decompressobj()
+        raw = decompressor.decompress(data, raw_size)
+        if len(raw) != raw_size or not decompressor.eof or decompressor.unconsumed_tail:
+            logger.error(f"Compressed piece does not expand to {raw_size} bytes")
+            return None
+        return raw
+    except zlib.error as e:
+        logger.error(f"Failed to decompress piece: {e}")
+        return None
@@ -0,0 +1,184 @@
+"""
+Disk I/O Module
+
+Background writer threads for downloaded pieces, so network workers hand
+a piece off and go back to fetching instead of waiting on the disk.
+"""
+
+import time
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+from shared.storage import SingleFileStorage
+
+logger = logging.getLogger(__name__)
+
+DISK_WRITER_THREADS = 2                 # Writer threads per download
+DISK_QUEUE_BYTES = 64 * 1024 * 1024     # Piece data queued before submit() blocks
+MAX_COALESCED_BYTES = 4 * 1024 * 1024   # Largest single coalesced write
+
+
+class DiskWriter:
+    """
+    Bounded write-behind queue in front of a SingleFileStorage.
+    
+    submit() queues a piece and returns; writer threads drain the queue,
+    merging runs of consecutive queued pieces into one vectored write.
+    When DISK_QUEUE_BYTES of data is waiting, submit() blocks until the
+    writers catch up, which slows the network side down to disk speed
+    instead of letting received pieces pile up in memory.
+    """
+    
+    def __init__(self, storage: SingleFileStorage, workers: int = DISK_WRITER_THREADS,
+                 max_queued_bytes: int = DISK_QUEUE_BYTES,
+                 release: Optional[Callable] = None):
+        """
+        Start the writer threads.
+        
+        Args:
+            storage: Preallocated target file
+            workers: Number of writer threads
+            max_queued_bytes: Queued bytes at which submit() blocks
+                (a piece is always accepted into an empty queue)
+            release: Called with each piece's data once it is written or dropped
+                (e.g. BufferPool.release)
+        """
+        self.storage = storage
+        self.max_queued_bytes = max_queued_bytes
+        self.release = release
+        self.pending: Dict[int, bytes] = {}  # piece index -> data waiting to be written
+        self.pending_bytes = 0
+        self.in_flight = 0  # Pieces taken by a writer but not yet written
+        self.failed = set()  # Indices whose write failed
+        self.closing = False
+        self.cond = threading.Condition()
+        
+        self.pieces_written = 0
+        self.bytes_written = 0
+        self.writes = 0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+        self.peak_depth = 0
+        self.blocked_submits = 0
+        
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+    
+    def submit(self, index: int, data: bytes) -> bool:
+        """
+        Queue a piece for writing, blocking while the queue is full.
+        
+        Args:
+            index: Piece index
+            data: Piece data (handed over; released after writing)
+        
+        Returns:
+            True if queued, False if the writer is closed
+        """
+        with self.cond:
+            if self.pending and self.pending_bytes + len(data) > self.max_queued_bytes:
+                self.blocked_submits += 1
+                while self.pending and self.pending_bytes + len(data) > self.max_queued_bytes \
+                        and not self.closing:
+                    self.cond.wait()
+            if self.closing:
+                queued = False
+            else:
+                queued = True
+                self.pending[index] = data
+                self.pending_bytes += len(data)
+                self.peak_depth = max(self.peak_depth, len(self.pending) + self.in_flight)
+                self.cond.notify_all()
+        if not queued:
+            self._release([data])
+        return queued
+    
+    def _take_run(self) -> List:
+        """Pop the lowest queued piece and any queued pieces directly after it."""
+        first = min(self.pending)
+        run = [(first, self.pending.pop(first))]
+        size = len(run[0][1])
+        while len(run[-1][1]) == self.storage.piece_size(run[-1][0]) and size < MAX_COALESCED_BYTES:
+            data = self.pending.pop(run[-1][0] + 1, None)
+            if data is None:
+                break
+            run.append((run[-1][0] + 1, data))
+            size += len(data)
+        self.pending_bytes -= size
+        return run
+    
+    def _run(self):
+        """Writer thread: write queued runs until closed and drained."""
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                run = self._take_run()
+                self.in_flight += len(run)
+                self.cond.notify_all()  # Queue space freed
+            
+            pieces = [data for _, data in run]
+            start = time.perf_counter()
+            ok = self.storage.write_pieces(run[0][0], pieces)
+            elapsed = time.perf_counter() - start
+            self._release(pieces)
+            
+            with self.cond:
+                self.in_flight -= len(run)
+                self.writes += 1
+                self.write_seconds += elapsed
+                self.max_write_seconds = max(self.max_write_seconds, elapsed)
+                if ok:
+                    self.pieces_written += len(run)
+                    self.bytes_written += sum(len(data) for data in pieces)
+                else:
+                    self.failed.update(index for index, _ in run)
+                self.cond.notify_all()
+    
+    def _release(self, pieces: List):
+        if self.release:
+            for data in pieces:
+                self.release(data)
+    
+    def flush(self) -> List[int]:
+        """
+        Wait until every queued piece has been written.
+        
+        Returns:
+            Sorted indices of pieces whose write failed
+        """
+        with self.cond:
+            while self.pending or self.in_flight:
+                self.cond.wait()
+            return sorted(self.failed)
+    
+    def close(self):
+        """Drop pieces not yet written and stop the writer threads."""
+        with self.cond:
+            self.closing = True
+            dropped = list(self.pending.values())
+            self.pending.clear()
+            self.pending_bytes = 0
+            self.cond.notify_all()
+        self._release(dropped)
+        for thread in self.threads:
+            thread.join()
+    
+    def get_stats(self) -> Dict:
+        """Get queue depth, write latency and coalescing counters."""
+        with self.cond:
+            return {
+                "queue_depth": len(self.pending) + self.in_flight,
+                "queued_bytes": self.pending_bytes,
+                "peak_depth": self.peak_depth,
+                "blocked_submits": self.blocked_submits,
+                "pieces_written": self.pieces_written,
+                "bytes_written": self.bytes_written,
+                "writes": self.writes,
+                "avg_write_ms": self.write_seconds / self.writes * 1000 if self.writes else 0.0,
+                "max_write_ms": self.max_write_seconds * 1000
+            }
@@ -0,0 +1,218 @@
+"""
+Binary Frame Module
+
+Fixed-size, struct-packed frames for the piece transfer hot path. Sessions
+negotiate them through the "capabilities" field of their first JSON
+CHUNK_REQUEST; tracker and control traffic stays JSON.
+
+Frame layout (network byte order, 28-byte header):
+
+    type      B    FRAME_REQUEST / FRAME_PIECE / FRAME_HAVE / FRAME_CANCEL
+    flags     B    FLAG_* bits
+    extra_len H    bytes of extra data after the header
+    file_id   16s  ASCII file ID
+    index     I    piece index
+    length    I    piece payload bytes following the extra data
+
+Extra data of a PIECE frame is the uncompressed size (4 bytes, with
+FLAG_COMPRESSED) followed by the Merkle proof digests (with FLAG_PROOF).
+
+Decoded frames are returned as the same dictionaries the JSON protocol
+uses, so handlers don't care which encoding a session negotiated.
+"""
+
+import struct
+import socket
+import logging
+from typing import Dict, List, Optional
+
+from shared.utils import SocketUtils
+from shared.compression import COMPRESSION_ZLIB
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("!BBH16sII")
+
+FRAME_REQUEST = 1
+FRAME_PIECE = 2
+FRAME_HAVE = 3
+FRAME_CANCEL = 4
+
+FLAG_PROOF = 0x01      # REQUEST: send a Merkle proof; PIECE: extra data holds one
+FLAG_NOT_FOUND = 0x02  # PIECE: peer doesn't have it, no payload follows
+FLAG_COMPRESSED = 0x04  # PIECE: payload is zlib-compressed
+FLAG_CHOKED = 0x08     # PIECE: peer is at its upload slot limit (sent with FLAG_NOT_FOUND)
+
+DIGEST_SIZE = 32  # Raw SHA-256 digest bytes per proof entry
+RAW_SIZE = struct.Struct("!I")  # Uncompressed size of a compressed piece
+
+CAPABILITY_BINARY = "binary"
+
+# Frame type -> message "type" used by the JSON protocol
+_MESSAGE_TYPES = {
+    FRAME_REQUEST: "CHUNK_REQUEST",
+    FRAME_PIECE: "CHUNK_RESPONSE",
+    FRAME_HAVE: "HAVE",
+    FRAME_CANCEL: "CANCEL"
+}
+
+
+class BinaryFrames:
+    """Encoding and decoding of binary piece-transfer frames."""
+    
+    @staticmethod
+    def _pack(frame_type: int, file_id: str, index: int, length: int = 0,
+              flags: int = 0, extra: bytes = b'') -> bytes:
+        file_id_bytes = file_id.encode('ascii')
+        if len(file_id_bytes) != 16:
+            raise ValueError(f"Binary frames need a 16-character file ID, got {file_id!r}")
+        return FRAME_HEADER.pack(frame_type, flags, len(extra), file_id_bytes, index, length) + extra
+    
+    @staticmethod
+    def request(file_id: str, chunk_index: int, want_proof: bool = False) -> bytes:
+        """Build a REQUEST frame."""
+        flags = FLAG_PROOF if want_proof else 0
+        return BinaryFrames._pack(FRAME_REQUEST, file_id, chunk_index, flags=flags)
+    
+    @staticmethod
+    def piece_header(file_id: str, chunk_index: int, chunk_size: int,
+                     status: str = "success", proof: List[str] = None,
+                     raw_size: Optional[int] = None) -> bytes:
+        """
+        Build the header of a PIECE frame; chunk_size payload bytes follow it.
+        
+        Args:
+            file_id: File identifier
+            chunk_index: Piece index
+            chunk_size: Payload size in bytes
+            status: "success", "choked", or anything else for not found (no payload)
+            proof: Optional Merkle proof as hex digests
+            raw_size: Uncompressed piece size if the payload is compressed
+        """
+        if status == "choked":
+            # Also flagged not found, which is how peers without FLAG_CHOKED read it
+            return BinaryFrames._pack(FRAME_PIECE, file_id, chunk_index, flags=FLAG_NOT_FOUND | FLAG_CHOKED)
+        if status != "success":
+            return BinaryFrames._pack(FRAME_PIECE, file_id, chunk_index, flags=FLAG_NOT_FOUND)
+        
+        flags = 0
+        extra = b''
+        if raw_size is not None:
+            flags |= FLAG_COMPRESSED
+            extra = RAW_SIZE.pack(raw_size)
+        if proof is not None:
+            flags |= FLAG_PROOF
+            extra += b''.join(bytes.fromhex(digest) for digest in proof)
+        return BinaryFrames._pack(FRAME_PIECE, file_id, chunk_index, chunk_size, flags, extra)
+    
+    @staticmethod
+    def have(file_id: str, chunk_index: int) -> bytes:
+        """Build a HAVE frame (sender can now serve this piece)."""
+        return BinaryFrames._pack(FRAME_HAVE, file_id, chunk_index)
+    
+    @staticmethod
+    def cancel(file_id: str, chunk_index: int) -> bytes:
+        """Build a CANCEL frame (drop a queued request)."""
+        return BinaryFrames._pack(FRAME_CANCEL, file_id, chunk_index)
+    
+    @staticmethod
+    def send_frame(sock: socket.socket, frame: bytes) -> bool:
+        """
+        Send an encoded frame.
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            sock.sendall(frame)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send frame: {e}")
+            return False
+    
+    @staticmethod
+    def receive_frame(sock: socket.socket, timeout: Optional[float] = None) -> Optional[Dict]:
+        """
+        Receive one frame header (and its extra data, not the piece payload).
+        
+        Args:
+            sock: Socket to receive from
+            timeout: Optional timeout in seconds
+        
+        Returns:
+            Message dictionary shaped like its JSON equivalent, or None if failed
+        """
+        try:
+            if timeout is not None:
+                sock.settimeout(timeout)
+            header = sock.recv(FRAME_HEADER.size)
+        except Exception as e:
+            logger.error(f"Failed to receive frame: {e}")
+            return None
+        if not header:
+            # Peer closed the session between frames
+            return None
+        if len(header) < FRAME_HEADER.size:
+            rest = SocketUtils.receive_chunk_data(sock, FRAME_HEADER.size - len(header), timeout=timeout)
+            if rest is None:
+                return None
+            header += rest
+        
+        extra = b''
+        extra_len = BinaryFrames.extra_length(header)
+        if extra_len:
+            extra = SocketUtils.receive_chunk_data(sock, extra_len, timeout=timeout)
+            if extra is None:
+                return None
+        return BinaryFrames.decode(header, extra)
+    
+    @staticmethod
+    def extra_length(header: bytes) -> int:
+        """Get the number of extra data bytes following a frame header."""
+        return FRAME_HEADER.unpack_from(header)[2]
+    
+    @staticmethod
+    def decode(header: bytes, extra: bytes = b'') -> Optional[Dict]:
+        """
+        Decode a received frame header and its extra data.
+        
+        Args:
+            header: FRAME_HEADER.size bytes
+            extra: The extra_length(header) bytes that followed it
+        
+        Returns:
+            Message dictionary shaped like its JSON equivalent, or None if invalid
+        """
+        frame_type, flags, _, file_id, index, length = FRAME_HEADER.unpack(header)
+        message_type = _MESSAGE_TYPES.get(frame_type)
+        if message_type is None:
+            logger.error(f"Unknown frame type {frame_type}")
+            return None
+        
+        message = {
+            "type": message_type,
+            "file_id": file_id.decode('ascii', errors='replace'),
+            "chunk_index": index
+        }
+        
+        if frame_type == FRAME_REQUEST:
+            if flags & FLAG_PROOF:
+                message["proof"] = True
+        elif frame_type == FRAME_PIECE:
+            message["chunk_size"] = 0 if flags & FLAG_NOT_FOUND else length
+            message["status"] = "not_found" if flags & FLAG_NOT_FOUND else "success"
+            if flags & FLAG_CHOKED:
+                message["status"] = "choked"
+            message["keep_alive"] = True
+            if flags & FLAG_COMPRESSED:
+                if len(extra) < RAW_SIZE.size:
+                    logger.error("Compressed piece frame without its size")
+                    return None
+                message["compression"] = COMPRESSION_ZLIB
+                message["raw_size"] = RAW_SIZE.unpack_from(extra)[0]
+                extra = extra[RAW_SIZE.size:]
+            if flags & FLAG_PROOF:
+                message["proof"] = [extra[i:i + DIGEST_SIZE].hex()
+                                    for i in range(0, len(extra), DIGEST_SIZE)]
+        
+        return message
@@ -0,0 +1,416 @@
+"""
+File Manifest Module
+
+Builds the metadata a peer publishes for a shared file (file ID, piece
+layout and per-piece digests) in a single streaming read of the file.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from shared.chunking import GearChunker, CHUNKING_FIXED, CHUNKING_CDC
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 4194304  # 4 MB reads while hashing
+
+
+class MerkleTree:
+    """
+    Binary SHA-256 Merkle tree over piece digests.
+    
+    Interior nodes are SHA-256(left || right) over raw digest bytes; an odd
+    node at the end of a level is promoted unchanged. The root commits to
+    every piece, so a single piece plus its sibling path can be verified
+    without the full piece list.
+    """
+    
+    def __init__(self, leaf_hashes: List[str]):
+        """
+        Build the tree.
+        
+        Args:
+            leaf_hashes: Hex SHA-256 digest of each piece, in order
+        """
+        if not leaf_hashes:
+            raise ValueError("Merkle tree needs at least one leaf")
+        self.num_leaves = len(leaf_hashes)
+        self.levels = [[bytes.fromhex(h) for h in leaf_hashes]]
+        while len(self.levels[-1]) > 1:
+            self.levels.append(MerkleTree._next_level(self.levels[-1]))
+    
+    @staticmethod
+    def _next_level(nodes: List[bytes]) -> List[bytes]:
+        parents = [hashlib.sha256(nodes[i] + nodes[i + 1]).digest()
+                   for i in range(0, len(nodes) - 1, 2)]
+        if len(nodes) % 2:
+            parents.append(nodes[-1])
+        return parents
+    
+    @property
+    def root(self) -> str:
+        """Hex digest of the root."""
+        return self.levels[-1][0].hex()
+    
+    def proof(self, index: int) -> List[str]:
+        """
+        Get the sibling hashes from a leaf up to the root.
+        
+        Levels where the node is promoted without a sibling are skipped.
+        
+        Args:
+            index: Leaf (piece) index
+        
+        Returns:
+            List of hex sibling digests, bottom-up
+        """
+        path = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                path.append(level[sibling].hex())
+            index //= 2
+        return path
+    
+    @staticmethod
+    def verify_proof(leaf_hash: str, index: int, num_leaves: int,
+                     proof: List[str], root: str) -> bool:
+        """
+        Check that a piece digest belongs at index under the given root.
+        
+        Args:
+            leaf_hash: Hex digest of the received piece
+            index: Piece index
+            num_leaves: Total number of pieces in the file
+            proof: Sibling digests as returned by proof()
+            root: Expected hex root
+        
+        Returns:
+            True if the proof is valid, False otherwise
+        """
+        try:
+            if not 0 <= index < num_leaves:
+                return False
+            node = bytes.fromhex(leaf_hash)
+            siblings = iter(proof)
+            width = num_leaves
+            while width > 1:
+                sibling_index = index ^ 1
+                if sibling_index < width:
+                    sibling = bytes.fromhex(next(siblings))
+                    if index % 2:
+                        node = hashlib.sha256(sibling + node).digest()
+                    else:
+                        node = hashlib.sha256(node + sibling).digest()
+                index //= 2
+                width = (width + 1) // 2
+            # Every sibling must have been consumed
+            if next(siblings, None) is not None:
+                return False
+            return node.hex() == root
+        except (StopIteration, ValueError, TypeError):
+            return False
+
+
+class ManifestUtils:
+    """Utilities for building, storing and checking file manifests."""
+    
+    @staticmethod
+    def piece_digest(data) -> str:
+        """Compute the hex digest of one piece."""
+        return hashlib.sha256(data).hexdigest()
+    
+    @staticmethod
+    def update_key(update_secret: str) -> str:
+        """Compute the public key the tracker checks update proofs against."""
+        return hashlib.sha256(update_secret.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def build_manifest(filepath: str, piece_length: int, merkle: bool = False,
+                       block_size: int = READ_BLOCK_SIZE,
+                       chunking: str = CHUNKING_FIXED) -> Optional[Dict]:
+        """
+        Read a file once and compute its file ID, piece layout and piece digests.
+        
+        Manifest format:
+        {
+            "file_id": str,         # first 16 hex chars of SHA-256 of the content,
+                                    # or of the Merkle root in merkle mode
+            "total_size": int,
+            "piece_length": int,    # piece size (average piece size in cdc mode)
+            "num_pieces": int,
+            "piece_hashes": [str],  # SHA-256 hex digest per piece
+            "merkle_root": str,     # merkle mode only
+            "chunking": str,        # cdc mode only
+            "piece_offsets": [int]  # cdc mode only: start offset of each piece
+        }
+        
+        In cdc mode the file ID also commits to the chunking parameters, so
+        the same content shared with fixed and content-defined pieces gets
+        two IDs instead of two conflicting layouts under one.
+        
+        Args:
+            filepath: Path to the file
+            piece_length: Size of each piece in bytes (target average in cdc mode)
+            merkle: Derive the file ID from a Merkle root over piece digests
+            block_size: Read size (rounded to a multiple of piece_length)
+            chunking: CHUNKING_FIXED or CHUNKING_CDC
+        
+        Returns:
+            Manifest dictionary, or None if failed
+        """
+        try:
+            if piece_length <= 0:
+                raise ValueError("Piece length must be positive")
+            
+            file_hash = hashlib.sha256()
+            piece_offsets = None
+            if chunking == CHUNKING_CDC:
+                piece_hashes, piece_offsets, total_size = ManifestUtils._hash_cdc_pieces(
+                    filepath, piece_length, file_hash
+                )
+            else:
+                piece_hashes, total_size = ManifestUtils._hash_fixed_pieces(
+                    filepath, piece_length, block_size, None if merkle else file_hash
+                )
+            
+            manifest = {
+                "file_id": file_hash.hexdigest()[:16],
+                "total_size": total_size,
+                "piece_length": piece_length,
+                "num_pieces": len(piece_hashes),
+                "piece_hashes": piece_hashes
+            }
+            if piece_offsets is not None:
+                manifest["chunking"] = CHUNKING_CDC
+                manifest["piece_offsets"] = piece_offsets
+                layout = f"{CHUNKING_CDC}:{piece_length}:".encode() + file_hash.digest()
+                manifest["file_id"] = hashlib.sha256(layout).hexdigest()[:16]
+            if merkle and piece_hashes:
+                manifest["merkle_root"] = MerkleTree(piece_hashes).root
+                manifest["file_id"] = manifest["merkle_root"][:16]
+            logger.info(f"Built manifest for {filepath}: {len(piece_hashes)} pieces, {total_size} bytes")
+            return manifest
+        
+        except Exception as e:
+            logger.error(f"Failed to build manifest: {e}")
+            return None
+    
+    @staticmethod
+    def _hash_fixed_pieces(filepath: str, piece_length: int, block_size: int,
+                           file_hash) -> Tuple[List[str], int]:
+        """
+        Hash fixed-size pieces (and optionally the whole file) in one read.
+        
+        Returns:
+            (piece digests, total size)
+        """
+        with open(filepath, 'rb', buffering=0) as f:
+            return ManifestUtils._hash_fixed_stream(f, piece_length, block_size, file_hash)
+    
+    @staticmethod
+    def _hash_fixed_stream(f, piece_length: int, block_size: int,
+                           file_hash) -> Tuple[List[str], int]:
+        """Hash fixed-size pieces of anything with readinto() (see _hash_fixed_pieces)."""
+        # Read whole pieces per block so piece hashing never straddles reads
+        block_size = max(piece_length, block_size - block_size % piece_length)
+        buffer = bytearray(block_size)
+        view = memoryview(buffer)
+        piece_hashes = []
+        total_size = 0
+        
+        # hashlib releases the GIL, so the whole-file digest runs alongside
+        # the piece digests on a helper thread
+        with ThreadPoolExecutor(max_workers=1) as hasher:
+            while True:
+                # Fill the block completely (raw reads may return short)
+                filled = 0
+                while filled < block_size:
+                    n = f.readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+                if filled == 0:
+                    break
+                
+                block = view[:filled]
+                pending = None if file_hash is None else hasher.submit(file_hash.update, block)
+                for start in range(0, filled, piece_length):
+                    piece_hashes.append(ManifestUtils.piece_digest(block[start:start + piece_length]))
+                if pending is not None:
+                    pending.result()  # buffer is reused by the next read
+                total_size += filled
+                
+                if filled < block_size:
+                    break
+        
+        return piece_hashes, total_size
+    
+    @staticmethod
+    def _hash_cdc_pieces(filepath: str, piece_length: int,
+                         file_hash) -> Tuple[List[str], List[int], int]:
+        """
+        Split a file into content-defined pieces and hash them.
+        
+        Returns:
+            (piece digests, piece start offsets, total size)
+        """
+        piece_hashes = []
+        piece_offsets = []
+        total_size = 0
+        with open(filepath, 'rb') as f:
+            for piece in GearChunker(piece_length).chunks(f):
+                file_hash.update(piece)
+                piece_hashes.append(ManifestUtils.piece_digest(piece))
+                piece_offsets.append(total_size)
+                total_size += len(piece)
+        return piece_hashes, piece_offsets, total_size
+    
+    @staticmethod
+    def list_directory(directory: str) -> List[Dict]:
+        """
+        List the regular files under a directory in share order.
+        
+        Returns:
+            [{"path": "/"-separated path relative to directory, "length": bytes}],
+            sorted by path
+        """
+        files = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.isfile(path):
+                    relative = os.path.relpath(path, directory).replace(os.sep, "/")
+                    files.append({"path": relative, "length": os.path.getsize(path)})
+        files.sort(key=lambda entry: entry["path"])
+        return files
+    
+    @staticmethod
+    def build_directory_manifest(directory: str, piece_length: int,
+                                 block_size: int = READ_BLOCK_SIZE) -> Optional[Dict]:
+        """
+        Read a directory once and compute the manifest of a directory share.
+        
+        The files are hashed as one stream of fixed-size pieces in
+        list_directory() order; pieces may span file boundaries. The
+        manifest is the build_manifest() format plus:
+        {
+            "name": str,            # directory name, used as the share's filename
+            "files": [{"path": str, "length": int}]
+        }
+        The file ID commits to the file list as well as the content.
+        
+        Args:
+            directory: Directory to share
+            piece_length: Size of each piece in bytes
+            block_size: Read size (rounded to a multiple of piece_length)
+        
+        Returns:
+            Manifest dictionary, or None if failed (or the directory has no files)
+        """
+        try:
+            if piece_length <= 0:
+                raise ValueError("Piece length must be positive")
+            files = ManifestUtils.list_directory(directory)
+            if not files:
+                raise ValueError(f"No files to share in {directory}")
+            
+            file_hash = hashlib.sha256()
+            paths = [os.path.join(directory, *entry["path"].split("/")) for entry in files]
+            with _ConcatenatedReader(paths) as reader:
+                piece_hashes, total_size = ManifestUtils._hash_fixed_stream(
+                    reader, piece_length, block_size, file_hash
+                )
+            if total_size != sum(entry["length"] for entry in files):
+                raise ValueError(f"Files under {directory} changed while hashing")
+            
+            layout = json.dumps(files, separators=(",", ":"), sort_keys=True).encode()
+            manifest = {
+                "file_id": hashlib.sha256(b"dir:" + layout + file_hash.digest()).hexdigest()[:16],
+                "name": os.path.basename(os.path.normpath(directory)),
+                "total_size": total_size,
+                "piece_length": piece_length,
+                "num_pieces": len(piece_hashes),
+                "piece_hashes": piece_hashes,
+                "files": files
+            }
+            logger.info(f"Built manifest for {directory}: {len(files)} files, "
+                        f"{len(piece_hashes)} pieces, {total_size} bytes")
+            return manifest
+        
+        except Exception as e:
+            logger.error(f"Failed to build directory manifest: {e}")
+            return None
+    
+    @staticmethod
+    def save_manifest(manifest: Dict, manifest_directory: str) -> bool:
+        """Save a manifest as <manifest_directory>/<file_id>.json (atomic)."""
+        try:
+            os.makedirs(manifest_directory, exist_ok=True)
+            path = os.path.join(manifest_directory, f"{manifest['file_id']}.json")
+            temp_file = path + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_file, path)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save manifest: {e}")
+            return False
+    
+    @staticmethod
+    def load_manifest(manifest_directory: str, file_id: str) -> Optional[Dict]:
+        """Load a saved manifest, or None if missing."""
+        path = os.path.join(manifest_directory, f"{file_id}.json")
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Failed to load manifest {path}: {e}")
+            return None
+    
+    @staticmethod
+    def delete_manifest(manifest_directory: str, file_id: str):
+        """Delete a saved manifest if present."""
+        try:
+            os.remove(os.path.join(manifest_directory, f"{file_id}.json"))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to delete manifest for {file_id}: {e}")
+
+
+class _ConcatenatedReader:
+    """Reads several files back to back as one stream (readinto only)."""
+    
+    def __init__(self, paths: List[str]):
+        self.paths = paths
+        self.next_index = 0
+        self.current = None
+    
+    def readinto(self, view) -> int:
+        """Fill as much of view as the current file allows; 0 at the end of the last file."""
+        while True:
+            if self.current is None:
+                if self.next_index >= len(self.paths):
+                    return 0
+                self.current = open(self.paths[self.next_index], 'rb', buffering=0)
+                self.next_index += 1
+            n = self.current.readinto(view)
+            if n:
+                return n
+            self.current.close()
+            self.current = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
@@ -0,0 +1,122 @@
+"""
+Piece Store Module
+
+Index from piece digest to the (file, piece) slots that hold it, across
+all shared files. It stores no data of its own: shared files are served
+in place, and identical pieces in different files stay on disk in each of
+them. The index lets a download copy a matching piece from a local file
+instead of fetching it again.
+"""
+
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from shared.storage import PieceStorage, FileHandleCache
+from shared.manifest import ManifestUtils
+
+logger = logging.getLogger(__name__)
+
+
+class PieceStore:
+    """
+    Digest -> locations index with per-file piece maps.
+    
+    A digest's reference count is the number of (file, piece) slots that
+    hold it, not a count of stored copies; it leaves the index when the
+    last file holding it is removed.
+    """
+    
+    def __init__(self, handles: Optional[FileHandleCache] = None):
+        """
+        Initialize an empty store.
+        
+        Args:
+            handles: File handle cache used when reading pieces
+        """
+        self.handles = handles
+        self.locations: Dict[str, Set[Tuple[str, int]]] = defaultdict(set)  # digest -> {(file_id, index)}
+        self.files: Dict[str, Dict] = {}  # file_id -> {"storage", "digests"}
+        self.lock = threading.Lock()
+        self.local_reads = 0
+    
+    def add_file(self, file_id: str, piece_hashes: List[str], storage: PieceStorage) -> int:
+        """
+        Index the pieces of a file (replacing any previous entry for it).
+        
+        Args:
+            file_id: File identifier
+            piece_hashes: Hex digest of each piece, in order
+            storage: Storage the pieces are read from
+        
+        Returns:
+            Number of its pieces already held by other files
+        """
+        self.remove_file(file_id)
+        with self.lock:
+            duplicates = sum(
+                1 for digest in piece_hashes
+                if any(owner != file_id for owner, _ in self.locations.get(digest, ()))
+            )
+            self.files[file_id] = {"storage": storage, "digests": list(piece_hashes)}
+            for index, digest in enumerate(piece_hashes):
+                self.locations[digest].add((file_id, index))
+        return duplicates
+    
+    def remove_file(self, file_id: str):
+        """Drop a file's pieces from the index."""
+        with self.lock:
+            entry = self.files.pop(file_id, None)
+            if entry is None:
+                return
+            for index, digest in enumerate(entry["digests"]):
+                refs = self.locations.get(digest)
+                if refs is None:
+                    continue
+                refs.discard((file_id, index))
+                if not refs:
+                    del self.locations[digest]
+    
+    def refcount(self, digest: str) -> int:
+        """Number of (file, piece) slots holding this digest."""
+        with self.lock:
+            return len(self.locations.get(digest, ()))
+    
+    def read(self, digest: str) -> Optional[bytes]:
+        """
+        Read a piece with this digest from any file that holds it.
+        
+        Data is re-hashed before it is returned, so a file that changed on
+        disk since it was indexed is skipped.
+        
+        Args:
+            digest: Hex SHA-256 of the piece
+        
+        Returns:
+            Piece data, or None if no local copy is available
+        """
+        with self.lock:
+            candidates = [(self.files[file_id]["storage"], index)
+                          for file_id, index in self.locations.get(digest, ())
+                          if file_id in self.files]
+        
+        for storage, index in candidates:
+            data = storage.read_piece(index, self.handles)
+            if data is not None and ManifestUtils.piece_digest(data) == digest:
+                with self.lock:
+                    self.local_reads += 1
+                return data
+            logger.warning(f"Local copy of piece {digest[:12]} no longer matches its digest")
+        return None
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get index counters."""
+        with self.lock:
+            return {
+                "files": len(self.files),
+                "pieces": sum(len(refs) for refs in self.locations.values()),
+                "unique_pieces": len(self.locations),
+                "shared_pieces": sum(1 for refs in self.locations.values() if len(refs) > 1),
+                "local_reads": self.local_reads
+            }
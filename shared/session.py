@@ -0,0 +1,412 @@
+"""
+Peer Session Module
+
+Keeps TCP connections to other peers open so many piece requests can
+share one connection instead of paying a handshake per piece.
+"""
+
+import time
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from shared.utils import SocketUtils, MessageBuilder, MAX_CHUNK_SIZE
+from shared.frames import BinaryFrames, CAPABILITY_BINARY
+from shared.compression import COMPRESSION_ZLIB, decompress_piece
+
+logger = logging.getLogger(__name__)
+
+SESSION_IDLE_TIMEOUT = 30.0  # Server closes sessions idle this long
+CLIENT_IDLE_TIMEOUT = 20.0   # Client drops idle sessions before the server does
+DEFAULT_PIPELINE_WINDOW = 8  # Outstanding piece requests per session
+
+
+class PeerSession:
+    """
+    One persistent connection to a peer carrying many piece requests.
+    
+    Up to `window` requests may be outstanding at once. Responses are matched
+    back to their callers by (file_id, chunk_index), so the peer keeps
+    streaming pieces instead of idling for a round trip between them. The
+    window only opens after the peer confirms keep_alive on its first
+    response; until then a single request is in flight. The first request
+    also offers the session capabilities, and if the peer accepts "binary"
+    the rest of the session uses binary frames instead of JSON headers.
+    If it accepts "zlib", it may send compressed pieces, which are
+    decompressed here before they reach the caller.
+    
+    There is no reader thread: whichever waiting caller finds the socket
+    free reads the next response and hands it to its owner.
+    """
+    
+    def __init__(self, host: str, port: int, timeout: float, window: int = 1,
+                 capabilities: List[str] = None, buffer_pool=None):
+        """
+        Initialize a session (not yet connected).
+        
+        Args:
+            host: Peer host
+            port: Peer port
+            timeout: Connect/receive timeout in seconds
+            window: Maximum outstanding requests once keep_alive is confirmed
+            capabilities: Session features to offer the peer
+            buffer_pool: Optional BufferPool that received pieces are read into
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.window = max(1, window)
+        self.sock = None
+        self.keep_alive = False  # Set once the peer confirms session mode
+        self.capabilities = capabilities or []
+        self.binary = False  # Set once the peer accepts binary frames
+        self.buffer_pool = buffer_pool
+        self.broken = False
+        self.last_used = time.time()
+        
+        self.outstanding = 0
+        self.pending: Dict[Tuple[str, int], List[Dict]] = defaultdict(list)
+        self.cancelled: Dict[Tuple[str, int], int] = defaultdict(int)  # Responses to discard
+        self.reading = False
+        self.cond = threading.Condition()
+        self.send_lock = threading.Lock()
+    
+    def connect(self) -> bool:
+        """Open the connection."""
+        self.sock = SocketUtils.connect_to_server(self.host, self.port, timeout=self.timeout)
+        return self.sock is not None
+    
+    def request_piece(self, file_id: str, chunk_index: int, want_proof: bool = False,
+                      into: Optional[memoryview] = None,
+                      max_size: Optional[int] = None) -> Optional[Tuple[Optional[bytes], Dict]]:
+        """
+        Request one piece over this session, waiting for a window slot.
+        
+        Args:
+            file_id: File identifier
+            chunk_index: Piece index
+            want_proof: Ask for a Merkle proof
+            into: Optional view to receive the piece into (used if the size matches)
+            max_size: Largest piece to accept (default: len(into), else
+                MAX_CHUNK_SIZE); a peer announcing more breaks the session
+        
+        Returns:
+            (piece data or None, CHUNK_RESPONSE header) if the exchange
+            completed, or None if the connection failed
+        """
+        if max_size is None:
+            max_size = len(into) if into is not None else MAX_CHUNK_SIZE
+        slot = {"done": False, "result": None, "into": into, "max_size": min(max_size, MAX_CHUNK_SIZE)}
+        with self.cond:
+            while not self.broken and self.outstanding >= self._limit():
+                self.cond.wait()
+            if self.broken:
+                return None
+            self.outstanding += 1
+            self.pending[(file_id, chunk_index)].append(slot)
+        
+        with self.send_lock:
+            sent = self._send_request(file_id, chunk_index, want_proof)
+        if not sent:
+            with self.cond:
+                self._fail()
+                self.cond.notify_all()
+        
+        return self._wait_for(slot)
+    
+    def _send_request(self, file_id: str, chunk_index: int, want_proof: bool) -> bool:
+        """Send a request in the session's negotiated encoding (send_lock held)."""
+        if self.binary:
+            try:
+                frame = BinaryFrames.request(file_id, chunk_index, want_proof)
+            except ValueError as e:
+                logger.error(f"Cannot frame request: {e}")
+                return False
+            return BinaryFrames.send_frame(self.sock, frame)
+        
+        # Offer capabilities only on the first request of the session
+        offered = None if self.keep_alive else self.capabilities
+        message = MessageBuilder.chunk_request_message(file_id, chunk_index, want_proof,
+                                                       keep_alive=True, capabilities=offered)
+        return SocketUtils.send_message(self.sock, message)
+    
+    def cancel_file(self, file_id: str):
+        """
+        Abandon every outstanding request for a file.
+        
+        Waiting callers get None. Binary sessions also send CANCEL so the
+        peer can drop requests it hasn't served yet; responses that still
+        arrive are discarded.
+        """
+        with self.cond:
+            keys = [key for key in self.pending if key[0] == file_id]
+            for key in keys:
+                for slot in self.pending.pop(key):
+                    slot["done"] = True
+                    self.outstanding -= 1
+                    self.cancelled[key] += 1
+            self.cond.notify_all()
+        
+        if self.binary and keys:
+            with self.send_lock:
+                for key in keys:
+                    if not BinaryFrames.send_frame(self.sock, BinaryFrames.cancel(*key)):
+                        break
+    
+    def _limit(self) -> int:
+        return self.window if self.keep_alive else 1
+    
+    def _wait_for(self, slot: Dict) -> Optional[Tuple[Optional[bytes], Dict]]:
+        """Wait until a slot is filled, reading responses whenever nobody else is."""
+        while True:
+            with self.cond:
+                while not slot["done"] and self.reading:
+                    self.cond.wait()
+                if slot["done"]:
+                    return slot["result"]
+                self.reading = True
+            
+            result = self._read_response()
+            
+            with self.cond:
+                self.reading = False
+                if result is None:
+                    self._fail()
+                else:
+                    self._deliver(*result)
+                self.cond.notify_all()
+    
+    def _read_response(self) -> Optional[Tuple[Optional[bytes], Dict]]:
+        """Read one response header and its piece data off the socket."""
+        if self.binary:
+            response = BinaryFrames.receive_frame(self.sock, timeout=self.timeout)
+        else:
+            response = SocketUtils.receive_message(self.sock, timeout=self.timeout)
+        if not response:
+            return None
+        
+        if response.get("status") != "success":
+            # No data follows a failed response
+            return None, response
+        
+        # Receive straight into the waiting caller's buffer if it gave one
+        with self.cond:
+            slots = self.pending.get((response.get("file_id"), response.get("chunk_index")))
+            into = slots[0]["into"] if slots else None
+            max_size = slots[0]["max_size"] if slots else MAX_CHUNK_SIZE
+        
+        chunk_size = response.get("chunk_size", 0)
+        if not isinstance(chunk_size, int) or not 0 <= chunk_size <= max_size:
+            # The payload can't be skipped safely, so the session is dropped
+            logger.error(f"Piece of {chunk_size} bytes from {self.host}:{self.port} exceeds {max_size}")
+            return None
+        
+        if response.get("compression") is not None:
+            return self._read_compressed(response, into, max_size)
+        
+        chunk_data = SocketUtils.receive_chunk_data(self.sock, chunk_size,
+                                                    timeout=self.timeout, pool=self.buffer_pool,
+                                                    into=into)
+        if chunk_data is None:
+            return None
+        return chunk_data, response
+    
+    def _read_compressed(self, response: Dict, into: Optional[memoryview],
+                         max_size: int) -> Optional[Tuple[Optional[bytes], Dict]]:
+        """
+        Read a compressed piece and expand it into the caller's buffer, if any.
+        
+        The advertised raw_size must equal len(into) when the caller gave a
+        buffer, and may not exceed max_size otherwise; anything else breaks
+        the session before a byte is inflated. A payload that fails to
+        decompress is returned as (None, response), so the caller can try
+        another peer; the session stays usable.
+        """
+        if response.get("compression") != COMPRESSION_ZLIB:
+            logger.error(f"Unsupported compression {response.get('compression')!r} from {self.host}:{self.port}")
+            return None
+        raw_size = response.get("raw_size")
+        expected = len(into) if into is not None else None
+        if not isinstance(raw_size, int) or not 0 < raw_size <= max_size or \
+                (expected is not None and raw_size != expected):
+            logger.error(f"Compressed piece of {raw_size} bytes from {self.host}:{self.port} "
+                         f"does not match the expected size {expected or max_size}")
+            return None
+        payload = SocketUtils.receive_chunk_data(self.sock, response.get("chunk_size", 0),
+                                                 timeout=self.timeout, pool=self.buffer_pool)
+        if payload is None:
+            return None
+        
+        raw = decompress_piece(payload, raw_size)
+        if self.buffer_pool is not None:
+            self.buffer_pool.release(payload)
+        if raw is None:
+            return None, response
+        if into is not None:
+            into[:] = raw
+            return into, response
+        return raw, response
+    
+    def _deliver(self, chunk_data: Optional[bytes], response: Dict):
+        """Hand a response to the oldest caller waiting on its piece (cond held)."""
+        key = (response.get("file_id"), response.get("chunk_index"))
+        slots = self.pending.get(key)
+        if not slots and self.cancelled.get(key):
+            # Peer sent it before seeing our CANCEL
+            self.cancelled[key] -= 1
+            if self.buffer_pool is not None and chunk_data is not None:
+                self.buffer_pool.release(chunk_data)  # Ignores non-pooled views
+            return
+        if not slots:
+            logger.error(f"Unexpected response for piece {key} from {self.host}:{self.port}")
+            self._fail()
+            return
+        
+        slot = slots.pop(0)
+        if not slots:
+            del self.pending[key]
+        slot["result"] = (chunk_data, response)
+        slot["done"] = True
+        self.outstanding -= 1
+        self.last_used = time.time()
+        
+        self.keep_alive = bool(response.get("keep_alive"))
+        if CAPABILITY_BINARY in response.get("capabilities", []):
+            self.binary = True
+        if not self.keep_alive:
+            # Peer closes the connection after one response
+            self._fail()
+    
+    def _fail(self):
+        """Mark the session broken and release every waiting caller (cond held)."""
+        self.broken = True
+        for slots in self.pending.values():
+            for slot in slots:
+                slot["done"] = True
+        self.pending.clear()
+        self.outstanding = 0
+        self.close()
+    
+    def is_usable(self) -> bool:
+        """Check the session is open and not idle long enough for the peer to drop it."""
+        if self.broken:
+            return False
+        return self.outstanding > 0 or time.time() - self.last_used <= CLIENT_IDLE_TIMEOUT
+    
+    def close(self):
+        """Close the connection."""
+        if self.sock:
+            try:
+                self.sock.close()
+            except:
+                pass
+            self.sock = None
+
+
+class SessionPool:
+    """One shared, pipelined session per peer, reused across piece downloads."""
+    
+    def __init__(self, timeout: float, window: int = DEFAULT_PIPELINE_WINDOW,
+                 capabilities: List[str] = None, buffer_pool=None):
+        """
+        Initialize the pool.
+        
+        Args:
+            timeout: Connect/receive timeout for new sessions
+            window: Outstanding requests allowed per peer
+            capabilities: Session features to offer (default: binary frames)
+            buffer_pool: Optional BufferPool for received pieces; callers
+                release each piece back to it when done
+        """
+        self.timeout = timeout
+        self.window = window
+        self.capabilities = [CAPABILITY_BINARY] if capabilities is None else capabilities
+        self.buffer_pool = buffer_pool
+        self.sessions: Dict[Tuple[str, int], PeerSession] = {}
+        self.legacy_peers = set()  # Peers that close after every response
+        self.lock = threading.Lock()
+    
+    def _session(self, host: str, port: int) -> Tuple[Optional[PeerSession], bool]:
+        """Get the peer's session or open a new one; the flag says whether it was reused."""
+        key = (host, port)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None and session.is_usable():
+                return session, True
+            stale = self.sessions.pop(key, None)
+        if stale is not None:
+            stale.close()
+        
+        session = PeerSession(host, port, self.timeout, self.window, self.capabilities,
+                              self.buffer_pool)
+        if not session.connect():
+            return None, False
+        
+        with self.lock:
+            existing = self.sessions.get(key)
+            if existing is not None and existing.is_usable():
+                # Another thread connected first; share its session
+                session.close()
+                return existing, True
+            self.sessions[key] = session
+        return session, False
+    
+    def _request_once(self, host: str, port: int, file_id: str, chunk_index: int,
+                      want_proof: bool, into: Optional[memoryview],
+                      max_size: Optional[int]) -> Tuple[Optional[bytes], Dict]:
+        """One request on a private connection (peers without session support)."""
+        session = PeerSession(host, port, self.timeout, buffer_pool=self.buffer_pool)
+        if not session.connect():
+            return None, {}
+        result = session.request_piece(file_id, chunk_index, want_proof, into, max_size)
+        session.close()
+        return result or (None, {})
+    
+    def request_piece(self, host: str, port: int, file_id: str, chunk_index: int,
+                      want_proof: bool = False,
+                      into: Optional[memoryview] = None,
+                      max_size: Optional[int] = None) -> Tuple[Optional[bytes], Dict]:
+        """
+        Download one piece from a peer over its shared session.
+        
+        A request on a reused session that fails is retried once on a fresh
+        connection, since the peer may have closed it while it sat idle.
+        If `into` is given and the piece size matches, the piece is received
+        straight into it and `into` itself is returned as the data. Pieces
+        announced larger than max_size are refused (see PeerSession.request_piece).
+        
+        Returns:
+            (piece data or None, CHUNK_RESPONSE header or {})
+        """
+        for _ in range(2):
+            if (host, port) in self.legacy_peers:
+                return self._request_once(host, port, file_id, chunk_index, want_proof, into, max_size)
+            
+            session, reused = self._session(host, port)
+            if session is None:
+                return None, {}
+            
+            result = session.request_piece(file_id, chunk_index, want_proof, into, max_size)
+            if result is not None:
+                if not session.keep_alive:
+                    self.legacy_peers.add((host, port))
+                return result
+            if not reused:
+                break
+        return None, {}
+    
+    def cancel_file(self, file_id: str):
+        """Abandon outstanding requests for a file on every session."""
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.cancel_file(file_id)
+    
+    def close_all(self):
+        """Close every session."""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
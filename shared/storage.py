@@ -0,0 +1,718 @@
+"""
+Piece Storage Module
+
+Maps piece indices onto byte ranges on disk so peers can serve pieces
+straight from the original file instead of from per-chunk copies.
+"""
+
+import os
+import mmap
+import bisect
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (path, offset, length) - one contiguous byte range backing part of a piece
+Extent = Tuple[str, int, int]
+
+MAX_OPEN_FILES = 64  # Read handles kept open by a FileHandleCache
+
+_seek_lock = threading.Lock()
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") and "SC_IOV_MAX" in os.sysconf_names else 1024
+
+
+def positional_read(f, length: int, offset: int) -> bytes:
+    """
+    Read bytes at an absolute offset without disturbing other readers.
+
+    Uses os.pread where available; otherwise falls back to seek + read
+    under a lock (e.g. on Windows).
+
+    Args:
+        f: Open binary file object
+        length: Number of bytes to read
+        offset: Absolute file offset
+
+    Returns:
+        Bytes read (may be short at end of file)
+    """
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), length, offset)
+    with _seek_lock:
+        f.seek(offset)
+        return f.read(length)
+
+
+def positional_write(f, data: bytes, offset: int) -> int:
+    """
+    Write bytes at an absolute offset without disturbing other writers.
+    
+    Uses os.pwrite where available; otherwise falls back to seek + write
+    under a lock (e.g. on Windows).
+    
+    Args:
+        f: Open binary file object (unbuffered or flushed by the caller)
+        data: Bytes to write
+        offset: Absolute file offset
+    
+    Returns:
+        Number of bytes written
+    """
+    if hasattr(os, "pwrite"):
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += os.pwrite(f.fileno(), view[written:], offset + written)
+        return written
+    with _seek_lock:
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        return len(data)
+
+
+def positional_writev(f, buffers: List[bytes], offset: int) -> int:
+    """
+    Write several buffers back to back at an absolute offset.
+    
+    Uses os.pwritev where available so the buffers aren't joined into one
+    copy first; otherwise joins them and uses positional_write.
+    
+    Args:
+        f: Open binary file object (unbuffered or flushed by the caller)
+        buffers: Bytes-like objects written in order
+        offset: Absolute file offset of the first buffer
+    
+    Returns:
+        Number of bytes written
+    """
+    total = sum(len(buffer) for buffer in buffers)
+    if not hasattr(os, "pwritev") or len(buffers) > _IOV_MAX:
+        return positional_write(f, b''.join(buffers), offset)
+    
+    written = os.pwritev(f.fileno(), buffers, offset)
+    if written < total:
+        # Short vectored write: finish the remainder as one buffer
+        rest = b''.join(buffers)[written:]
+        written += positional_write(f, rest, offset + written)
+    return written
+
+
+def advise_willneed(path: str, offset: int, length: int):
+    """
+    Hint the OS to start reading a byte range into the page cache.
+    
+    No-op where posix_fadvise is unavailable (e.g. Windows, macOS).
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_WILLNEED)
+    except OSError as e:
+        logger.debug(f"fadvise failed for {path}: {e}")
+
+
+class FileHandleCache:
+    """
+    Bounded LRU of read-only file handles shared by piece readers.
+    
+    Reads use positional I/O (pread/sendfile with an explicit offset), so
+    one handle can serve any number of concurrent readers. A handle evicted
+    or invalidated while in use is closed when its last user releases it.
+    """
+    
+    def __init__(self, max_open: int = MAX_OPEN_FILES, mode: str = 'rb'):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_open: Handles kept open at once
+            mode: Open mode; 'r+b' handles (for positional writes) are unbuffered
+        """
+        self.max_open = max_open
+        self.mode = mode
+        self.handles: "OrderedDict[str, Dict]" = OrderedDict()  # path -> {"file", "refs", "closed"}
+        self.lock = threading.Lock()
+        self.opens = 0
+        self.hits = 0
+        self.evictions = 0
+    
+    @contextmanager
+    def open(self, path: str):
+        """
+        Borrow a handle for path, opening it on first use.
+        
+        Args:
+            path: File to read
+        
+        Yields:
+            Binary file object (don't close it, and don't rely on its position)
+        """
+        entry = self._acquire(path)
+        try:
+            yield entry["file"]
+        finally:
+            self._release(entry)
+    
+    def _acquire(self, path: str) -> Dict:
+        with self.lock:
+            entry = self.handles.get(path)
+            if entry is not None:
+                self.handles.move_to_end(path)
+                entry["refs"] += 1
+                self.hits += 1
+                return entry
+        
+        f = open(path, self.mode, buffering=0 if '+' in self.mode else -1)
+        to_close = []
+        with self.lock:
+            entry = self.handles.get(path)
+            if entry is not None:
+                # Another reader opened it meanwhile
+                to_close.append(f)
+                entry["refs"] += 1
+            else:
+                self.opens += 1
+                entry = {"file": f, "refs": 1, "closed": False}
+                self.handles[path] = entry
+                while len(self.handles) > self.max_open:
+                    _, evicted = self.handles.popitem(last=False)
+                    self.evictions += 1
+                    to_close.extend(self._retire(evicted))
+        FileHandleCache._close(to_close)
+        return entry
+    
+    def _release(self, entry: Dict):
+        to_close = []
+        with self.lock:
+            entry["refs"] -= 1
+            if entry["closed"] and entry["refs"] == 0:
+                to_close.append(entry["file"])
+        FileHandleCache._close(to_close)
+    
+    @staticmethod
+    def _retire(entry: Dict) -> List:
+        """Mark a handle dropped from the cache; return it if it can be closed now."""
+        entry["closed"] = True
+        return [entry["file"]] if entry["refs"] == 0 else []
+    
+    @staticmethod
+    def _close(files: List):
+        for f in files:
+            try:
+                f.close()
+            except OSError as e:
+                logger.debug(f"Failed to close {f.name}: {e}")
+    
+    def invalidate(self, path: str):
+        """
+        Close cached handles for a file, or for every file under a directory.
+        
+        Call this when a file stops being served or is replaced on disk.
+        """
+        prefix = os.path.join(path, "")
+        to_close = []
+        with self.lock:
+            for cached_path in [p for p in self.handles if p == path or p.startswith(prefix)]:
+                to_close.extend(self._retire(self.handles.pop(cached_path)))
+        FileHandleCache._close(to_close)
+    
+    def close_all(self):
+        """Close every cached handle."""
+        to_close = []
+        with self.lock:
+            for entry in self.handles.values():
+                to_close.extend(self._retire(entry))
+            self.handles.clear()
+        FileHandleCache._close(to_close)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get handle counters."""
+        with self.lock:
+            return {
+                "opens": self.opens,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "open": len(self.handles)
+            }
+
+
+class PieceStorage:
+    """Base class for piece storage backends."""
+
+    def piece_extents(self, index: int) -> Optional[List[Extent]]:
+        """
+        Get the on-disk byte ranges that make up a piece.
+
+        Args:
+            index: Piece index
+
+        Returns:
+            List of (path, offset, length) extents, or None if unavailable
+        """
+        raise NotImplementedError
+
+    def is_available(self) -> bool:
+        """Check whether the backing data is still present on disk."""
+        raise NotImplementedError
+
+    def location(self) -> str:
+        """Get the file or directory holding the pieces."""
+        raise NotImplementedError
+    
+    def read_piece(self, index: int, handles: Optional[FileHandleCache] = None) -> Optional[bytes]:
+        """
+        Read a whole piece into memory.
+
+        Args:
+            index: Piece index
+            handles: Borrow file handles from this cache instead of opening each time
+
+        Returns:
+            Piece data as bytes, or None if failed
+        """
+        extents = self.piece_extents(index)
+        if extents is None:
+            return None
+
+        try:
+            parts = []
+            for path, offset, length in extents:
+                with (handles.open(path) if handles else open(path, 'rb')) as f:
+                    data = positional_read(f, length, offset)
+                if len(data) != length:
+                    logger.error(f"Short read on {path} at {offset}: {len(data)}/{length} bytes")
+                    return None
+                parts.append(data)
+            return parts[0] if len(parts) == 1 else b''.join(parts)
+        except Exception as e:
+            logger.error(f"Failed to read piece {index}: {e}")
+            return None
+
+
+class SingleFileStorage(PieceStorage):
+    """
+    Serves piece N from offset N * piece_length of one original file, or
+    from explicit piece offsets for content-defined pieces.
+    """
+
+    def __init__(self, path: str, piece_length: int, total_size: int,
+                 piece_offsets: Optional[List[int]] = None):
+        """
+        Initialize single-file storage.
+
+        Args:
+            path: Path to the complete file
+            piece_length: Size of each piece in bytes
+            total_size: Total file size in bytes
+            piece_offsets: Start offset of each piece (content-defined chunking);
+                pieces then run up to the next offset
+        """
+        if piece_length <= 0:
+            raise ValueError("Piece length must be positive")
+        self.path = path
+        self.piece_length = piece_length
+        self.total_size = total_size
+        self.piece_offsets = piece_offsets
+        if piece_offsets is not None:
+            self.num_pieces = len(piece_offsets)
+        else:
+            self.num_pieces = (total_size + piece_length - 1) // piece_length
+        self._write_file = None
+        self._map = None
+
+    def piece_size(self, index: int) -> int:
+        """Get the size of a piece (the last piece may be short)."""
+        if self.piece_offsets is not None:
+            end = self.piece_offsets[index + 1] if index + 1 < self.num_pieces else self.total_size
+            return end - self.piece_offsets[index]
+        return min(self.piece_length, self.total_size - index * self.piece_length)
+
+    def piece_offset(self, index: int) -> int:
+        """Get the file offset a piece starts at."""
+        if self.piece_offsets is not None:
+            return self.piece_offsets[index]
+        return index * self.piece_length
+    
+    def piece_extents(self, index: int) -> Optional[List[Extent]]:
+        if not isinstance(index, int) or not 0 <= index < self.num_pieces:
+            return None
+        return [(self.path, self.piece_offset(index), self.piece_size(index))]
+
+    def is_available(self) -> bool:
+        try:
+            return os.path.getsize(self.path) == self.total_size
+        except OSError:
+            return False
+    
+    def location(self) -> str:
+        return self.path
+    
+    def preallocate(self) -> bool:
+        """
+        Create the target file at its full size so pieces can be written in place.
+        
+        Uses posix_fallocate where supported, otherwise extends the file
+        with truncate (sparse on most filesystems).
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+            self._write_file = open(self.path, mode, buffering=0)
+            
+            if hasattr(os, "posix_fallocate") and self.total_size > 0:
+                try:
+                    os.posix_fallocate(self._write_file.fileno(), 0, self.total_size)
+                except OSError as e:
+                    logger.debug(f"fallocate unsupported ({e}), using sparse file")
+            self._write_file.truncate(self.total_size)
+            
+            logger.info(f"Preallocated {self.path} ({self.total_size} bytes)")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to preallocate {self.path}: {e}")
+            return False
+    
+    def enable_mmap(self) -> bool:
+        """
+        Map the preallocated file so pieces can be received straight into it.
+        
+        Returns:
+            True if the file is mapped, False if mapping isn't possible
+        """
+        try:
+            if self._write_file is None or self.total_size <= 0:
+                return False
+            self._map = mmap.mmap(self._write_file.fileno(), self.total_size)
+            return True
+        except (OSError, ValueError) as e:
+            logger.debug(f"mmap unavailable for {self.path} ({e}), using positional writes")
+            self._map = None
+            return False
+    
+    def piece_buffer(self, index: int) -> Optional[memoryview]:
+        """
+        Get a writable view of a piece's bytes in the mapped file.
+        
+        The caller must release the view before the storage is finalized.
+        
+        Args:
+            index: Piece index
+        
+        Returns:
+            memoryview over the piece, or None if the file isn't mapped
+        """
+        if self._map is None or not 0 <= index < self.num_pieces:
+            return None
+        start = self.piece_offset(index)
+        return memoryview(self._map)[start:start + self.piece_size(index)]
+    
+    def write_piece(self, index: int, data: bytes) -> bool:
+        """
+        Write a piece at its offset in the preallocated file.
+        
+        Args:
+            index: Piece index
+            data: Piece data
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            if self._write_file is None:
+                logger.error(f"{self.path} is not open for writing")
+                return False
+            if not 0 <= index < self.num_pieces:
+                logger.error(f"Piece index {index} out of range")
+                return False
+            positional_write(self._write_file, data, self.piece_offset(index))
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to write piece {index}: {e}")
+            return False
+    
+    def write_pieces(self, first_index: int, pieces: List[bytes]) -> bool:
+        """
+        Write a run of consecutive pieces with one vectored write.
+        
+        Every piece but the last must be exactly piece_size() long.
+        
+        Args:
+            first_index: Index of the first piece
+            pieces: Piece data, in index order
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            if self._write_file is None:
+                logger.error(f"{self.path} is not open for writing")
+                return False
+            if first_index < 0 or first_index + len(pieces) > self.num_pieces:
+                logger.error(f"Pieces {first_index}-{first_index + len(pieces) - 1} out of range")
+                return False
+            positional_writev(self._write_file, pieces, self.piece_offset(first_index))
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to write pieces {first_index}-{first_index + len(pieces) - 1}: {e}")
+            return False
+    
+    def finalize(self, final_path: str, final_size: Optional[int] = None) -> bool:
+        """
+        Close the file and move it to its final location.
+        
+        Args:
+            final_path: Where the completed file should live
+            final_size: Truncate to this size first (when total size was estimated)
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            # Unmap before truncating (a mapped file can't shrink on Windows)
+            self._unmap()
+            if final_size is not None and final_size != self.total_size:
+                self._write_file.truncate(final_size)
+                self.total_size = final_size
+            self.close()
+            os.replace(self.path, final_path)
+            self.path = final_path
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to finalize {self.path}: {e}")
+            return False
+    
+    def _unmap(self):
+        if self._map is not None:
+            try:
+                self._map.flush()
+                self._map.close()
+            except BufferError:
+                # A piece view is still held somewhere; it unmaps when collected
+                logger.warning(f"Piece views of {self.path} still in use, leaving mapping open")
+            except Exception as e:
+                logger.error(f"Failed to unmap {self.path}: {e}")
+            self._map = None
+    
+    def close(self):
+        """Unmap the file and close the write handle if open."""
+        self._unmap()
+        if self._write_file is not None:
+            try:
+                self._write_file.close()
+            finally:
+                self._write_file = None
+
+
+class ChunkDirectoryStorage(PieceStorage):
+    """Legacy layout: each piece stored as <chunk_directory>/chunk_N."""
+
+    def __init__(self, chunk_directory: str):
+        """
+        Initialize chunk-directory storage.
+
+        Args:
+            chunk_directory: Directory containing chunk_N files
+        """
+        self.chunk_directory = chunk_directory
+
+    def piece_extents(self, index: int) -> Optional[List[Extent]]:
+        if not isinstance(index, int) or index < 0:
+            return None
+        chunk_filename = os.path.join(self.chunk_directory, f"chunk_{index}")
+        try:
+            return [(chunk_filename, 0, os.path.getsize(chunk_filename))]
+        except OSError:
+            return None
+
+    def is_available(self) -> bool:
+        return os.path.isdir(self.chunk_directory)
+    
+    def location(self) -> str:
+        return self.chunk_directory
+
+
+class MultiFileStorage(PieceStorage):
+    """
+    Pieces laid over the files of a directory share, concatenated in
+    manifest order as in multi-file torrents: a piece can end in one file
+    and continue at the start of the next.
+    """
+    
+    def __init__(self, root: str, files: List[Dict], piece_length: int):
+        """
+        Initialize multi-file storage.
+        
+        Args:
+            root: Directory holding the files
+            files: [{"path": "/"-separated relative path, "length": bytes}] in piece order
+            piece_length: Size of each piece in bytes
+        """
+        if piece_length <= 0:
+            raise ValueError("Piece length must be positive")
+        self.root = root
+        self.files = files
+        self.piece_length = piece_length
+        self.starts = []  # Offset of each file in the concatenated data
+        self.total_size = 0
+        for entry in files:
+            self.starts.append(self.total_size)
+            self.total_size += entry["length"]
+        self.num_pieces = (self.total_size + piece_length - 1) // piece_length
+        self._write_handles: Optional[FileHandleCache] = None
+    
+    def file_path(self, file_index: int) -> str:
+        """Get the on-disk path of one file of the share."""
+        return os.path.join(self.root, *self.files[file_index]["path"].split("/"))
+    
+    def piece_size(self, index: int) -> int:
+        """Get the size of a piece (the last piece may be short)."""
+        return min(self.piece_length, self.total_size - index * self.piece_length)
+    
+    def piece_offset(self, index: int) -> int:
+        """Get the offset a piece starts at in the concatenated data."""
+        return index * self.piece_length
+    
+    def piece_extents(self, index: int) -> Optional[List[Extent]]:
+        if not isinstance(index, int) or not 0 <= index < self.num_pieces:
+            return None
+        
+        offset = self.piece_offset(index)
+        remaining = self.piece_size(index)
+        # Last file starting at or before the offset (skips empty files there)
+        file_index = bisect.bisect_right(self.starts, offset) - 1
+        extents = []
+        while remaining > 0:
+            within = offset - self.starts[file_index]
+            length = min(remaining, self.files[file_index]["length"] - within)
+            if length > 0:
+                extents.append((self.file_path(file_index), within, length))
+                offset += length
+                remaining -= length
+            file_index += 1
+        return extents
+    
+    def is_available(self) -> bool:
+        try:
+            return all(os.path.getsize(self.file_path(i)) == entry["length"]
+                       for i, entry in enumerate(self.files))
+        except OSError:
+            return False
+    
+    def location(self) -> str:
+        return self.root
+    
+    def preallocate(self) -> bool:
+        """
+        Create every file of the share at its full size.
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            for i, entry in enumerate(self.files):
+                path = self.file_path(i)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                    f.truncate(entry["length"])
+            self._write_handles = FileHandleCache(MAX_OPEN_FILES, mode='r+b')
+            logger.info(f"Preallocated {len(self.files)} files under {self.root} ({self.total_size} bytes)")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to preallocate {self.root}: {e}")
+            return False
+    
+    def enable_mmap(self) -> bool:
+        """Pieces span files, so they can't be received into one mapping."""
+        return False
+    
+    def piece_buffer(self, index: int) -> Optional[memoryview]:
+        return None
+    
+    def write_piece(self, index: int, data: bytes) -> bool:
+        """
+        Write a piece across the files it spans.
+        
+        Args:
+            index: Piece index
+            data: Piece data
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            if self._write_handles is None:
+                logger.error(f"{self.root} is not open for writing")
+                return False
+            extents = self.piece_extents(index)
+            if extents is None:
+                logger.error(f"Piece index {index} out of range")
+                return False
+            view = memoryview(data)
+            position = 0
+            for path, offset, length in extents:
+                with self._write_handles.open(path) as f:
+                    positional_write(f, view[position:position + length], offset)
+                position += length
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to write piece {index}: {e}")
+            return False
+    
+    def write_pieces(self, first_index: int, pieces: List[bytes]) -> bool:
+        """
+        Write a run of consecutive pieces.
+        
+        Args:
+            first_index: Index of the first piece
+            pieces: Piece data, in index order
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        return all(self.write_piece(first_index + i, piece) for i, piece in enumerate(pieces))
+    
+    def finalize(self, final_path: str, final_size: Optional[int] = None) -> bool:
+        """
+        Close the files and move the directory to its final location.
+        
+        Args:
+            final_path: Where the completed directory should live (must not exist)
+            final_size: Unused; a directory share's size is always known
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            self.close()
+            if final_path != self.root:
+                os.rename(self.root, final_path)
+                self.root = final_path
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to finalize {self.root}: {e}")
+            return False
+    
+    def close(self):
+        """Close the write handles if open."""
+        if self._write_handles is not None:
+            self._write_handles.close_all()
+            self._write_handles = None
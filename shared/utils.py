@@ -4,17 +4,30 @@ Shared utilities for P2P File-Sharing System
 Provides common functionality for TCP communication and message handling.
 """
 
+import os
+import errno
+import select
 import socket
 import json
 import logging
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from shared.storage import positional_read
 
 logger = logging.getLogger(__name__)
 
 # Default configuration
 DEFAULT_CHUNK_SIZE = 262144  # 256 KB
-MAX_CHUNK_SIZE = 1048576     # 1 MB
+MAX_CHUNK_SIZE = 16777216    # 16 MB
+MAX_MESSAGE_SIZE = 33554432  # 32 MB cap on one JSON message (large manifests fit well under it)
+TARGET_MAX_PIECES = 4096     # Adaptive piece size keeps files under this many pieces
 BUFFER_SIZE = 4096
+SEND_BLOCK_SIZE = 262144     # Block size for the buffered sendfile fallback
+
+# errno values meaning "sendfile can't handle this fd pair", not a broken socket
+_SENDFILE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+                         getattr(errno, "EOPNOTSUPP", errno.EINVAL),
+                         getattr(errno, "ENOTSUP", errno.EINVAL)}
 
 
 class SocketUtils:
@@ -33,15 +46,18 @@ class SocketUtils:
             True if successful, False otherwise
         """
         try:
-            data = json.dumps(message).encode('utf-8')
-            # Prefix message with 8-byte big-endian length for framing
-            length_prefix = len(data).to_bytes(8, byteorder='big')
-            sock.sendall(length_prefix + data)
+            sock.sendall(SocketUtils.encode_message(message))
             return True
         except Exception as e:
             logger.error(f"Failed to send message: {e}")
             return False
     
+    @staticmethod
+    def encode_message(message: Dict) -> bytes:
+        """Encode a JSON message with its 8-byte big-endian length prefix."""
+        data = json.dumps(message).encode('utf-8')
+        return len(data).to_bytes(8, byteorder='big') + data
+    
     @staticmethod
     def receive_message(sock: socket.socket, timeout: Optional[float] = None) -> Optional[Dict]:
         """
@@ -59,37 +75,54 @@ class SocketUtils:
                 sock.settimeout(timeout)
 
             # Read 8-byte length prefix first
-            prefix = b''
-            while len(prefix) < 8:
-                chunk = sock.recv(8 - len(prefix))
-                if not chunk:
-                    return None
-                prefix += chunk
+            prefix = bytearray(8)
+            received = SocketUtils._recv_into(sock, memoryview(prefix))
+            if received == 0:
+                return None
+            if received < 8:
+                logger.error("Connection closed while receiving message length")
+                return None
 
             msg_length = int.from_bytes(prefix, byteorder='big')
-            # Read the exact message length
-            data = b''
-            while len(data) < msg_length:
-                to_read = min(BUFFER_SIZE, msg_length - len(data))
-                chunk = sock.recv(to_read)
-                if not chunk:
-                    logger.error("Connection closed while receiving message body")
-                    return None
-                data += chunk
+            if msg_length > MAX_MESSAGE_SIZE:
+                # Don't let an unauthenticated prefix size the buffer
+                logger.error(f"Message length {msg_length} exceeds {MAX_MESSAGE_SIZE} bytes")
+                return None
+            # Read the exact message length into one preallocated buffer
+            data = bytearray(msg_length)
+            if SocketUtils._recv_into(sock, memoryview(data)) < msg_length:
+                logger.error("Connection closed while receiving message body")
+                return None
 
-            message = json.loads(data.decode('utf-8'))
+            message = json.loads(data)
             return message
 
         except socket.timeout:
             logger.warning("Socket receive timeout")
             return None
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, UnicodeDecodeError):
             logger.error("Invalid JSON received")
             return None
         except Exception as e:
             logger.error(f"Failed to receive message: {e}")
             return None
     
+    @staticmethod
+    def _recv_into(sock: socket.socket, view: memoryview) -> int:
+        """
+        Fill a buffer from a socket with recv_into.
+        
+        Returns:
+            Bytes received; less than len(view) if the peer closed first
+        """
+        received = 0
+        while received < len(view):
+            n = sock.recv_into(view[received:])
+            if n == 0:
+                break
+            received += n
+        return received
+    
     @staticmethod
     def send_chunk_data(sock: socket.socket, chunk_data: bytes) -> bool:
         """
@@ -110,39 +143,122 @@ class SocketUtils:
             return False
     
     @staticmethod
-    def receive_chunk_data(sock: socket.socket, size: int, timeout: Optional[float] = None) -> Optional[bytes]:
+    def send_file_range(sock: socket.socket, f, offset: int, count: int,
+                        use_sendfile: bool = True) -> bool:
+        """
+        Stream a byte range of an open file to a socket.
+        
+        Uses os.sendfile so the data goes from the page cache to the socket
+        without a userspace copy. Falls back to buffered positional reads
+        plus sendall where sendfile is unavailable or unsupported.
+        The file position is never modified, so handles may be shared.
+        
+        Args:
+            sock: Socket to send on
+            f: Open binary file object
+            offset: Absolute file offset to start from
+            count: Number of bytes to send
+            use_sendfile: Set False to force the buffered path
+            
+        Returns:
+            True if all bytes were sent, False otherwise
+        """
+        try:
+            sent = 0
+            if use_sendfile and hasattr(os, "sendfile"):
+                sent = SocketUtils._sendfile_loop(sock, f.fileno(), offset, count)
+            
+            # Buffered fallback (also finishes a range sendfile gave up on)
+            while sent < count:
+                block = positional_read(f, min(SEND_BLOCK_SIZE, count - sent), offset + sent)
+                if not block:
+                    logger.error("File ended before requested range was sent")
+                    return False
+                sock.sendall(block)
+                sent += len(block)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send file range: {e}")
+            return False
+    
+    @staticmethod
+    def _sendfile_loop(sock: socket.socket, fd: int, offset: int, count: int) -> int:
+        """
+        Send with os.sendfile until done, waiting on EAGAIN for timeout sockets.
+        
+        Stops early if sendfile turns out to be unsupported for this fd pair,
+        so the caller can send the rest without repeating bytes already sent.
+        
+        Returns:
+            Number of bytes sent
+        """
+        timeout = sock.gettimeout()
+        sent = 0
+        while sent < count:
+            try:
+                n = os.sendfile(sock.fileno(), fd, offset + sent, count - sent)
+            except BlockingIOError:
+                _, writable, _ = select.select([], [sock], [], timeout)
+                if not writable:
+                    raise socket.timeout("sendfile timed out")
+                continue
+            except OSError as e:
+                if e.errno not in _SENDFILE_UNSUPPORTED:
+                    raise
+                logger.debug(f"sendfile unsupported ({e}), using buffered send after {sent} bytes")
+                break
+            if n == 0:
+                # EOF on the source file
+                break
+            sent += n
+        return sent
+    
+    @staticmethod
+    def receive_chunk_data(sock: socket.socket, size: int, timeout: Optional[float] = None,
+                           pool=None, into: Optional[memoryview] = None):
         """
         Receive binary chunk data from a socket.
         
+        Reads straight into one preallocated buffer with recv_into: the
+        caller's `into` view when it has exactly size bytes (e.g. a slice of
+        a memory-mapped file), else a buffer from pool (a BufferPool), else
+        a new bytearray. Sizes above MAX_CHUNK_SIZE are refused before
+        anything is allocated; callers that know the piece size check it first.
+        
         Args:
             sock: Socket to receive from
             size: Expected size of chunk data
             timeout: Optional timeout in seconds
+            pool: Optional BufferPool; the caller releases the result to it
+            into: Optional destination view
             
         Returns:
-            Bytes if successful, None otherwise
+            The buffer holding size bytes if successful, None otherwise
         """
+        if not 0 <= size <= MAX_CHUNK_SIZE:
+            logger.error(f"Refusing chunk data of {size} bytes")
+            return None
+        if into is not None and len(into) == size:
+            buffer = into
+        else:
+            into = None
+            buffer = pool.acquire(size) if pool is not None else bytearray(size)
         try:
             if timeout is not None:
                 sock.settimeout(timeout)
             
-            data = b''
-            while len(data) < size:
-                remaining = size - len(data)
-                chunk = sock.recv(min(BUFFER_SIZE, remaining))
-                if not chunk:
-                    logger.error("Connection closed while receiving chunk data")
-                    return None
-                data += chunk
-            
-            return data
+            if SocketUtils._recv_into(sock, memoryview(buffer)) == size:
+                return buffer
+            logger.error("Connection closed while receiving chunk data")
             
         except socket.timeout:
             logger.warning("Socket receive timeout")
-            return None
         except Exception as e:
             logger.error(f"Failed to receive chunk data: {e}")
-            return None
+        
+        if pool is not None and into is None:
+            pool.release(buffer)
+        return None
     
     @staticmethod
     def connect_to_server(host: str, port: int, timeout: float = 5.0) -> Optional[socket.socket]:
@@ -175,6 +291,59 @@ class FileUtils:
         """Validate chunk size is within acceptable range."""
         return DEFAULT_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE
     
+    @staticmethod
+    def validate_piece_offsets(piece_offsets: List[int], total_size: int) -> bool:
+        """
+        Validate a content-defined piece layout.
+        
+        Offsets must start at 0 and increase, with every piece (including
+        the last, which runs to total_size) at most MAX_CHUNK_SIZE bytes.
+        """
+        if not piece_offsets or piece_offsets[0] != 0:
+            return False
+        ends = piece_offsets[1:] + [total_size]
+        return all(0 < end - start <= MAX_CHUNK_SIZE for start, end in zip(piece_offsets, ends))
+    
+    @staticmethod
+    def validate_file_list(files: List[Dict], total_size: int) -> bool:
+        """
+        Validate the file list of a directory share.
+        
+        Paths must be relative, "/"-separated and free of "." and ".."
+        components so they can't escape the download directory; no path may
+        repeat, and the lengths must add up to total_size.
+        """
+        if not files:
+            return False
+        seen = set()
+        size = 0
+        for entry in files:
+            path = entry.get("path") if isinstance(entry, dict) else None
+            length = entry.get("length") if isinstance(entry, dict) else None
+            if not isinstance(path, str) or not isinstance(length, int) or length < 0:
+                return False
+            parts = path.split("/")
+            if path in seen or any(part in ("", ".", "..") or "\\" in part or ":" in part for part in parts):
+                return False
+            seen.add(path)
+            size += length
+        return size == total_size
+    
+    @staticmethod
+    def choose_piece_length(file_size: int) -> int:
+        """
+        Choose a piece length for a file from its size.
+        
+        Picks the smallest power of two between DEFAULT_CHUNK_SIZE and
+        MAX_CHUNK_SIZE that keeps the file at or under TARGET_MAX_PIECES
+        pieces, so multi-GB files don't turn into tens of thousands of pieces.
+        """
+        piece_length = DEFAULT_CHUNK_SIZE
+        while piece_length < MAX_CHUNK_SIZE and \
+                FileUtils.calculate_num_chunks(file_size, piece_length) > TARGET_MAX_PIECES:
+            piece_length *= 2
+        return piece_length
+    
     @staticmethod
     def calculate_num_chunks(file_size: int, chunk_size: int) -> int:
         """Calculate the number of chunks needed for a file."""
@@ -196,9 +365,26 @@ class MessageBuilder:
     
     @staticmethod
     def register_message(file_id: str, filename: str, num_chunks: int, 
-                        peer_id: str, host: str, port: int) -> Dict:
-        """Build a REGISTER message."""
-        return {
+                        peer_id: str, host: str, port: int,
+                        total_size: int = None, piece_length: int = None,
+                        piece_hashes: List[str] = None, merkle_root: str = None,
+                        piece_offsets: List[int] = None, supersedes: str = None,
+                        files: List[Dict] = None, update_key: str = None,
+                        update_proof: str = None) -> Dict:
+        """
+        Build a REGISTER message.
+        
+        The optional piece_length and piece_hashes publish the file's piece
+        manifest so downloaders can verify each piece as it arrives. For
+        Merkle file IDs, merkle_root alone is enough: pieces are then
+        verified with per-piece proofs from the serving peer. Files with
+        content-defined pieces also publish piece_offsets. supersedes names
+        the file ID this file is a new version of; files lists the paths and
+        lengths of a directory share. update_key is the SHA-256 of the secret
+        that authorises updates of this file, and update_proof is the secret
+        of the superseded version.
+        """
+        msg = {
             "type": "REGISTER",
             "file_id": file_id,
             "filename": filename,
@@ -207,6 +393,27 @@ class MessageBuilder:
             "host": host,
             "port": port
         }
+        
+        if total_size is not None:
+            msg["total_size"] = total_size
+        if piece_length is not None:
+            msg["piece_length"] = piece_length
+        if piece_hashes is not None:
+            msg["piece_hashes"] = piece_hashes
+        if merkle_root is not None:
+            msg["merkle_root"] = merkle_root
+        if piece_offsets is not None:
+            msg["piece_offsets"] = piece_offsets
+        if supersedes is not None:
+            msg["supersedes"] = supersedes
+        if files is not None:
+            msg["files"] = files
+        if update_key is not None:
+            msg["update_key"] = update_key
+        if update_proof is not None:
+            msg["update_proof"] = update_proof
+        
+        return msg
     
     @staticmethod
     def query_message(file_id: str) -> Dict:
@@ -216,6 +423,14 @@ class MessageBuilder:
             "file_id": file_id
         }
     
+    @staticmethod
+    def manifest_query_message(file_id: str) -> Dict:
+        """Build a GET_MANIFEST message."""
+        return {
+            "type": "GET_MANIFEST",
+            "file_id": file_id
+        }
+    
     @staticmethod
     def search_by_name_message(filename: str) -> Dict:
         """Build a SEARCH_BY_NAME message."""
@@ -227,7 +442,8 @@ class MessageBuilder:
     @staticmethod
     def announce_message(event: str, info_hash: str, peer_id: str, 
                         host: str = None, port: int = None,
-                        filename: str = None, num_chunks: int = None) -> Dict:
+                        filename: str = None, num_chunks: int = None,
+                        total_size: int = None, piece_length: int = None) -> Dict:
         """
         Build an ANNOUNCE message (BitTorrent-style).
         
@@ -239,6 +455,8 @@ class MessageBuilder:
             port: Peer port (required for started)
             filename: Filename (optional for started)
             num_chunks: Number of chunks (optional for started)
+            total_size: File size in bytes (optional for started)
+            piece_length: Piece size in bytes (optional for started)
         """
         msg = {
             "type": "ANNOUNCE",
@@ -255,6 +473,10 @@ class MessageBuilder:
             msg["filename"] = filename
         if num_chunks is not None:
             msg["num_chunks"] = num_chunks
+        if total_size is not None:
+            msg["total_size"] = total_size
+        if piece_length is not None:
+            msg["piece_length"] = piece_length
         
         return msg
     
@@ -268,22 +490,62 @@ class MessageBuilder:
         }
     
     @staticmethod
-    def chunk_request_message(file_id: str, chunk_index: int) -> Dict:
-        """Build a CHUNK_REQUEST message."""
-        return {
+    def chunk_request_message(file_id: str, chunk_index: int,
+                              want_proof: bool = False, keep_alive: bool = False,
+                              capabilities: List[str] = None) -> Dict:
+        """
+        Build a CHUNK_REQUEST message.
+        
+        Args:
+            file_id: File identifier
+            chunk_index: Piece index
+            want_proof: Ask for a Merkle proof with the piece
+            keep_alive: Ask the peer to keep the connection open for more requests
+            capabilities: Session features offered to the peer (e.g. "binary")
+        """
+        msg = {
             "type": "CHUNK_REQUEST",
             "file_id": file_id,
             "chunk_index": chunk_index
         }
+        
+        if want_proof:
+            msg["proof"] = True
+        if keep_alive:
+            msg["keep_alive"] = True
+        if capabilities:
+            msg["capabilities"] = capabilities
+        
+        return msg
     
     @staticmethod
     def chunk_response_message(file_id: str, chunk_index: int, 
-                              chunk_size: int, status: str = "success") -> Dict:
-        """Build a CHUNK_RESPONSE message."""
-        return {
+                              chunk_size: int, status: str = "success",
+                              proof: List[str] = None, keep_alive: bool = False,
+                              capabilities: List[str] = None, compression: str = None,
+                              raw_size: int = None) -> Dict:
+        """
+        Build a CHUNK_RESPONSE message.
+        
+        capabilities lists the session features accepted; a compressed
+        payload names its compression and uncompressed raw_size.
+        """
+        msg = {
             "type": "CHUNK_RESPONSE",
             "file_id": file_id,
             "chunk_index": chunk_index,
             "chunk_size": chunk_size,
             "status": status
         }
+        
+        if proof is not None:
+            msg["proof"] = proof
+        if keep_alive:
+            msg["keep_alive"] = True
+        if capabilities:
+            msg["capabilities"] = capabilities
+        if compression is not None:
+            msg["compression"] = compression
+            msg["raw_size"] = raw_size
+        
+        return msg
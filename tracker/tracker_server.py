@@ -7,6 +7,7 @@ Handles peer registration and responds to queries for available peers.
 
 import os
 import sys
+import hashlib
 import socket
 import json
 import threading
@@ -19,7 +20,7 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-from shared.utils import SocketUtils
+from shared.utils import SocketUtils, FileUtils
 
 # Configuration
 # Change to '0.0.0.0' to accept connections from other laptops on the network
@@ -45,6 +46,15 @@ class TrackerServer:
         "file_id": {
             "filename": str,
             "num_chunks": int,
+            "total_size": int | None,
+            "piece_length": int | None,
+            "piece_hashes": [str] | None,  # served by GET_MANIFEST only
+            "piece_offsets": [int] | None,  # content-defined pieces only, served by GET_MANIFEST
+            "files": [{"path": str, "length": int}] | None,  # directory shares only, served by GET_MANIFEST
+            "merkle_root": str | None,  # for Merkle file IDs
+            "update_key": str | None,  # SHA-256 of the publisher's update secret
+            "supersedes": str | None,  # older version this file replaces
+            "superseded_by": str | None,  # version replacing this file, set once
             "peers": [
                 {"host": str, "port": int, "peer_id": str},
                 ...
@@ -115,7 +125,10 @@ class TrackerServer:
                 if not message:
                     break
 
-                logger.info(f"Received from {client_address}: {message}")
+                # Piece manifests can be large; keep them out of the log
+                logged = {k: v for k, v in message.items()
+                          if k not in ("piece_hashes", "piece_offsets", "files")}
+                logger.info(f"Received from {client_address}: {logged}")
                 response = self.process_message(message)
                 SocketUtils.send_message(client_socket, response)
                 
@@ -142,6 +155,7 @@ class TrackerServer:
         3. UNREGISTER - Unregister a file from the tracker
         4. SEARCH_BY_NAME - Search files by filename
         5. ANNOUNCE - BitTorrent-style announce (started/stopped/completed)
+        6. GET_MANIFEST - Fetch the per-piece digests of a file
         """
         msg_type = message.get("type")
         
@@ -155,6 +169,8 @@ class TrackerServer:
             return self.handle_search_by_name(message)
         elif msg_type == "ANNOUNCE":
             return self.handle_announce(message)
+        elif msg_type == "GET_MANIFEST":
+            return self.handle_get_manifest(message)
         else:
             return {"status": "error", "message": f"Unknown message type: {msg_type}"}
             
@@ -170,7 +186,16 @@ class TrackerServer:
             "num_chunks": int,
             "peer_id": str,
             "host": str,
-            "port": int
+            "port": int,
+            "total_size": int,  # optional
+            "piece_length": int,  # optional
+            "piece_hashes": [str],  # optional piece manifest
+            "piece_offsets": [int],  # optional, for content-defined pieces
+            "files": [{"path": str, "length": int}],  # optional, for directory shares
+            "merkle_root": str,  # optional, for Merkle file IDs
+            "update_key": str,  # optional, SHA-256 of the publisher's update secret
+            "supersedes": str,  # optional, file ID of the version this replaces
+            "update_proof": str  # with supersedes: update secret of that version
         }
         """
         file_id = message.get("file_id")
@@ -188,9 +213,29 @@ class TrackerServer:
                 self.files[file_id] = {
                     "filename": filename,
                     "num_chunks": num_chunks,
+                    "total_size": None,
+                    "piece_length": None,
+                    "piece_hashes": None,
+                    "piece_offsets": None,
+                    "files": None,
+                    "merkle_root": None,
+                    "update_key": None,
+                    "supersedes": None,
+                    "superseded_by": None,
                     "peers": []
                 }
             
+            if message.get("total_size") is not None:
+                self.files[file_id]["total_size"] = message.get("total_size")
+            if message.get("piece_length") and not self.files[file_id]["piece_length"]:
+                self.files[file_id]["piece_length"] = message.get("piece_length")
+            # Like the manifest, the first publisher's update key wins
+            if message.get("update_key") and not self.files[file_id].get("update_key"):
+                self.files[file_id]["update_key"] = message.get("update_key")
+            self._store_manifest(file_id, message)
+            if message.get("supersedes"):
+                self._link_update(message["supersedes"], file_id, message.get("update_proof"))
+            
             # Check if peer already registered
             peer_info = {"host": host, "port": port, "peer_id": peer_id}
             peers = self.files[file_id]["peers"]
@@ -236,8 +281,125 @@ class TrackerServer:
                 "file_id": file_id,
                 "filename": file_info["filename"],
                 "num_chunks": file_info["num_chunks"],
+                "total_size": file_info.get("total_size"),
+                "piece_length": file_info.get("piece_length"),
+                "has_manifest": bool(file_info.get("piece_hashes")),
+                "chunking": "cdc" if file_info.get("piece_offsets") else "fixed",
+                "num_files": len(file_info["files"]) if file_info.get("files") else None,
+                "merkle_root": file_info.get("merkle_root"),
+                "supersedes": file_info.get("supersedes"),
+                "superseded_by": file_info.get("superseded_by"),
                 "peers": file_info["peers"]
             }
+    
+    def _link_update(self, old_id: str, new_id: str, proof: str):
+        """
+        Record that new_id is a new version of old_id (lock held).
+        
+        Peer IDs are self-reported, so only the holder of the old version's
+        update secret (whose SHA-256 was registered as its update_key) may
+        publish an update for it. The link is set once and never replaced;
+        a later version should supersede new_id instead.
+        """
+        old_info = self.files.get(old_id)
+        if old_info is None or old_id == new_id:
+            logger.warning(f"Ignoring update of unknown file {old_id} by {new_id}")
+            return
+        if old_info.get("superseded_by") == new_id:
+            # Already linked, e.g. a peer re-sharing the update it downloaded
+            self.files[new_id]["supersedes"] = old_id
+            return
+        
+        update_key = old_info.get("update_key")
+        if not update_key or not isinstance(proof, str) or \
+                hashlib.sha256(proof.encode('utf-8')).hexdigest() != update_key:
+            logger.warning(f"Invalid update proof for {old_id}; ignoring update to {new_id}")
+            return
+        if old_info.get("superseded_by"):
+            logger.warning(f"File {old_id} is already superseded by {old_info['superseded_by']}; "
+                           f"ignoring update to {new_id}")
+            return
+        
+        self.files[new_id]["supersedes"] = old_id
+        old_info["superseded_by"] = new_id
+        logger.info(f"File {old_id} superseded by {new_id}")
+    
+    def _store_manifest(self, file_id: str, message: Dict):
+        """
+        Store the piece manifest carried by a REGISTER message.
+        
+        The first manifest published for a file ID wins; later registrations
+        with different digests are ignored so one peer can't swap them out.
+        """
+        piece_hashes = message.get("piece_hashes")
+        piece_length = message.get("piece_length")
+        merkle_root = message.get("merkle_root")
+        file_info = self.files[file_id]
+        
+        # A Merkle file ID is a prefix of its root, so the root is self-certifying
+        if merkle_root and file_info.get("merkle_root") is None:
+            if merkle_root[:16] == file_id and piece_length:
+                file_info["merkle_root"] = merkle_root
+                file_info["piece_length"] = piece_length
+            else:
+                logger.warning(f"Merkle root does not match file ID {file_id}; ignoring")
+        
+        if not piece_hashes or not piece_length:
+            return
+        
+        if file_info.get("piece_hashes") is None:
+            if len(piece_hashes) != file_info["num_chunks"]:
+                logger.warning(f"Manifest for {file_id} has {len(piece_hashes)} pieces, "
+                               f"expected {file_info['num_chunks']}; ignoring")
+                return
+            piece_offsets = message.get("piece_offsets")
+            if piece_offsets is not None and len(piece_offsets) != len(piece_hashes):
+                logger.warning(f"Manifest for {file_id} has {len(piece_offsets)} piece offsets, "
+                               f"expected {len(piece_hashes)}; ignoring")
+                return
+            files = message.get("files")
+            if files is not None and not FileUtils.validate_file_list(files, file_info.get("total_size")):
+                logger.warning(f"Manifest for {file_id} has an invalid file list; ignoring")
+                return
+            file_info["piece_length"] = piece_length
+            file_info["piece_hashes"] = piece_hashes
+            file_info["piece_offsets"] = piece_offsets
+            file_info["files"] = files
+            logger.info(f"Stored manifest for {file_id} ({len(piece_hashes)} pieces)")
+        elif file_info["piece_hashes"] != piece_hashes:
+            logger.warning(f"Conflicting manifest for {file_id} from {message.get('peer_id')}; keeping original")
+    
+    def handle_get_manifest(self, message: Dict) -> Dict:
+        """
+        Handle a request for a file's piece manifest.
+        
+        Expected message format:
+        {
+            "type": "GET_MANIFEST",
+            "file_id": str
+        }
+        """
+        file_id = message.get("file_id")
+        
+        if not file_id:
+            return {"status": "error", "message": "Missing file_id"}
+        
+        with self.lock:
+            file_info = self.files.get(file_id)
+            if not file_info or not file_info.get("piece_hashes"):
+                return {"status": "error", "message": f"No manifest for file {file_id}"}
+            
+            return {
+                "status": "success",
+                "file_id": file_id,
+                "total_size": file_info.get("total_size"),
+                "piece_length": file_info["piece_length"],
+                "num_pieces": len(file_info["piece_hashes"]),
+                "piece_hashes": file_info["piece_hashes"],
+                "piece_offsets": file_info.get("piece_offsets"),
+                "files": file_info.get("files"),
+                "merkle_root": file_info.get("merkle_root")
+            }
             
     def handle_unregister(self, message: Dict) -> Dict:
         """
@@ -300,6 +462,8 @@ class TrackerServer:
                         "file_id": file_id,
                         "filename": file_info["filename"],
                         "num_chunks": file_info["num_chunks"],
+                        "total_size": file_info.get("total_size"),
+                        "piece_length": file_info.get("piece_length"),
                         "peers": file_info["peers"]
                     })
             
@@ -331,7 +495,9 @@ class TrackerServer:
             "host": str,
             "port": int,
             "filename": str,  # for started events
-            "num_chunks": int  # for started events
+            "num_chunks": int,  # for started events
+            "total_size": int,  # optional, for started events
+            "piece_length": int  # optional, for started events
         }
         
         Events:
@@ -361,17 +527,33 @@ class TrackerServer:
                     self.files[info_hash] = {
                         "filename": filename,
                         "num_chunks": num_chunks,
+                        "total_size": None,
+                        "piece_length": None,
+                        "piece_hashes": None,
+                        "piece_offsets": None,
+                        "files": None,
+                        "merkle_root": None,
+                        "update_key": None,
+                        "supersedes": None,
+                        "superseded_by": None,
                         "peers": []
                     }
                 
+                if message.get("total_size") is not None:
+                    self.files[info_hash]["total_size"] = message.get("total_size")
+                if message.get("piece_length") and not self.files[info_hash]["piece_length"]:
+                    self.files[info_hash]["piece_length"] = message.get("piece_length")
+                
                 peer_info = {"host": host, "port": port, "peer_id": peer_id}
                 peers = self.files[info_hash]["peers"]
                 
                 if not any(p["peer_id"] == peer_id for p in peers):
                     peers.append(peer_info)
                     logger.info(f"Announce [started]: {peer_id} for {info_hash[:8]}... ({filename})")
+                superseded_by = self.files[info_hash].get("superseded_by")
             
-            return {"status": "success", "message": "Announced started"}
+            # Tell seeders of an old version that a newer one exists
+            return {"status": "success", "message": "Announced started", "superseded_by": superseded_by}
         
         elif event == "stopped":
             # Unregister peer from tracker